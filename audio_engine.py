@@ -0,0 +1,1152 @@
+import numpy as np
+import math
+import wave
+import subprocess
+import struct
+import tempfile
+import threading
+import time
+import os
+from types import SimpleNamespace
+
+from instrumentation import STAGE_ENCODE, STAGE_QUANTIZE, STAGE_WRITE
+# Light-weight playback types live in playback.py and are re-exported here
+from playback import SYNTH_EXACT, SYNTH_TABLE, ParameterStore, StreamSettings
+from kernels import KERNEL_AUTO, make_kernel, sine_into
+
+# Frames synthesized per export block (~1.5 s at 44.1 kHz, ~1.5 MB of float64 scratch)
+EXPORT_BLOCK_FRAMES = 65536
+
+# Longest loop period (in frames) worth synthesizing once and tiling (~24 s at 44.1 kHz)
+MAX_LOOP_FRAMES = 2 ** 20
+
+# Parameter smoothing: glide time in seconds and the two smoothing curves
+GLIDE_SECONDS = 0.05
+GLIDE_LINEAR = 'linear'            # constant rate, reaches the target in GLIDE_SECONDS
+GLIDE_EXPONENTIAL = 'exponential'  # one-pole approach with GLIDE_SECONDS time constant
+
+# WAV exports: full-scale value and numpy dtype per sample width in bytes
+# (24-bit samples are written as raw little-endian bytes)
+PCM_FULL_SCALE = {2: 32767, 3: 8388607, 4: 2147483647}
+PCM_DTYPES = {2: np.dtype('<i2'), 4: np.dtype('<i4')}
+FLOAT_DTYPE = np.dtype('<f4')  # 32-bit IEEE float WAV samples
+
+# Dither added before rounding to integer PCM, in LSBs of the output format
+DITHER_NONE = 'none'      # plain rounding
+DITHER_TPDF = 'tpdf'      # triangular, +-1 LSB, white spectrum
+DITHER_SHAPED = 'shaped'  # high-passed TPDF: same peak, noise moved towards Nyquist
+DITHERS = (DITHER_NONE, DITHER_TPDF, DITHER_SHAPED)
+DITHER_SEED = 0x5EED  # dither noise is seeded per block, so renders are reproducible
+
+# Largest size a RIFF chunk can record; bigger WAV files are written as RF64
+RIFF_MAX_SIZE = 0xFFFFFFFF
+
+# Linear interpolation error is bounded by pi**2 / (2 * size**2):
+#   1024 -> 4.7e-6, 2048 -> 1.2e-6, 4096 -> 2.9e-7, 8192 -> 7.4e-8
+# 4096 entries keeps the error ~50x below half an LSB of 16-bit PCM.
+SINE_TABLE_SIZE = 4096
+
+_sine_tables = {}
+
+# Noise beds loop a precomputed table (2**20 frames is ~22 s at 48 kHz)
+NOISE_WHITE = 'white'
+NOISE_PINK = 'pink'
+NOISE_BROWN = 'brown'
+NOISE_COLORS = (NOISE_WHITE, NOISE_PINK, NOISE_BROWN)
+NOISE_TABLE_FRAMES = 2 ** 20
+
+_noise_tables = {}
+
+
+def sine_table(size=SINE_TABLE_SIZE):
+    """Return one sine cycle sampled at `size` points plus a wrap-around guard"""
+    table = _sine_tables.get(size)
+    if table is None:
+        table = np.sin(2 * np.pi * np.arange(size + 1) / size)
+        table[size] = table[0]
+        _sine_tables[size] = table
+    return table
+
+
+def measure_table_error(table_size=SINE_TABLE_SIZE, samples=1000000, seed=0):
+    """Measure the worst-case table interpolation error against np.sin"""
+    phase = np.random.default_rng(seed).random(samples)
+    table = sine_table(table_size)
+    pos = phase * table_size
+    index = pos.astype(np.intp)
+    frac = pos - index
+    approx = table[index] + frac * (table[index + 1] - table[index])
+    return float(np.abs(approx - np.sin(2 * np.pi * phase)).max())
+
+
+def noise_table(color, sample_rate=44100, frames=NOISE_TABLE_FRAMES, seed=0):
+    """Seamlessly looping float32 noise with unit RMS
+
+    The spectrum is shaped directly in the frequency domain (flat, 1/f power
+    for pink, 1/f^2 for brown) with everything below 20 Hz removed, and the
+    inverse FFT of a spectrum is periodic, so the table loops without a seam.
+    """
+    key = (color, sample_rate, frames, seed)
+    table = _noise_tables.get(key)
+    if table is None:
+        if color not in NOISE_COLORS:
+            raise ValueError(f"Unknown noise color: {color}")
+        rng = np.random.default_rng(seed)
+        bins = frames // 2 + 1
+        spectrum = rng.standard_normal(bins) + 1j * rng.standard_normal(bins)
+        freqs = np.arange(bins) * (sample_rate / frames)
+        spectrum[freqs < 20.0] = 0.0
+        freqs[0] = 1.0
+        if color == NOISE_PINK:
+            spectrum /= np.sqrt(freqs)
+        elif color == NOISE_BROWN:
+            spectrum /= freqs
+        noise = np.fft.irfft(spectrum, frames)
+        noise /= np.sqrt(np.mean(noise ** 2))
+        table = noise.astype(np.float32)
+        _noise_tables[key] = table
+    return table
+
+
+def cycles_elapsed(freq, frames, sample_rate):
+    """Fractional cycles completed by `freq` over `frames` samples, computed exactly"""
+    num, den = float(freq).as_integer_ratio()
+    period = den * sample_rate
+    return (num * frames % period) / period
+
+
+class SineOscillator:
+    """Bank of sine oscillators, one wrapped phase accumulator per channel
+
+    The oscillator owns the phase state; each block is rendered by a
+    synthesis kernel from kernels.py (`kernel`: 'auto', 'numpy' or
+    'numba'). Kernels work in scratch space sized for `max_frames`, so
+    render_into() does not allocate once the oscillator is warmed up.
+    """
+
+    def __init__(self, channels=2, sample_rate=44100, mode=SYNTH_EXACT,
+                 table_size=SINE_TABLE_SIZE, max_frames=4096, kernel=KERNEL_AUTO):
+        if mode not in (SYNTH_EXACT, SYNTH_TABLE):
+            raise ValueError(f"Unknown synthesis mode: {mode}")
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.table_size = table_size
+        self.table = sine_table(table_size)
+        self.phase = np.zeros(channels)  # in cycles, always within [0, 1)
+        self.sample_index = 0  # integer count of frames rendered since reset
+
+        # Phase is re-derived from an integer frame count since the last
+        # frequency change, so rounding never accumulates across blocks.
+        self._anchor_phase = np.zeros(channels)
+        self._anchor_freqs = None
+        self._anchor_frames = 0
+
+        self._wrap = np.zeros(channels)
+        self.kernel = make_kernel(kernel, channels, sample_rate, self.table, max_frames)
+
+    def prepare(self, dtype):
+        """Get the kernel ready to render `dtype` blocks; call before real-time use"""
+        self.kernel.prepare(dtype)
+
+    def reset(self, phase=0.0):
+        """Reset every channel to the given phase (in cycles)"""
+        self.phase[:] = phase
+        self.sample_index = 0
+        self._anchor_freqs = None
+
+    def seek(self, sample_index, freqs):
+        """Jump to `sample_index` of a constant-frequency render that started at phase 0
+
+        The phase comes from the same exact integer arithmetic render_into()
+        uses between blocks, so rendering from here matches a render that
+        ran from frame 0 sample for sample.
+        """
+        self._anchor_phase[:] = 0.0
+        self._anchor_freqs = tuple(freqs)
+        self._anchor_frames = sample_index
+        for ch, freq in enumerate(freqs):
+            self.phase[ch] = cycles_elapsed(freq, sample_index, self.sample_rate)
+        self.sample_index = sample_index
+
+    def save_state(self):
+        """Everything render_into() carries between blocks, for restore_state()"""
+        return (self.phase.copy(), self.sample_index, self._anchor_phase.copy(),
+                self._anchor_freqs, self._anchor_frames)
+
+    def restore_state(self, state):
+        """Rewind to a save_state() snapshot; later blocks match the ones rendered after it"""
+        phase, self.sample_index, anchor_phase, self._anchor_freqs, self._anchor_frames = state
+        self.phase[:] = phase
+        self._anchor_phase[:] = anchor_phase
+
+    def render(self, frames, freqs):
+        """Render `frames` samples per channel as a new (frames, channels) float64 array"""
+        out = np.empty((frames, self.channels))
+        self.render_into(out, freqs)
+        return out
+
+    def render_into(self, out, freqs, gain=1.0, start_freqs=None, start_gain=None):
+        """Render len(out) samples per channel, scaled by `gain`, into `out` in place
+
+        `out` is a (frames, channels) array of any float dtype, typically the
+        interleaved outdata buffer handed to the audio callback. Pass `freqs`
+        as a tuple so unchanged frequencies are recognised between blocks.
+
+        With `start_freqs` and/or `start_gain` the block glides linearly,
+        sample by sample, from those values to `freqs`/`gain` (reached at the
+        first sample of the next block). Phase stays continuous throughout.
+        """
+        frames = len(out)
+        glide = start_freqs is not None and tuple(start_freqs) != tuple(freqs)
+        if glide:
+            self._anchor_freqs = None  # re-anchor once the frequency settles
+        elif freqs != self._anchor_freqs:
+            self._anchor_phase[:] = self.phase
+            self._anchor_freqs = tuple(freqs)
+            self._anchor_frames = 0
+
+        self.kernel.render(out, self.phase, tuple(start_freqs) if glide else freqs, freqs,
+                           gain if start_gain is None else start_gain, gain, self.mode)
+
+        # Only the wrapped phase is carried between blocks, so the sine
+        # argument stays within [0, 2*pi) no matter how long we run.
+        if glide:
+            for ch, (f0, f1) in enumerate(zip(start_freqs, freqs)):
+                self.phase[ch] += (f0 * frames + (f1 - f0) * (frames - 1) / 2) / self.sample_rate
+        else:
+            self._anchor_frames += frames
+            for ch, freq in enumerate(freqs):
+                self.phase[ch] = self._anchor_phase[ch] + cycles_elapsed(
+                    freq, self._anchor_frames, self.sample_rate)
+        np.floor(self.phase, out=self._wrap)
+        self.phase -= self._wrap
+        self.sample_index += frames
+
+
+class Voice:
+    """One sine layer: frequency, gain per output channel and optional isochronic pulsing
+
+    With a `pulse_rate` the voice is amplitude modulated by a raised-cosine
+    envelope that dips by `pulse_depth` (0-1) once per pulse.
+    """
+
+    def __init__(self, freq, gains=(1.0, 1.0), pulse_rate=0.0, pulse_depth=1.0):
+        self.freq = float(freq)
+        self.gains = tuple(float(g) for g in gains)
+        self.pulse_rate = float(pulse_rate)
+        self.pulse_depth = float(pulse_depth)
+
+
+def binaural_voices(carrier, beat, gain=1.0):
+    """Left/right voice pair producing a `beat` Hz binaural beat on `carrier`"""
+    return [Voice(carrier, (gain, 0.0)), Voice(carrier + beat, (0.0, gain))]
+
+
+def isochronic_voice(freq, rate, gain=1.0, depth=1.0):
+    """Tone in both ears pulsing `rate` times per second"""
+    return Voice(freq, (gain, gain), pulse_rate=rate, pulse_depth=depth)
+
+
+class NoiseBed:
+    """Looping noise layer; each channel reads its own table so the ears are decorrelated"""
+
+    def __init__(self, color=NOISE_PINK, gain=0.1, seed=0):
+        if color not in NOISE_COLORS:
+            raise ValueError(f"Unknown noise color: {color}")
+        self.color = color
+        self.gain = float(gain)
+        self.seed = seed
+        self.position = 0
+
+
+class VoiceBank:
+    """Any number of sine voices and noise beds, mixed to the output channels
+
+    Every block is synthesized as one (voices, frames) array: phases come
+    from a single broadcast multiply-add, the waveform from one sine pass,
+    isochronic envelopes from one cosine pass over the pulsed rows, and the
+    per-voice channel gains are applied and summed by one matrix multiply.
+    There is no Python loop over voices, and render_into() does not
+    allocate sample buffers once the scratch space is sized.
+    """
+
+    def __init__(self, voices=(), noise=(), sample_rate=44100, channels=2,
+                 mode=SYNTH_EXACT, max_frames=4096):
+        if mode not in (SYNTH_EXACT, SYNTH_TABLE):
+            raise ValueError(f"Unknown synthesis mode: {mode}")
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.mode = mode
+        self.table = sine_table()
+        self.noise = list(noise)
+        self.max_frames = 0
+        self._reserve_frames = max_frames  # scratch size set_voices() allocates up front
+        self.set_voices(voices)
+
+    def set_voices(self, voices):
+        """Replace the voice layout; every voice restarts at phase 0"""
+        # Pulsed voices go first so their envelopes are one contiguous slice
+        voices = sorted(voices, key=lambda v: v.pulse_rate == 0)
+        self.voices = voices
+        self.pulsed = sum(1 for v in voices if v.pulse_rate)
+        count = len(voices)
+
+        # Column vectors broadcast against the (1, frames) sample ramp
+        self._incr = np.array([v.freq / self.sample_rate for v in voices]).reshape(count, 1)
+        self.phase = np.zeros((count, 1))
+        pulsed = voices[:self.pulsed]
+        self._pulse_incr = np.array([v.pulse_rate / self.sample_rate for v in pulsed]).reshape(-1, 1)
+        self.pulse_phase = np.zeros((self.pulsed, 1))
+        half_depth = np.array([v.pulse_depth / 2 for v in pulsed]).reshape(-1, 1)
+        self._env_scale = -half_depth
+        self._env_offset = 1.0 - half_depth
+
+        self._mix = np.zeros((self.channels, count))
+        for index, voice in enumerate(voices):
+            gains = voice.gains[:self.channels]
+            self._mix[:len(gains), index] = gains
+        self._allocate(max(self.max_frames, self._reserve_frames))
+
+    def _allocate(self, max_frames):
+        """(Re)allocate the per-block scratch buffers"""
+        count = max(len(self.voices), 1)
+        self.max_frames = max_frames
+        self._ramp = np.arange(max_frames, dtype=np.float64).reshape(1, max_frames)
+        self._phase = np.empty(count * max_frames)
+        self._wave = np.empty(count * max_frames)
+        self._upper = np.empty(count * max_frames)
+        self._index = np.empty(count * max_frames, dtype=np.intp)
+        self._env = np.empty(max(self.pulsed, 1) * max_frames)
+        self._mixed = np.empty(self.channels * max_frames)
+        self._noise_work = np.empty(max_frames)
+        self._wrap = np.empty((count, 1))
+
+    def render_into(self, out, gain=1.0):
+        """Render len(out) frames of the mix, scaled by `gain`, into `out` in place"""
+        frames = len(out)
+        if frames > self.max_frames:
+            self._allocate(frames)
+        count = len(self.voices)
+        ramp = self._ramp[:, :frames]
+        mixed = self._mixed[:self.channels * frames].reshape(self.channels, frames)
+
+        if count:
+            shape = (count, frames)
+            phase = self._phase[:count * frames].reshape(shape)
+            wave = self._wave[:count * frames].reshape(shape)
+            np.multiply(self._incr, ramp, out=phase)
+            np.add(phase, self.phase, out=phase)
+            np.floor(phase, out=wave)
+            np.subtract(phase, wave, out=phase)
+            sine_into(phase, wave, self.mode, self.table, self._upper, self._index)
+
+            if self.pulsed:
+                env = self._env[:self.pulsed * frames].reshape(self.pulsed, frames)
+                np.multiply(self._pulse_incr, ramp, out=env)
+                np.add(env, self.pulse_phase, out=env)
+                np.multiply(env, 2 * np.pi, out=env)
+                np.cos(env, out=env)
+                np.multiply(env, self._env_scale, out=env)
+                np.add(env, self._env_offset, out=env)
+                np.multiply(wave[:self.pulsed], env, out=wave[:self.pulsed])
+
+            np.matmul(self._mix, wave, out=mixed)
+
+            # Carry the wrapped phases into the next block
+            self.phase += self._incr * frames
+            np.floor(self.phase, out=self._wrap[:count])
+            self.phase -= self._wrap[:count]
+            if self.pulsed:
+                self.pulse_phase += self._pulse_incr * frames
+                self.pulse_phase -= np.floor(self.pulse_phase)
+        else:
+            mixed.fill(0.0)
+
+        for bed in self.noise:
+            self._add_noise(bed, mixed, frames)
+
+        if out.dtype.kind == 'i':
+            np.multiply(mixed, gain * np.iinfo(out.dtype).max, out=mixed)
+            np.rint(mixed, out=mixed)
+            np.copyto(out, mixed.T, casting='unsafe')
+        else:
+            np.multiply(mixed, gain, out=mixed)
+            np.copyto(out, mixed.T, casting='same_kind')
+
+    def _add_noise(self, bed, mixed, frames):
+        """Add the next `frames` of a noise bed to every channel of `mixed`"""
+        work = self._noise_work
+        for ch in range(self.channels):
+            table = noise_table(bed.color, self.sample_rate, seed=bed.seed + ch)
+            done = 0
+            position = bed.position
+            while done < frames:
+                count = min(frames - done, len(table) - position)
+                np.multiply(table[position:position + count], bed.gain, out=work[:count])
+                np.add(mixed[ch, done:done + count], work[:count], out=mixed[ch, done:done + count])
+                done += count
+                position = (position + count) % len(table)
+        bed.position = (bed.position + frames) % NOISE_TABLE_FRAMES
+
+
+def iter_voice_blocks(bank, duration_seconds, block_frames=EXPORT_BLOCK_FRAMES):
+    """Yield float32 stereo blocks of a VoiceBank mix, clipped to [-1, 1]"""
+    total_frames = int(bank.sample_rate * duration_seconds)
+    for start in range(0, total_frames, block_frames):
+        block = np.empty((min(block_frames, total_frames - start), bank.channels),
+                         dtype=np.float32)
+        bank.render_into(block)
+        np.clip(block, -1.0, 1.0, out=block)  # layers can sum past full scale
+        yield block
+
+
+class NullOutputStream:
+    """Stand-in for sd.OutputStream that pulls blocks from the callback and discards them
+
+    Takes the same arguments (including StreamSettings.stream_kwargs()), so
+    playback code can run headless: benchmarks, CI and machines without an
+    audio device. The callback runs on its own thread, paced like a sound
+    card when `realtime` is set and as fast as possible otherwise. A block
+    that is not rendered by its deadline is reported as an output underflow
+    in the next callback's status. `callback_times` keeps the wall time of
+    every callback in seconds.
+    """
+
+    def __init__(self, callback=None, samplerate=44100, blocksize=2048, channels=2,
+                 dtype='float32', latency='high', device=None, realtime=True,
+                 max_blocks=None):
+        self.callback = callback
+        self.samplerate = samplerate
+        self.blocksize = blocksize or 512  # 'auto' block size: pick a typical one
+        self.channels = channels
+        self.dtype = dtype
+        self.latency = 2 * self.blocksize / samplerate
+        self.device = device
+        self.realtime = realtime
+        self.max_blocks = max_blocks
+        self.active = False
+        self.blocks = 0
+        self.callback_times = []
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start calling the callback on a background thread"""
+        if self.active:
+            return
+        self._stop.clear()
+        self.active = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop after the current callback returns"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.active = False
+
+    close = abort = stop
+
+    def wait(self, timeout=None):
+        """Block until max_blocks callbacks have run (or the stream is stopped)"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _run(self):
+        outdata = np.zeros((self.blocksize, self.channels), dtype=self.dtype)
+        period = self.blocksize / self.samplerate
+        start = time.perf_counter()
+        underflow = False
+        try:
+            while not self._stop.is_set():
+                if self.max_blocks is not None and self.blocks >= self.max_blocks:
+                    break
+                deadline = start + (self.blocks + 1) * period
+                now = time.perf_counter()
+                time_info = SimpleNamespace(currentTime=now - start,
+                                            outputBufferDacTime=now - start + self.latency)
+                status = SimpleNamespace(output_underflow=underflow)
+                self.callback(outdata, self.blocksize, time_info, status)
+                finished = time.perf_counter()
+                self.callback_times.append(finished - now)
+                self.blocks += 1
+                underflow = self.realtime and finished > deadline
+                if self.realtime and finished < deadline:
+                    time.sleep(deadline - finished)
+        except Exception as e:  # e.g. sd.CallbackStop from the callback
+            self.error = e
+        finally:
+            self.active = False
+
+
+class FileOutputStream(NullOutputStream):
+    """NullOutputStream that also writes every block it pulls to a 16-bit WAV file
+
+    A stand-in for a multichannel interface: the file gets exactly what
+    the device would have played, one WAV channel per output channel.
+    """
+
+    def __init__(self, filename, callback=None, samplerate=44100, blocksize=2048, channels=2,
+                 dtype='float32', **kwargs):
+        super().__init__(self._write_through, samplerate, blocksize, channels, dtype, **kwargs)
+        self.filename = filename
+        self.inner_callback = callback
+        self.frames_written = 0
+        self._quantizer = Quantizer(channels=channels, max_frames=self.blocksize)
+        self._wav = None
+
+    def start(self):
+        """Open the file, then start pulling blocks"""
+        if self._wav is None:
+            self._wav = wave.open(self.filename, 'wb')
+            self._wav.setnchannels(self.channels)
+            self._wav.setsampwidth(2)
+            self._wav.setframerate(self.samplerate)
+        super().start()
+
+    def stop(self):
+        """Stop pulling blocks and finish the file"""
+        super().stop()
+        if self._wav is not None:
+            self._wav.close()
+            self._wav = None
+
+    close = abort = stop
+
+    def _write_through(self, outdata, frames, time_info, status):
+        self.inner_callback(outdata, frames, time_info, status)
+        self._wav.writeframes(self._quantizer.pcm(outdata, self.frames_written).tobytes())
+        self.frames_written += frames
+
+
+class BlockRing:
+    """Fixed ring of preallocated audio blocks between a producer thread and the audio callback
+
+    The producer renders whole blocks ahead of time with writable() and
+    commit(); the callback copies frames out with read_into(), which never
+    renders, allocates or waits. Callback and block sizes need not match.
+    With every block the producer stores the synthesis state reached at its
+    end, so rewind() can drop queued blocks rendered with stale parameters
+    and hand back the state to re-render them from.
+
+    The slot being read is never written: the producer only fills slots
+    while fewer than `slots` blocks are unread. There is no lock: only the
+    producer moves `written` and only the callback moves `read` and
+    `offset`, so read_into() takes no lock and never waits. rewind() checks
+    afterwards that the callback did not start on a block it dropped, and
+    retries if it did.
+    """
+
+    def __init__(self, slots, frames, channels=2, dtype=np.float32):
+        if slots < 2:
+            raise ValueError("A block ring needs at least 2 slots")
+        self.slots = slots
+        self.frames = frames
+        self.blocks = np.zeros((slots, frames, channels), dtype=dtype)
+        self.states = [None] * slots
+        self.written = 0   # blocks committed by the producer
+        self.read = 0      # blocks fully copied out by the callback
+        self.offset = 0    # frames already copied out of block `read`
+        self.underruns = 0
+
+    def queued(self):
+        """Blocks committed but not yet fully played"""
+        return self.written - self.read
+
+    def space(self):
+        """True when the producer may render another block"""
+        return self.written - self.read < self.slots
+
+    def writable(self):
+        """The next block to render into (only valid while space() is true)"""
+        return self.blocks[self.written % self.slots]
+
+    def commit(self, state=None):
+        """Publish the block from writable(), with the synthesis state at its end"""
+        self.states[self.written % self.slots] = state
+        self.written += 1  # publish only after the block and state are in place
+
+    def rewind(self, keep=1):
+        """Drop queued blocks after the first `keep` unread ones
+
+        Returns the state to render the first dropped block from, or None
+        when nothing was dropped.
+        """
+        while True:
+            written = self.written
+            keep_to = self.read + keep
+            if written <= keep_to:
+                return None
+            self.written = keep_to
+            # If the callback moved on to a dropped block before it saw the new
+            # `written`, put the blocks back (nothing has overwritten them) and retry
+            if self.read < keep_to:
+                return self.states[(keep_to - 1) % self.slots]
+            self.written = written
+
+    def read_into(self, out):
+        """Copy the next len(out) frames into `out`; returns False (and zero-fills) on underrun"""
+        frames = len(out)
+        done = 0
+        while done < frames:
+            if self.written <= self.read:
+                out[done:] = 0
+                self.underruns += 1
+                return False
+            block = self.blocks[self.read % self.slots]
+            offset = self.offset
+            span = min(frames - done, self.frames - offset)
+            out[done:done + span] = block[offset:offset + span]
+            done += span
+            if offset + span == self.frames:
+                self.offset = 0
+                self.read += 1
+            else:
+                self.offset = offset + span
+        return True
+
+
+class ParameterSmoother:
+    """Glides frequencies and gain towards their targets, one block at a time
+
+    advance() returns the values at the start and end of the next block,
+    ready for SineOscillator.render_into(out, end_freqs, end_gain,
+    start_freqs, start_gain), which interpolates them per sample. With
+    GLIDE_LINEAR every change completes in `glide_seconds`; with
+    GLIDE_EXPONENTIAL the values approach the target with that time
+    constant and snap to it once they are within `tolerance`.
+    """
+
+    def __init__(self, sample_rate=44100, glide_seconds=GLIDE_SECONDS,
+                 mode=GLIDE_EXPONENTIAL, freqs=(0.0, 0.0), gain=0.0, tolerance=1e-4):
+        if mode not in (GLIDE_LINEAR, GLIDE_EXPONENTIAL):
+            raise ValueError(f"Unknown glide mode: {mode}")
+        self.sample_rate = sample_rate
+        self.glide_seconds = glide_seconds
+        self.mode = mode
+        self.tolerance = tolerance
+        self.jump(freqs, gain)
+
+    def jump(self, freqs, gain):
+        """Move straight to these values without gliding"""
+        self.values = tuple(float(f) for f in freqs) + (float(gain),)
+        self._targets = self.values
+        self._rates = (0.0,) * len(self.values)
+
+    def settled(self):
+        """True once every value has reached its target"""
+        return self.values == self._targets
+
+    def save_state(self):
+        """Current values, targets and rates, for restore_state()"""
+        return self.values, self._targets, self._rates
+
+    def restore_state(self, state):
+        """Rewind to a save_state() snapshot"""
+        self.values, self._targets, self._rates = state
+
+    def advance(self, frames, freqs, gain):
+        """Return (start_freqs, end_freqs, start_gain, end_gain) for the next `frames`"""
+        targets = tuple(float(f) for f in freqs) + (float(gain),)
+        start = self.values
+        glide_frames = self.glide_seconds * self.sample_rate
+
+        if targets == start or glide_frames <= 0:
+            end = targets
+        elif self.mode == GLIDE_LINEAR:
+            if targets != self._targets:
+                self._rates = tuple(abs(t - v) / glide_frames for t, v in zip(targets, start))
+            end = tuple(t if abs(t - v) <= rate * frames else v + math.copysign(rate * frames, t - v)
+                        for t, v, rate in zip(targets, start, self._rates))
+        else:
+            keep = math.exp(-frames / glide_frames)
+            end = tuple(t + (v - t) * keep for t, v in zip(targets, start))
+            end = tuple(t if abs(e - t) <= self.tolerance else e for t, e in zip(targets, end))
+
+        self._targets = targets
+        self.values = end
+        return start[:-1], end[:-1], start[-1], end[-1]
+
+
+def loop_period(freqs, sample_rate, max_frames=MAX_LOOP_FRAMES):
+    """Shortest frame count after which every channel is back at its starting phase
+
+    Uses the exact rational value of each float frequency, so the loop is
+    sample-exact. Returns None when the period is longer than `max_frames`
+    (e.g. 200.1 Hz, which is not exactly representable in binary).
+    """
+    period = 1
+    for freq in freqs:
+        num, den = float(freq).as_integer_ratio()
+        cycle = den * sample_rate
+        frames = cycle // math.gcd(num, cycle)
+        period = period * frames // math.gcd(period, frames)
+        if period > max_frames:
+            return None
+    return period
+
+
+def iter_binaural_blocks(left_freq, right_freq, volume, duration_seconds,
+                         sample_rate=44100, block_frames=EXPORT_BLOCK_FRAMES,
+                         mode=SYNTH_EXACT, start_frame=0, stop_frame=None, loop=True):
+    """Yield float32 stereo blocks of a binaural beat, one block at a time
+
+    `start_frame`/`stop_frame` select a segment of the full render. When
+    `start_frame` is a multiple of `block_frames` the segment is identical
+    to the matching frames of a complete render.
+
+    With `loop` set, frequency pairs that repeat after a short period are
+    synthesized for one period only and the blocks are sliced from a tiled
+    copy of it. Blocks are then read-only views into that buffer.
+    """
+    total_frames = int(sample_rate * duration_seconds)
+    if stop_frame is not None:
+        total_frames = min(total_frames, stop_frame)
+    freqs = (float(left_freq), float(right_freq))
+
+    period = loop_period(freqs, sample_rate) if loop else None
+    if period is not None and total_frames - start_frame > 2 * period:
+        yield from _iter_looped_blocks(freqs, volume, period, sample_rate, block_frames,
+                                       mode, start_frame, total_frames)
+        return
+
+    oscillator = SineOscillator(2, sample_rate, mode, max_frames=block_frames)
+    oscillator.seek(start_frame, freqs)
+
+    for start in range(start_frame, total_frames, block_frames):
+        frames = min(block_frames, total_frames - start)
+        block = np.empty((frames, 2), dtype=np.float32)
+        oscillator.render_into(block, freqs, volume)
+        yield block
+
+
+def _iter_looped_blocks(freqs, volume, period, sample_rate, block_frames, mode,
+                        start_frame, total_frames):
+    """Slice export blocks out of one synthesized loop period"""
+    # The period is rendered exactly like the opening frames of a normal export,
+    # then repeated often enough that any block at any offset is one slice.
+    repeats = -(-(period + block_frames) // period)
+    tile = np.empty((period * repeats, 2), dtype=np.float32)
+    oscillator = SineOscillator(2, sample_rate, mode, max_frames=block_frames)
+    oscillator.seek(0, freqs)
+    for start in range(0, period, block_frames):
+        oscillator.render_into(tile[start:min(start + block_frames, period)], freqs, volume)
+    tile[period:] = np.tile(tile[:period], (repeats - 1, 1))
+    tile.flags.writeable = False
+
+    for start in range(start_frame, total_frames, block_frames):
+        frames = min(block_frames, total_frames - start)
+        offset = start % period
+        yield tile[offset:offset + frames]
+
+
+def wav_header(frames, sample_rate=44100, channels=2, sampwidth=2, floating=False):
+    """WAV header for a file of `frames` frames
+
+    Up to 4 GB, integer PCM gets the canonical 44-byte header, byte-identical
+    to what `wave` writes. Larger files get an RF64 header: the 32-bit sizes
+    are set to 0xFFFFFFFF and the real ones are stored in a ds64 chunk.
+    `floating` writes 32-bit IEEE float samples (format 3, with the fact
+    chunk non-PCM formats require).
+    """
+    data_size = frames * channels * sampwidth
+    rf64 = 36 + data_size > RIFF_MAX_SIZE
+    if floating:
+        fmt_chunk = struct.pack('<4sIHHIIHHH', b'fmt ', 18, 3, channels, sample_rate,
+                                sample_rate * channels * sampwidth, channels * sampwidth,
+                                sampwidth * 8, 0)
+        fmt_chunk += struct.pack('<4sII', b'fact', 4, RIFF_MAX_SIZE if rf64 else frames)
+    else:
+        fmt_chunk = struct.pack('<4sIHHIIHH', b'fmt ', 16, 1, channels, sample_rate,
+                                sample_rate * channels * sampwidth, channels * sampwidth,
+                                sampwidth * 8)
+    if not rf64:
+        return (struct.pack('<4sI4s', b'RIFF', 4 + len(fmt_chunk) + 8 + data_size, b'WAVE') +
+                fmt_chunk + struct.pack('<4sI', b'data', data_size))
+
+    ds64_chunk = struct.pack('<4sIQQQI', b'ds64', 28, 4 + 36 + len(fmt_chunk) + 8 + data_size,
+                             data_size, frames, 0)
+    return (struct.pack('<4sI4s', b'RF64', RIFF_MAX_SIZE, b'WAVE') + ds64_chunk + fmt_chunk +
+            struct.pack('<4sI', b'data', RIFF_MAX_SIZE))
+
+
+def remove_output(filename):
+    """Delete an existing output file so the next write creates a new one
+
+    Writers never open an existing output in place: the path may be a
+    hardlink to a render cache entry (render_cli --link), and rewriting it
+    would silently change the cached audio too.
+    """
+    try:
+        os.unlink(filename)
+    except FileNotFoundError:
+        pass
+
+
+def preallocate_wav(filename, frames, sample_rate=44100, channels=2, sampwidth=2,
+                    floating=False):
+    """Create a WAV with its final header and size, ready to be filled through wav_memmap"""
+    header = wav_header(frames, sample_rate, channels, sampwidth, floating)
+    data_size = frames * channels * sampwidth
+    remove_output(filename)
+    with open(filename, 'wb') as f:
+        f.write(header)
+        f.truncate(len(header) + data_size + (data_size & 1))  # chunks are word aligned
+
+
+def wav_memmap(filename, frames, channels=2, sampwidth=2, start_frame=0, stop_frame=None,
+               floating=False):
+    """Writable view of frames [start_frame, stop_frame) of a preallocated WAV
+
+    16- and 32-bit files map to (frames, channels) integer (or float32)
+    arrays; 24-bit files map to uint8 with a trailing axis of 3
+    little-endian bytes. Disjoint views of one file can be filled from
+    different processes.
+    """
+    if stop_frame is None:
+        stop_frame = frames
+    offset = (len(wav_header(frames, channels=channels, sampwidth=sampwidth, floating=floating)) +
+              start_frame * channels * sampwidth)
+    shape = (stop_frame - start_frame, channels)
+    if floating:
+        dtype = FLOAT_DTYPE
+    elif sampwidth == 3:
+        dtype, shape = np.uint8, shape + (3,)
+    else:
+        dtype = PCM_DTYPES[sampwidth]
+    return np.memmap(filename, dtype=dtype, mode='r+', offset=offset, shape=shape)
+
+
+class Quantizer:
+    """Float blocks to WAV/PCM samples, with optional dither, without per-block allocation
+
+    Integer formats are scaled, dithered, rounded and clipped in a scratch
+    buffer that is reused from block to block (float32 for 16-bit, whose
+    mantissa holds every 16-bit value exactly, float64 otherwise), then cast
+    straight into the destination (a wav_memmap view or the quantizer's own
+    PCM buffer). Float output is a plain copy and is never dithered.
+
+    Dither noise for a block is drawn from a generator seeded with the
+    block's first frame, so a file rendered in segments gets exactly the
+    same samples as one rendered in a single pass.
+    """
+
+    def __init__(self, sampwidth=2, floating=False, dither=DITHER_NONE, channels=2,
+                 max_frames=EXPORT_BLOCK_FRAMES, seed=DITHER_SEED):
+        if floating and sampwidth != 4:
+            raise ValueError("Float samples are only supported at 32 bits")
+        if not floating and sampwidth not in PCM_FULL_SCALE:
+            raise ValueError(f"Unsupported sample width: {sampwidth} bytes")
+        if dither not in DITHERS:
+            raise ValueError(f"Unknown dither '{dither}' (expected one of {', '.join(DITHERS)})")
+        self.sampwidth = sampwidth
+        self.floating = floating
+        self.dither = DITHER_NONE if floating else dither
+        self.channels = channels
+        self.seed = seed
+        self.max_frames = 0
+        self._reserve(max_frames)
+
+    def _reserve(self, frames):
+        """Grow the scratch buffers to hold at least `frames` frames"""
+        if frames <= self.max_frames:
+            return
+        self.max_frames = frames
+        shape = (frames, self.channels)
+        if self.floating:
+            self._pcm = np.empty(shape, dtype=FLOAT_DTYPE)
+            return
+        self._pcm = np.empty(shape, dtype=PCM_DTYPES.get(self.sampwidth, np.dtype('<i4')))
+        scratch = np.float32 if self.sampwidth == 2 else np.float64
+        self._scaled = np.empty(shape, dtype=scratch)
+        if self.dither != DITHER_NONE:
+            # One extra row: shaped dither differences consecutive uniform draws
+            self._uniform = np.empty((frames + 1, self.channels), dtype=scratch)
+            self._dither = np.empty(shape, dtype=scratch)
+
+    def _quantize(self, block, start_frame):
+        """Scaled, dithered, rounded and clipped copy of `block` in the scratch buffer
+
+        The scratch buffer is float32 for 16-bit output and float64 for wider formats.
+        """
+        frames = len(block)
+        full_scale = PCM_FULL_SCALE[self.sampwidth]
+        scaled = self._scaled[:frames]
+        np.multiply(block, full_scale, out=scaled)
+        if self.dither != DITHER_NONE:
+            rng = np.random.default_rng((self.seed, start_frame))
+            uniform = self._uniform[:frames + 1]
+            dither = self._dither[:frames]
+            rng.random(out=uniform, dtype=uniform.dtype)
+            if self.dither == DITHER_TPDF:
+                rng.random(out=dither, dtype=dither.dtype)
+                np.subtract(uniform[:frames], dither, out=dither)
+            else:
+                # u[n] - u[n-1]: triangular like TPDF, with a 6 dB/octave rising spectrum
+                np.subtract(uniform[1:], uniform[:-1], out=dither)
+            scaled += dither
+        np.rint(scaled, out=scaled)
+        np.minimum(scaled, full_scale, out=scaled)
+        np.maximum(scaled, -full_scale - 1, out=scaled)
+        return scaled
+
+    def write(self, out, block, start_frame=0):
+        """Quantize `block` into `out`, laid out like a wav_memmap view
+
+        `start_frame` is the block's position in the whole render; it only
+        selects the dither noise.
+        """
+        if self.floating:
+            np.copyto(out, block, casting='same_kind')
+            return
+        self._reserve(len(block))
+        scaled = self._quantize(block, start_frame)
+        if self.sampwidth == 3:
+            pcm = self._pcm[:len(block)]
+            np.copyto(pcm, scaled, casting='unsafe')
+            out[...] = pcm.view(np.uint8).reshape(pcm.shape + (4,))[..., :3]
+        else:
+            np.copyto(out, scaled, casting='unsafe')
+
+    def pcm(self, block, start_frame=0):
+        """Quantize `block` into an internal buffer and return it (valid until the next call)
+
+        For streaming writers such as `wave` or an ffmpeg pipe. 24-bit
+        samples come back as int32 and still need packing.
+        """
+        self._reserve(len(block))
+        pcm = self._pcm[:len(block)]
+        if self.sampwidth == 3:
+            np.copyto(pcm, self._quantize(block, start_frame), casting='unsafe')
+        else:
+            self.write(pcm, block, start_frame)
+        return pcm
+
+
+def fill_pcm(view, blocks, sampwidth=2, progress=None, cancel=None, stats=None,
+             floating=False, dither=DITHER_NONE, start_frame=0):
+    """Write float32 blocks into a wav_memmap view in order; returns frames written
+
+    `start_frame` is the view's position in the whole file, so segments
+    filled separately get the same dither as a single pass. `progress`,
+    `cancel` and `stats` behave as in write_wav_blocks, except that
+    cancelling only raises ExportCancelled and leaves cleanup to the caller.
+    """
+    quantizer = Quantizer(sampwidth, floating, dither, channels=view.shape[1], max_frames=0)
+    frames_written = 0
+    for block in blocks:
+        if cancel is not None and cancel.is_set():
+            raise ExportCancelled()
+        frames = len(block)
+        if frames_written + frames > len(view):
+            raise ValueError(f"blocks overrun the {len(view)} frames reserved in the file")
+        if stats is not None:
+            start = time.perf_counter()
+        quantizer.write(view[frames_written:frames_written + frames], block,
+                        start_frame + frames_written)
+        if stats is not None:
+            stats.record(STAGE_QUANTIZE, time.perf_counter() - start, frames)
+        frames_written += frames
+        if progress is not None:
+            progress(frames_written)
+    return frames_written
+
+
+class ExportCancelled(Exception):
+    """Raised inside an export when its cancel event is set"""
+
+
+def _remove_quietly(*paths):
+    """Delete partially written files, ignoring ones that do not exist"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def write_wav_blocks(filename, blocks, sample_rate=44100, channels=2,
+                     progress=None, cancel=None, sampwidth=2, frames=None, stats=None,
+                     floating=False, dither=DITHER_NONE):
+    """Write float32 blocks to a WAV file incrementally
+
+    When the total number of `frames` is known the file is preallocated
+    (with an RF64 header past 4 GB) and the blocks are converted straight
+    into a memory map of its data chunk; this is the only path that writes
+    24-bit, 32-bit and float (`floating`, 32-bit only) samples. Otherwise a
+    16-bit file is streamed through `wave`. `dither` is one of DITHERS and
+    only affects integer samples.
+
+    `progress` is called with the number of frames written so far after
+    every block. Setting the `cancel` event (anything with is_set())
+    stops the export, removes the partial file and raises ExportCancelled.
+    With an instrumentation.StageRecorder as `stats`, the synthesis,
+    quantize and write time of every block is recorded.
+    """
+    if frames is None and (sampwidth != 2 or floating):
+        raise ValueError("frames is required for 24-bit, 32-bit and float WAV exports")
+    quantizer = Quantizer(sampwidth, floating, dither, channels, max_frames=0)
+    if stats is not None:
+        blocks = stats.timed_blocks(blocks)
+
+    try:
+        if frames is not None:
+            _write_wav_memmap(filename, blocks, frames, sample_rate, channels, quantizer,
+                              progress, cancel, stats)
+            return
+
+        frames_written = 0
+        remove_output(filename)
+        with wave.open(filename, 'w') as wav_file:
+            wav_file.setnchannels(channels)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(sample_rate)
+            for block in blocks:
+                if cancel is not None and cancel.is_set():
+                    raise ExportCancelled(filename)
+                if stats is None:
+                    wav_file.writeframes(quantizer.pcm(block, frames_written))
+                else:
+                    start = time.perf_counter()
+                    data = quantizer.pcm(block, frames_written)
+                    quantized = time.perf_counter()
+                    wav_file.writeframes(data)
+                    stats.record(STAGE_QUANTIZE, quantized - start, len(block))
+                    stats.record(STAGE_WRITE, time.perf_counter() - quantized, len(block))
+                frames_written += len(block)
+                if progress is not None:
+                    progress(frames_written)
+    except BaseException:
+        _remove_quietly(filename)
+        raise
+
+
+def _write_wav_memmap(filename, blocks, frames, sample_rate, channels, quantizer,
+                      progress, cancel, stats=None):
+    """Preallocate `filename` and fill its data chunk through a memory map"""
+    sampwidth, floating = quantizer.sampwidth, quantizer.floating
+    preallocate_wav(filename, frames, sample_rate, channels, sampwidth, floating)
+    if not frames:
+        return
+
+    view = wav_memmap(filename, frames, channels, sampwidth, floating=floating)
+    try:
+        frames_written = fill_pcm(view, blocks, sampwidth, progress, cancel, stats,
+                                  floating, quantizer.dither)
+        start = time.perf_counter()
+        view.flush()
+        if stats is not None:
+            stats.record(STAGE_WRITE, time.perf_counter() - start, frames_written)
+    except ExportCancelled:
+        raise ExportCancelled(filename) from None
+    finally:
+        del view  # unmap before the file can be removed (required on Windows)
+
+    if frames_written != frames:
+        raise ValueError(f"blocks ended after {frames_written} of {frames} frames")
+
+
+# ffmpeg codec arguments per output format; BITRATE is replaced by the requested bitrate
+ENCODERS = {
+    'mp3': ['-acodec', 'mp3', '-ab', 'BITRATE'],
+    'ogg': ['-acodec', 'libvorbis', '-ab', 'BITRATE'],
+    'opus': ['-acodec', 'libopus', '-ab', 'BITRATE'],
+    'm4a': ['-acodec', 'aac', '-ab', 'BITRATE'],
+    'flac': ['-acodec', 'flac'],
+}
+
+
+def export_encoded(filename, blocks, fmt, sample_rate=44100, bitrate='192k',
+                   progress=None, cancel=None, stats=None, dither=DITHER_NONE):
+    """Stream blocks as raw PCM into ffmpeg's stdin; returns the path written
+
+    Encoding runs in the ffmpeg process while the next block is being
+    synthesized, and no temporary WAV is written. Without ffmpeg the audio
+    is saved as a WAV next to `filename` and that path is returned instead.
+    With `stats`, time blocked on the pipe and waiting for ffmpeg to finish
+    is recorded as the encode stage. `dither` applies to the 16-bit PCM
+    handed to ffmpeg.
+    """
+    codec = [bitrate if arg == 'BITRATE' else arg for arg in ENCODERS[fmt]]
+    cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error',
+           '-f', 's16le', '-ar', str(sample_rate), '-ac', '2', '-i', 'pipe:0',
+           *codec, '-y', filename]
+
+    errors = tempfile.TemporaryFile()
+    remove_output(filename)  # rather than letting ffmpeg -y rewrite it in place
+    try:
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                   stdout=subprocess.DEVNULL, stderr=errors)
+    except FileNotFoundError:
+        errors.close()
+        wav_filename = os.path.splitext(filename)[0] + '.wav'
+        write_wav_blocks(wav_filename, blocks, sample_rate=sample_rate,
+                         progress=progress, cancel=cancel, stats=stats, dither=dither)
+        return wav_filename
+
+    quantizer = Quantizer(2, dither=dither, max_frames=0)
+    if stats is not None:
+        blocks = stats.timed_blocks(blocks)
+
+    frames_written = 0
+    try:
+        with errors:
+            try:
+                for block in blocks:
+                    if cancel is not None and cancel.is_set():
+                        raise ExportCancelled(filename)
+                    if stats is None:
+                        process.stdin.write(quantizer.pcm(block, frames_written))
+                    else:
+                        start = time.perf_counter()
+                        data = quantizer.pcm(block, frames_written)
+                        quantized = time.perf_counter()
+                        process.stdin.write(data)
+                        stats.record(STAGE_QUANTIZE, quantized - start, len(block))
+                        stats.record(STAGE_ENCODE, time.perf_counter() - quantized, len(block))
+                    frames_written += len(block)
+                    if progress is not None:
+                        progress(frames_written)
+                process.stdin.close()
+            except BrokenPipeError:
+                pass  # ffmpeg exited early; its stderr says why
+
+            start = time.perf_counter()
+            process.wait()
+            if stats is not None:
+                stats.record(STAGE_ENCODE, time.perf_counter() - start, frames_written)
+            if process.returncode != 0:
+                errors.seek(0)
+                message = errors.read().decode(errors='replace').strip()
+                raise RuntimeError(f"ffmpeg failed ({process.returncode}): "
+                                   f"{message.splitlines()[-1] if message else 'no output'}")
+    except BaseException:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        _remove_quietly(filename)
+        raise
+
+    return filename
+
+
+def export_mp3(filename, blocks, sample_rate=44100, bitrate='192k',
+               progress=None, cancel=None, stats=None, dither=DITHER_NONE):
+    """Encode blocks to MP3 through an ffmpeg pipe; returns the path written
+
+    Without ffmpeg the audio is kept as a WAV next to `filename` and that
+    path is returned instead.
+    """
+    return export_encoded(filename, blocks, 'mp3', sample_rate=sample_rate,
+                          bitrate=bitrate, progress=progress, cancel=cancel, stats=stats,
+                          dither=dither)
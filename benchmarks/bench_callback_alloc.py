@@ -0,0 +1,93 @@
+"""Measure heap allocations and time per audio callback.
+
+Drives the playback render path with a preallocated float32 outdata
+buffer, exactly as PortAudio would, and records the transient
+heap allocation per callback with tracemalloc. The pre-oscillator
+callback is measured for reference, and the glide rows render every
+block as a parameter ramp (the worst case while a slider is moving). Whatever the render path still
+allocates is Python view/tuple objects, so it does not grow with the
+block size, while the legacy path allocates several sample buffers.
+
+    python benchmarks/bench_callback_alloc.py --blocksize 256
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio_engine
+
+
+def legacy_callback(state, outdata, frames, freqs, volume):
+    """The original audio_callback body"""
+    t = np.arange(frames) / state['sample_rate'] + state['position']
+    left_channel = volume * np.sin(2 * np.pi * freqs[0] * t)
+    right_channel = volume * np.sin(2 * np.pi * freqs[1] * t)
+    state['position'] += frames / state['sample_rate']
+    outdata[:, 0] = left_channel
+    outdata[:, 1] = right_channel
+
+
+def measure(callback, outdata, calls):
+    """Return (median and max transient heap bytes per call, microseconds per call)
+
+    tracemalloc's peak is reset before every call, so the difference
+    between peak and current memory is what the call allocated and freed.
+    """
+    for _ in range(10):
+        callback(outdata)
+
+    transient = []
+    tracemalloc.start()
+    for _ in range(calls):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        callback(outdata)
+        transient.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        callback(outdata)
+    elapsed = time.perf_counter() - start
+    return int(np.median(transient)), max(transient), elapsed / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--blocksize', type=int, default=256)
+    parser.add_argument('--sample-rate', type=int, default=48000)
+    parser.add_argument('--calls', type=int, default=2000)
+    args = parser.parse_args()
+
+    freqs, volume = (856.0, 866.0), 0.3
+    outdata = np.zeros((args.blocksize, 2), dtype=np.float32)
+    state = {'sample_rate': args.sample_rate, 'position': 0.0}
+
+    results = [('legacy', lambda out: legacy_callback(state, out, args.blocksize,
+                                                      freqs, volume))]
+    for mode in (audio_engine.SYNTH_EXACT, audio_engine.SYNTH_TABLE):
+        oscillator = audio_engine.SineOscillator(2, args.sample_rate, mode)
+        results.append((mode, lambda out, osc=oscillator: osc.render_into(out, freqs, volume)))
+
+    for mode in (audio_engine.SYNTH_EXACT, audio_engine.SYNTH_TABLE):
+        oscillator = audio_engine.SineOscillator(2, args.sample_rate, mode)
+        glide_to = (freqs[0] + 1.0, freqs[1] + 1.0)
+        results.append((f'{mode} glide',
+                        lambda out, osc=oscillator: osc.render_into(out, glide_to, volume * 1.1,
+                                                                    freqs, volume)))
+
+    print(f"blocksize {args.blocksize} @ {args.sample_rate} Hz, {args.calls} callbacks")
+    for name, callback in results:
+        median, worst, micros = measure(callback, outdata, args.calls)
+        print(f"{name:>11}: transient bytes/callback median {median:7d}, max {worst:7d}; "
+              f"{micros:7.1f} us/callback")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Late callbacks with and without the playback lookahead ring, under render stalls.
+
+Plays through a paced NullOutputStream at a small block size while every
+render now and then stalls for a few milliseconds (a sleep, so other
+threads keep running, as when the rendering thread is descheduled or
+waits on I/O). Lookahead 0 renders inside the callback, as the app did
+before the ring existed, so every stall lands on the audio deadline; with
+a ring the stall happens on the producer thread and only matters if it
+outlasts the lookahead.
+
+Stalls that hold the GIL (a pure-Python loop, a GC pass) still delay the
+callback, which is Python code in sounddevice too; the ring keeps the
+callback itself down to a copy, so it needs the GIL for as short a time
+as possible. The NullOutputStream pacing thread also sees this machine's
+scheduling noise, so compare the counts between rows rather than against 0.
+
+    python benchmarks/bench_lookahead.py --blocksize 64 --stall-ms 4
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio_engine
+import playback
+
+
+def stall_renders(oscillator, stall_ms, every_ms):
+    """Make oscillator.render_into() sleep `stall_ms` once every `every_ms`"""
+    render_into = oscillator.render_into
+    next_stall = [time.perf_counter() + every_ms / 1000]
+
+    def stalling(*args, **kwargs):
+        now = time.perf_counter()
+        if now >= next_stall[0]:
+            next_stall[0] = now + every_ms / 1000
+            time.sleep(stall_ms / 1000)
+        render_into(*args, **kwargs)
+    oscillator.render_into = stalling
+
+
+def run(lookahead, args):
+    """Play for args.seconds; returns (late callbacks, ring underruns, p99 callback us)"""
+    settings = playback.StreamSettings(sample_rate=args.sample_rate, blocksize=args.blocksize,
+                                       lookahead=lookahead)
+    streams = []
+
+    def factory(**kwargs):
+        # The stream thread has built the oscillator by the time it opens the stream
+        stall_renders(engine.oscillator, args.stall_ms, args.every_ms)
+        stream = audio_engine.NullOutputStream(**kwargs)
+        streams.append(stream)
+        return stream
+
+    engine = playback.PlaybackEngine(settings, stream_factory=factory)
+    engine.params.set_frequencies(200, 210)
+    engine.params.set_volume(0.3)
+
+    engine.start()
+    # Move the sliders now and then, as a listener would
+    deadline = time.perf_counter() + args.seconds
+    step = 0
+    while time.perf_counter() < deadline:
+        time.sleep(0.1)
+        step += 1
+        engine.params.set_frequencies(200 + step % 5, 210)
+    engine.stop()
+    engine.join()
+
+    times = np.asarray(streams[0].callback_times)
+    return engine.xrun_count, engine.underruns(), float(np.percentile(times, 99) * 1e6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--blocksize', type=int, default=64)
+    parser.add_argument('--sample-rate', type=int, default=48000)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--stall-ms', type=float, default=4,
+                        help='length of each render stall (default: 4)')
+    parser.add_argument('--every-ms', type=float, default=50,
+                        help='time between stalls (default: 50)')
+    parser.add_argument('--lookaheads', type=int, nargs='+', default=[0, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    budget = args.blocksize / args.sample_rate * 1000
+    print(f"blocksize {args.blocksize} @ {args.sample_rate} Hz ({budget:.2f} ms), "
+          f"{args.stall_ms:g} ms render stall every {args.every_ms:g} ms, {args.seconds:g} s each")
+    for lookahead in args.lookaheads:
+        late, underruns, p99 = run(lookahead, args)
+        print(f"lookahead {lookahead:3d}: {late:5d} late callbacks, {underruns:5d} ring underruns, "
+              f"callback p99 {p99:7.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Cost of rendering many rooms for multi-channel routing, per block.
+
+Compares routing.RoomBank (every room in one vectorized pass, routed by
+one matrix multiply) with the one-stream-per-room approach it replaces:
+a SineOscillator and ParameterSmoother per room, each rendered into its
+own stereo block and copied to the device channels. Both run on the same
+thread here, so the baseline leaves out the thread and stream per room
+that it would need in practice.
+
+Reported per room count: microseconds per block with steady parameters
+and with every room gliding, and the share of the block's real-time
+budget. Then a paced run through RoomRouter on NullOutputStreams (two
+8-channel devices by default) counts ring underruns and late callbacks.
+
+    python benchmarks/bench_routing.py --rooms 1 4 8 16 32 64 --blocksize 512
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio_engine
+import playback
+import routing
+
+
+def make_rooms(count, devices, device_channels):
+    """`count` rooms spread over channel pairs of `devices` devices"""
+    pairs = device_channels // 2
+    return [routing.Room(f'room{i}', (2 * (i % pairs), 2 * (i % pairs) + 1),
+                         f'device{(i // pairs) % devices}', 150 + i, 156 + i, 0.3)
+            for i in range(count)]
+
+
+def time_blocks(render, blocks):
+    """Median seconds per call of render(step) over `blocks` calls"""
+    times = np.empty(blocks)
+    for step in range(blocks):
+        start = time.perf_counter()
+        render(step)
+        times[step] = time.perf_counter() - start
+    return float(np.median(times))
+
+
+def bench_bank(rooms, layout, args, glide):
+    """RoomBank: one pass for every room"""
+    bank = routing.RoomBank(rooms, layout, args.sample_rate, max_frames=args.blocksize)
+    outs = [np.zeros((args.blocksize, channels), dtype=np.float32) for _, channels in layout]
+
+    def render(step):
+        if glide:
+            for room in rooms:
+                room.params.set_frequencies(150 + step % 7, 156)
+        bank.render_into(outs)
+    for step in range(20):  # settle the fade-in
+        bank.render_into(outs)
+    return time_blocks(render, args.blocks)
+
+
+def bench_per_room(rooms, layout, args, glide):
+    """Baseline: an oscillator and smoother per room, copied onto the device channels"""
+    index = {device: i for i, (device, _) in enumerate(layout)}
+    outs = [np.zeros((args.blocksize, channels), dtype=np.float32) for _, channels in layout]
+    voices = []
+    for room in rooms:
+        left, right, volume = room.params.snapshot()
+        voices.append((room,
+                       audio_engine.SineOscillator(2, args.sample_rate, max_frames=args.blocksize),
+                       audio_engine.ParameterSmoother(args.sample_rate, freqs=(left, right),
+                                                      gain=volume),
+                       np.zeros((args.blocksize, 2), dtype=np.float32)))
+
+    def render(step):
+        for room, oscillator, smoother, block in voices:
+            if glide:
+                room.params.set_frequencies(150 + step % 7, 156)
+            left, right, volume = room.params.snapshot()
+            start_freqs, freqs, start_gain, gain = smoother.advance(args.blocksize, (left, right),
+                                                                    volume)
+            oscillator.render_into(block, freqs, gain, start_freqs, start_gain)
+            out = outs[index[room.device]]
+            out[:, room.channels[0]] = block[:, 0]
+            out[:, room.channels[1]] = block[:, 1]
+    return time_blocks(render, args.blocks)
+
+
+def realtime_run(args):
+    """Paced RoomRouter run on NullOutputStreams; returns (underruns, late callbacks)"""
+    rooms = make_rooms(args.realtime_rooms, args.devices, args.device_channels)
+    settings = playback.StreamSettings(args.sample_rate, args.blocksize, lookahead=args.lookahead)
+    router = routing.RoomRouter(rooms, settings, stream_factory=audio_engine.NullOutputStream)
+    router.start()
+    deadline = time.perf_counter() + args.seconds
+    step = 0
+    while time.perf_counter() < deadline:
+        time.sleep(0.1)
+        step += 1
+        rooms[step % len(rooms)].params.set_frequencies(150 + step % 5, 156)
+    router.stop()
+    router.join()
+    return sum(router.underruns()), sum(router.xruns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rooms', type=int, nargs='+', default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument('--blocksize', type=int, default=512)
+    parser.add_argument('--sample-rate', type=int, default=48000)
+    parser.add_argument('--blocks', type=int, default=500, help='blocks timed per case')
+    parser.add_argument('--devices', type=int, default=2)
+    parser.add_argument('--device-channels', type=int, default=8)
+    parser.add_argument('--realtime-rooms', type=int, default=8,
+                        help='rooms in the paced run (default: 8)')
+    parser.add_argument('--lookahead', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5, help='length of the paced run')
+    args = parser.parse_args()
+
+    budget = args.blocksize / args.sample_rate
+    print(f"block {args.blocksize} @ {args.sample_rate} Hz ({budget * 1000:.2f} ms), "
+          f"median us per block (share of budget)")
+    print(f"{'rooms':>5s}  {'bank steady':>18s}  {'per-room steady':>18s}  "
+          f"{'bank glide':>18s}  {'per-room glide':>18s}")
+    for count in args.rooms:
+        cells = []
+        for glide in (False, True):
+            for bench in (bench_bank, bench_per_room):
+                rooms = make_rooms(count, args.devices, args.device_channels)
+                layout = routing.device_layout(rooms)
+                seconds = bench(rooms, layout, args, glide)
+                cells.append(f"{seconds * 1e6:9.1f} ({seconds / budget:5.1%})")
+        print(f"{count:5d}  " + '  '.join(f"{cell:>18s}" for cell in cells))
+
+    underruns, late = realtime_run(args)
+    print(f"paced: {args.realtime_rooms} rooms on {args.devices} devices, lookahead "
+          f"{args.lookahead}, {args.seconds:g} s: {underruns} ring underruns, {late} late callbacks")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Cold-start time of the desktop app and its modules.
+
+Each measurement runs in a fresh interpreter, so nothing is cached in
+sys.modules. Reported:
+  imports  time to import each module on its own, and which heavy
+           dependencies (numpy, sounddevice) it pulled in
+  eager    the old startup path: every module the app used to import at
+           the top of theta_wave_generator
+  window   process start to the first fully drawn window (needs a display)
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ('numpy', 'sounddevice', 'audio_engine', 'session', 'instrumentation', 'render_cache')
+
+IMPORT_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+WINDOW_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import tkinter as tk
+import theta_wave_generator
+root = tk.Tk()
+app = theta_wave_generator.ModernBinauralGenerator(root)
+root.update()
+elapsed = time.perf_counter() - start
+root.destroy()
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+MODULES = {
+    'playback': 'import playback',
+    'theta_wave_generator': 'import theta_wave_generator',
+    'audio_engine': 'import audio_engine',
+    'session': 'import session',
+    'eager (pre-split app imports)': ('import tkinter, numpy, audio_engine, instrumentation, '
+                                      'render_cache, session'),
+}
+
+
+def probe(code):
+    """Run `code` in a fresh interpreter and return its JSON output (None on failure)"""
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(code, runs):
+    """Median seconds over `runs` fresh processes, plus the heavy modules loaded"""
+    samples = [probe(code) for _ in range(runs)]
+    if any(sample is None for sample in samples):
+        return None
+    return {'median_ms': statistics.median(s['seconds'] for s in samples) * 1000,
+            'loaded': samples[0]['loaded']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh processes per measurement')
+    args = parser.parse_args()
+
+    for name, statement in MODULES.items():
+        result = measure(IMPORT_PROBE.format(statement=statement, heavy=HEAVY), args.runs)
+        if result is None:
+            print(f"{name:32s} failed to import")
+            continue
+        loaded = ', '.join(result['loaded']) or '-'
+        print(f"{name:32s} {result['median_ms']:8.1f} ms   loads: {loaded}")
+
+    result = measure(WINDOW_PROBE.format(heavy=HEAVY), args.runs)
+    if result is None:
+        print(f"{'window':32s} skipped (no display)")
+    else:
+        loaded = ', '.join(result['loaded']) or '-'
+        print(f"{'window':32s} {result['median_ms']:8.1f} ms   loads: {loaded}")
+
+
+if __name__ == '__main__':
+    main()
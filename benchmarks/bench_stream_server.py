@@ -0,0 +1,198 @@
+"""Load test for stream_server.py: many concurrent local listeners.
+
+Starts the server in a child process, connects --clients listeners to it
+from this process (HTTP, WebSocket or a mix) spread over --distinct
+parameter sets, reads for --seconds, and reports:
+  keeping up   listeners that received at least 95% of real-time audio
+  server CPU   the child's user+system time over the run, as cores used,
+               and the listeners served per core that implies
+  late ticks   render clock ticks that started after their deadline
+Optionally some listeners read slowly (--slow) through a small receive
+buffer, to check that back-pressure drops their blocks without holding up
+anyone else.
+
+    python benchmarks/bench_stream_server.py --clients 500 --distinct 10
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+KEEPING_UP = 0.95
+
+
+def client_params(index, distinct):
+    """Query string for listener `index`, cycling through `distinct` parameter sets"""
+    step = index % distinct
+    return f'left={200 + step}&right={210 + step}&volume=30'
+
+
+async def open_listener(port, path, websocket, slow):
+    """Connect and send the request; returns (reader, writer) positioned at the audio"""
+    if slow:
+        # A small receive buffer so the slow reader pushes back on the server quickly
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8192)
+        sock.setblocking(False)
+        await asyncio.get_running_loop().sock_connect(sock, ('127.0.0.1', port))
+        reader, writer = await asyncio.open_connection(sock=sock)
+    else:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    if websocket:
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write(f'GET /ws?{path} HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n'
+                     f'Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n'
+                     f'Sec-WebSocket-Version: 13\r\n\r\n'.encode())
+    else:
+        writer.write(f'GET /stream?{path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+    header = await reader.readuntil(b'\r\n\r\n')
+    if b' 101 ' not in header and b' 200 ' not in header:
+        raise RuntimeError(header.split(b'\r\n', 1)[0].decode())
+    return reader, writer
+
+
+def masked_text_frame(text):
+    """Client-to-server WebSocket text frame (clients must mask)"""
+    payload = text.encode()
+    mask = os.urandom(4)
+    masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return struct.pack('!BB', 0x81, 0x80 | len(payload)) + mask + masked
+
+
+async def listen(port, index, args, websocket, slow, deadline):
+    """One listener; returns (bytes of audio received, disconnected early)"""
+    reader, writer = await open_listener(port, client_params(index, args.distinct), websocket, slow)
+    received = 0
+    retuned = not (websocket and args.retune)
+    halfway = deadline - args.seconds / 2
+    loop = asyncio.get_running_loop()
+    try:
+        while loop.time() < deadline:
+            if not retuned and loop.time() >= halfway:
+                # Move to the next parameter set, as a listener turning a knob would
+                step = (index + 1) % args.distinct
+                writer.write(masked_text_frame(json.dumps({'left': 200 + step, 'right': 210 + step})))
+                retuned = True
+            try:
+                data = await asyncio.wait_for(reader.read(65536), deadline - loop.time())
+            except asyncio.TimeoutError:
+                break
+            if not data:
+                return received, True
+            received += len(data)
+            if slow:
+                await asyncio.sleep(len(data) / (args.bytes_per_second * args.slow_rate))
+    except ConnectionError:
+        return received, True
+    finally:
+        writer.close()
+    return received, False
+
+
+async def fetch_status(port):
+    """The server's /status JSON"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'GET /status HTTP/1.1\r\nHost: localhost\r\n\r\n')
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.split(b'\r\n\r\n', 1)[1])
+
+
+async def load(port, args):
+    """Run every listener concurrently; returns per-listener results and the server status"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + args.seconds
+    tasks = []
+    for index in range(args.clients):
+        websocket = args.protocol == 'ws' or (args.protocol == 'mixed' and index % 2)
+        tasks.append(listen(port, index, args, websocket, False, deadline))
+    for index in range(args.slow):
+        tasks.append(listen(port, index, args, False, True, deadline))
+    results = asyncio.ensure_future(asyncio.gather(*tasks))
+    # Sample the status while everyone is still connected
+    await asyncio.sleep(max(args.seconds - 1, args.seconds / 2))
+    status = await fetch_status(port)
+    return await results, status
+
+
+def start_server(args):
+    """Launch stream_server.py on a free port; returns (process, port)"""
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'stream_server.py'),
+                                '--port', '0', '--quiet', '--block-frames', str(args.block_frames),
+                                '--sample-rate', str(args.sample_rate),
+                                '--max-listeners', str(args.clients + args.slow + 16)],
+                               stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    port = int(line.split('://', 1)[1].split('/', 1)[0].rsplit(':', 1)[1])
+    return process, port
+
+
+def stop_server(process):
+    """Interrupt the server; returns its user+system CPU seconds"""
+    process.send_signal(signal.SIGINT)
+    if hasattr(os, 'wait4'):
+        _, _, usage = os.wait4(process.pid, 0)
+        process.returncode = 0
+        return usage.ru_utime + usage.ru_stime
+    process.wait()
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=300, help='listeners (default: 300)')
+    parser.add_argument('--distinct', type=int, default=10,
+                        help='distinct parameter sets among them (default: 10)')
+    parser.add_argument('--protocol', choices=('http', 'ws', 'mixed'), default='mixed')
+    parser.add_argument('--retune', action='store_true',
+                        help='WebSocket listeners retune halfway through')
+    parser.add_argument('--slow', type=int, default=0,
+                        help='extra listeners that read slower than real time (default: 0)')
+    parser.add_argument('--slow-rate', type=float, default=0.25,
+                        help='fraction of real time the slow listeners read at (default: 0.25)')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--sample-rate', type=int, default=44100)
+    parser.add_argument('--block-frames', type=int, default=2048)
+    args = parser.parse_args()
+    args.distinct = max(1, min(args.distinct, args.clients))
+    args.bytes_per_second = args.sample_rate * 4  # 16-bit stereo
+
+    process, port = start_server(args)
+    try:
+        start = time.perf_counter()
+        results, status = asyncio.run(load(port, args))
+        wall = time.perf_counter() - start
+    finally:
+        cpu = stop_server(process)
+
+    expected = args.bytes_per_second * args.seconds
+    regular, slow = results[:args.clients], results[args.clients:]
+    keeping_up = sum(received >= KEEPING_UP * expected for received, _ in regular)
+    print(f"{args.clients} {args.protocol} listeners over {args.distinct} parameter sets, "
+          f"{args.seconds:g} s, block {args.block_frames} @ {args.sample_rate} Hz")
+    print(f"  keeping up:  {keeping_up}/{args.clients} "
+          f"(min {min(r for r, _ in regular) / expected:.1%} of real time)")
+    print(f"  streams:     {status['streams']} rendered, {status['listeners']} listening at "
+          f"the status sample, {status['late_ticks']}/{status['ticks']} late ticks, "
+          f"render {status['render_seconds'] / max(status['ticks'], 1) * 1000:.2f} ms per tick")
+    if cpu is not None:
+        cores = cpu / wall
+        print(f"  server CPU:  {cpu:.2f} s over {wall:.2f} s = {cores:.2f} cores "
+              f"-> {args.clients / max(cores, 1e-9):.0f} listeners per core")
+    if slow:
+        print(f"  slow:        {args.slow} listeners at {args.slow_rate:g}x real time, "
+              f"{status['too_slow']} disconnected, {status['dropped_blocks']} blocks dropped, received "
+              f"{min(r for r, _ in slow) / expected:.0%}-{max(r for r, _ in slow) / expected:.0%}")
+
+
+if __name__ == '__main__':
+    main()
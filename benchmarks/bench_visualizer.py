@@ -0,0 +1,115 @@
+"""Late callbacks at a 256-frame block size with and without the live scope.
+
+Plays through a paced NullOutputStream three times per lookahead: with no
+tap, with a visualizer.ScopeTap on the engine, and with the tap plus a
+ScopeAnalyzer polled at the scope's frame rate on another thread. That
+thread stands in for the Tk main loop, which runs the analyzer in the app
+and competes with the audio thread for the GIL the same way; the canvas
+drawing itself is left out, since this runs without a display.
+
+Reported per run: late callbacks (xruns), ring underruns, callback p99 and
+max, frames the analyzer drew and the reads it had to repeat because the
+audio thread lapped them. The NullOutputStream pacing thread also sees
+this machine's scheduling noise, so compare rows rather than expect 0.
+
+    python benchmarks/bench_visualizer.py --seconds 10 --lookaheads 0 4
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio_engine
+import playback
+import visualizer
+
+MODES = ('off', 'tap', 'tap+scope')
+
+
+def poll_scope(analyzer, stop, frame_rate):
+    """Update the analyzer at `frame_rate` until `stop` is set; returns frames drawn"""
+    period = 1.0 / frame_rate
+    frames = 0
+    next_frame = time.perf_counter()
+    while not stop.is_set():
+        if analyzer.update():
+            frames += 1
+        next_frame += period
+        stop.wait(max(0.0, next_frame - time.perf_counter()))
+    return frames
+
+
+def run(mode, lookahead, args):
+    """Play for args.seconds; returns (late, underruns, p99 us, max us, frames, retries)"""
+    settings = playback.StreamSettings(sample_rate=args.sample_rate, blocksize=args.blocksize,
+                                       lookahead=lookahead)
+    streams = []
+
+    def factory(**kwargs):
+        stream = audio_engine.NullOutputStream(**kwargs)
+        streams.append(stream)
+        return stream
+
+    engine = playback.PlaybackEngine(settings, stream_factory=factory)
+    engine.params.set_frequencies(200, 210)
+    engine.params.set_volume(0.3)
+
+    tap = analyzer = poller = None
+    stop = threading.Event()
+    drawn = []
+    if mode != 'off':
+        tap = visualizer.ScopeTap(args.sample_rate)
+        engine.tap = tap
+    if mode == 'tap+scope':
+        analyzer = visualizer.ScopeAnalyzer(tap, 280, 120, scope_height=72)
+        poller = threading.Thread(target=lambda: drawn.append(
+            poll_scope(analyzer, stop, args.frame_rate)), daemon=True)
+
+    engine.start()
+    if poller is not None:
+        poller.start()
+    deadline = time.perf_counter() + args.seconds
+    step = 0
+    while time.perf_counter() < deadline:
+        time.sleep(0.1)
+        step += 1
+        engine.params.set_frequencies(200 + step % 5, 210)
+    stop.set()
+    if poller is not None:
+        poller.join()
+    engine.stop()
+    engine.join()
+
+    times = np.asarray(streams[0].callback_times)
+    return (engine.xrun_count, engine.underruns(), float(np.percentile(times, 99) * 1e6),
+            float(times.max() * 1e6), drawn[0] if drawn else 0, tap.retries if tap else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--blocksize', type=int, default=256)
+    parser.add_argument('--sample-rate', type=int, default=44100)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--frame-rate', type=float, default=visualizer.FRAME_RATE,
+                        help=f'scope redraws per second (default: {visualizer.FRAME_RATE})')
+    parser.add_argument('--lookaheads', type=int, nargs='+', default=[0, 4])
+    args = parser.parse_args()
+
+    budget = args.blocksize / args.sample_rate * 1000
+    print(f"blocksize {args.blocksize} @ {args.sample_rate} Hz ({budget:.2f} ms), "
+          f"scope at {args.frame_rate:g} fps, {args.seconds:g} s each")
+    for lookahead in args.lookaheads:
+        for mode in MODES:
+            late, underruns, p99, worst, frames, retries = run(mode, lookahead, args)
+            print(f"lookahead {lookahead:2d} {mode:>9s}: {late:4d} late callbacks, "
+                  f"{underruns:4d} ring underruns, callback p99 {p99:6.1f} us max {worst:7.1f} us, "
+                  f"{frames:4d} frames drawn, {retries} read retries")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""How many simultaneous voices fit in real time on one core.
+
+Renders VoiceBank blocks (binaural pairs, every fourth pair with an
+isochronic voice, plus a pink noise bed) for increasing voice counts and
+reports the time per block against the block's real-time budget. A Python
+loop over one SineOscillator per voice is measured for comparison.
+BLAS is limited to one thread so the matrix mix stays on one core.
+
+    python benchmarks/bench_voices.py --blocksize 256 --sample-rate 48000
+"""
+import os
+
+for _var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(_var, '1')
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio_engine
+
+
+def make_voices(count):
+    """`count` voices: binaural pairs on spread carriers, some with isochronic layers"""
+    voices = []
+    pair = 0
+    while len(voices) < count:
+        carrier = 100.0 + 7.3 * pair
+        voices.extend(audio_engine.binaural_voices(carrier, 4.0 + pair % 8, 0.01))
+        if pair % 4 == 3:
+            voices.append(audio_engine.isochronic_voice(carrier * 1.5, 10.0, 0.01))
+        pair += 1
+    return voices[:count]
+
+
+def time_per_block(render, outdata, seconds):
+    """Median wall time of one render call, sampled for about `seconds`"""
+    for _ in range(20):
+        render(outdata)
+    samples = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline or len(samples) < 50:
+        start = time.perf_counter()
+        render(outdata)
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples))
+
+
+def python_loop(oscillators, voices, mix, outdata):
+    """Reference: one oscillator per voice, summed in Python"""
+    outdata.fill(0.0)
+    for oscillator, voice in zip(oscillators, voices):
+        oscillator.render_into(mix, (voice.freq, voice.freq))
+        mix *= voice.gains
+        outdata += mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--blocksize', type=int, default=256)
+    parser.add_argument('--sample-rate', type=int, default=48000)
+    parser.add_argument('--seconds', type=float, default=0.5,
+                        help='measuring time per configuration (default: 0.5)')
+    parser.add_argument('--synthesis', choices=(audio_engine.SYNTH_EXACT, audio_engine.SYNTH_TABLE),
+                        default=audio_engine.SYNTH_EXACT)
+    parser.add_argument('--no-noise', action='store_true', help='leave out the pink noise bed')
+    args = parser.parse_args()
+
+    budget = args.blocksize / args.sample_rate
+    outdata = np.zeros((args.blocksize, 2), dtype=np.float32)
+    noise = [] if args.no_noise else [audio_engine.NoiseBed(audio_engine.NOISE_PINK, 0.05)]
+    print(f"blocksize {args.blocksize} @ {args.sample_rate} Hz: budget {budget * 1e6:.0f} us/block, "
+          f"{args.synthesis} synthesis, {'no noise' if args.no_noise else 'pink noise bed'}")
+
+    fits = 0
+    count = 1
+    while True:
+        voices = make_voices(count)
+        bank = audio_engine.VoiceBank(voices, noise, sample_rate=args.sample_rate,
+                                      mode=args.synthesis, max_frames=args.blocksize)
+        elapsed = time_per_block(bank.render_into, outdata, args.seconds)
+        load = elapsed / budget
+        print(f"{count:6d} voices: {elapsed * 1e6:8.1f} us/block, {load:6.1%} of real time")
+        if load >= 1.0:
+            break
+        fits = count
+        count *= 2
+
+    # Refine between the last count that fit and the first that did not
+    low, high = fits, count
+    while high - low > max(1, low // 50):
+        middle = (low + high) // 2
+        bank = audio_engine.VoiceBank(make_voices(middle), noise, sample_rate=args.sample_rate,
+                                      mode=args.synthesis, max_frames=args.blocksize)
+        if time_per_block(bank.render_into, outdata, args.seconds) < budget:
+            low = middle
+        else:
+            high = middle
+    print(f"=> about {low} voices fit in real time on one core")
+
+    voices = make_voices(64)
+    oscillators = [audio_engine.SineOscillator(2, args.sample_rate, args.synthesis,
+                                               max_frames=args.blocksize) for _ in voices]
+    mix = np.zeros_like(outdata)
+    elapsed = time_per_block(lambda out: python_loop(oscillators, voices, mix, out),
+                             outdata, args.seconds)
+    print(f"Python loop over 64 oscillators (no noise): {elapsed * 1e6:.1f} us/block, "
+          f"{elapsed / budget:.1%} of real time")
+
+
+if __name__ == '__main__':
+    main()
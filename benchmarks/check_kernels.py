@@ -0,0 +1,141 @@
+"""Conformance check and timing for every available synthesis kernel.
+
+Each backend in kernels.py renders the same grid of blocks as the NumPy
+reference: 1, 2 and 8 channels; block sizes from 1 frame up; exact and
+table synthesis; float32/float64/int16/int32 output; steady and gliding
+frequencies and gains; random start phases and frequencies up to Nyquist.
+A second pass drives whole SineOscillators through a long run of mixed
+steady and gliding blocks, so phase carried between blocks is covered too.
+
+A backend conforms when every sample is within TOLERANCE of the reference
+(integer formats: 1 LSB). The exit status is 1 if any backend does not, so
+this can gate CI. Backends that cannot be imported here are listed as
+skipped.
+
+    python benchmarks/check_kernels.py
+    python benchmarks/check_kernels.py --kernels numba --timing
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio_engine
+import kernels
+
+TOLERANCE = {'float32': 1e-6, 'float64': 1e-12, 'int16': 1, 'int32': 1}
+DTYPES = tuple(TOLERANCE)
+SAMPLE_RATE = 48000
+
+
+def block_cases(seed=0):
+    """(channels, frames, mode, dtype, phase, start_freqs, freqs, start_gain, gain) to render"""
+    rng = np.random.default_rng(seed)
+    for channels, frames, mode, dtype in itertools.product(
+            (1, 2, 8), (1, 7, 64, 513, 4096), (audio_engine.SYNTH_EXACT, audio_engine.SYNTH_TABLE),
+            DTYPES):
+        for glide_freq, glide_gain in itertools.product((False, True), repeat=2):
+            phase = rng.random(channels)
+            freqs = tuple(rng.choice([0.0, 0.5, 200.0, 1000.5, SAMPLE_RATE / 2 - 1], channels)
+                          + rng.random(channels))
+            start_freqs = tuple(f * 0.9 for f in freqs) if glide_freq else freqs
+            gain = float(rng.random())
+            start_gain = float(rng.random()) if glide_gain else gain
+            yield channels, frames, mode, dtype, phase, start_freqs, freqs, start_gain, gain
+
+
+def compare(reference, result, dtype):
+    """Largest absolute difference, as a float"""
+    return float(np.abs(reference.astype(np.float64) - result.astype(np.float64)).max())
+
+
+def check_blocks(name):
+    """Worst error per dtype over the block grid, and the number of blocks checked"""
+    table = audio_engine.sine_table()
+    worst = dict.fromkeys(DTYPES, 0.0)
+    count = 0
+    for channels, frames, mode, dtype, phase, start_freqs, freqs, start_gain, gain in block_cases():
+        reference = kernels.NumpyKernel(channels, SAMPLE_RATE, table, frames)
+        kernel = kernels.make_kernel(name, channels, SAMPLE_RATE, table, frames)
+        expected = np.zeros((frames, channels), dtype=dtype)
+        got = np.zeros((frames, channels), dtype=dtype)
+        reference.render(expected, phase.copy(), start_freqs, freqs, start_gain, gain, mode)
+        kernel.render(got, phase.copy(), start_freqs, freqs, start_gain, gain, mode)
+        worst[dtype] = max(worst[dtype], compare(expected, got, dtype))
+        count += 1
+    return worst, count
+
+
+def check_run(name, blocks=2000):
+    """Worst error over a long oscillator run mixing steady and gliding blocks"""
+    worst = dict.fromkeys(DTYPES, 0.0)
+    for mode, dtype in itertools.product((audio_engine.SYNTH_EXACT, audio_engine.SYNTH_TABLE),
+                                         DTYPES):
+        reference = audio_engine.SineOscillator(2, SAMPLE_RATE, mode, kernel=kernels.KERNEL_NUMPY)
+        oscillator = audio_engine.SineOscillator(2, SAMPLE_RATE, mode, kernel=name)
+        expected = np.zeros((256, 2), dtype=dtype)
+        got = np.zeros((256, 2), dtype=dtype)
+        freqs = (200.1, 210.0)
+        for step in range(blocks):
+            if step % 10 == 0:
+                # A glide to new frequencies and gain, as a moving slider produces
+                start, freqs = freqs, (200.1 + step % 37, 210.0 + step % 11)
+                args = (freqs, 0.5, start, 0.3)
+            else:
+                args = (freqs, 0.5)
+            reference.render_into(expected, *args)
+            oscillator.render_into(got, *args)
+            worst[dtype] = max(worst[dtype], compare(expected, got, dtype))
+    return worst
+
+
+def timing(name, sizes, seconds=0.2):
+    """Microseconds per steady stereo float32 block for each size"""
+    results = {}
+    for frames in sizes:
+        oscillator = audio_engine.SineOscillator(2, SAMPLE_RATE, kernel=name, max_frames=frames)
+        out = np.zeros((frames, 2), dtype=np.float32)
+        oscillator.render_into(out, (200.0, 210.0), 0.3)
+        calls = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            oscillator.render_into(out, (200.0, 210.0), 0.3)
+            calls += 1
+        results[frames] = (time.perf_counter() - start) / calls * 1e6
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--kernels', nargs='+', default=list(kernels.KERNELS),
+                        help='backends to check (default: all)')
+    parser.add_argument('--timing', action='store_true', help='also time each backend')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 256, 1024, 4096, 65536])
+    args = parser.parse_args()
+
+    available = kernels.available_kernels()
+    print(f"auto picks: {kernels.kernel_class(kernels.KERNEL_AUTO).name}")
+    failed = False
+    for name in args.kernels:
+        if name not in available:
+            print(f"{name:6s} skipped (not installed)")
+            continue
+        worst, count = check_blocks(name)
+        run = check_run(name)
+        ok = all(worst[d] <= TOLERANCE[d] and run[d] <= TOLERANCE[d] for d in DTYPES)
+        failed |= not ok
+        errors = ', '.join(f"{d} {max(worst[d], run[d]):.2g}" for d in DTYPES)
+        print(f"{name:6s} {'ok' if ok else 'FAILED'}: {count} blocks + long runs, worst error {errors}")
+        if args.timing:
+            per_block = timing(name, args.sizes)
+            print('       ' + ', '.join(f"{frames}: {us:.1f} us" for frames, us in per_block.items()))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""Check that hardlinked cache hits are never rewritten by a later render.
+
+With `render_cli.py --cache --link` a cache hit hardlinks the output path
+to the cache entry. A later render of different parameters to the same
+path must write a new file there instead of opening that inode in place,
+or the cached entry would silently hold the new audio. For serial (-j 1)
+and process-pool (-j 2) renders, this runs the sequence
+
+    --left 200 --right 210 -o out.wav    miss, stored in the cache
+    --left 200 --right 210 -o out.wav    hit, hardlinked
+    --left 300 --right 310 -o out.wav    miss, rendered to the same path
+
+in a temporary directory and checks that the first entry still holds the
+first render and that out.wav holds the second. The exit status is 1 on
+a failure, so this can gate CI.
+
+    python benchmarks/check_render_cache.py
+"""
+import hashlib
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import render_cli
+
+DURATION = '0.02'  # minutes
+
+
+def digest(path):
+    """md5 of a file's bytes"""
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def render(directory, left, right, output, workers):
+    """One render_cli run against the cache in `directory`"""
+    argv = ['--left', str(left), '--right', str(right), '--duration', DURATION,
+            '--cache-dir', os.path.join(directory, 'cache'), '--link', '-q',
+            '-j', str(workers), '-o', output]
+    if render_cli.main(argv) != 0:
+        raise RuntimeError(f"render_cli failed: {' '.join(argv)}")
+
+
+def check(workers):
+    """Run the hit-then-miss sequence; returns a list of problems"""
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, 'out.wav')
+        reference = os.path.join(directory, 'reference.wav')
+        render(directory, 200, 210, reference, workers)
+        first = digest(reference)
+
+        render(directory, 200, 210, output, workers)
+        render(directory, 200, 210, output, workers)  # hit: hardlinked
+        render(directory, 300, 310, output, workers)  # miss to the same path
+        second = digest(output)
+
+        cache_dir = os.path.join(directory, 'cache')
+        entries = sorted(digest(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir))
+        problems = []
+        if first == second:
+            problems.append('the second render has the same bytes as the first')
+        if first not in entries:
+            problems.append('the first cache entry no longer holds the first render')
+        if entries.count(second) != 1:
+            problems.append(f'{entries.count(second)} cache entries hold the second render')
+        return problems
+
+
+def main():
+    failed = False
+    for workers in (1, 2):
+        problems = check(workers)
+        failed |= bool(problems)
+        print(f"-j {workers}: {'ok' if not problems else 'FAILED: ' + '; '.join(problems)}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""Benchmark suite: synthesis throughput, export cost and callback latency.
+
+Runs headless (playback goes to a NullOutputStream instead of a sound
+card) and writes the results as JSON, so runs from different versions can
+be compared:
+
+    python benchmarks/run_benchmarks.py -o before.json
+    ... change something ...
+    python benchmarks/run_benchmarks.py -o after.json --compare before.json
+
+Measured:
+  synthesis  samples per second of stereo output for the export paths
+  export     wall time and peak RSS of 1/10/60-minute WAV (and MP3, when
+             ffmpeg is installed) renders, each in a fresh process
+  callback   p50/p99/max time of PlaybackEngine's callback as recorded by
+             instrumentation, rendering in the callback (lookahead 0) and
+             with the default lookahead, with constant parameters and while
+             gliding, plus xruns and ring underruns; every run is paced
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import audio_engine
+import instrumentation
+import playback
+import session
+
+RESULTS_VERSION = 1
+
+
+def environment():
+    """Versions and machine details stored alongside the results"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'ffmpeg': shutil.which('ffmpeg') is not None,
+    }
+
+
+def throughput(make_blocks, seconds):
+    """Stereo frames per second produced by a block iterator"""
+    start = time.perf_counter()
+    frames = sum(len(block) for block in make_blocks(seconds))
+    return frames / (time.perf_counter() - start)
+
+
+def bench_synthesis(sample_rate, seconds):
+    """Frames per second for each export synthesis path"""
+    ramp = session.Session([session.Segment(seconds / 60, carrier=200, beat=10,
+                                            end_beat=4, curve=session.CURVE_EXPONENTIAL)])
+    paths = {
+        'exact': lambda s: audio_engine.iter_binaural_blocks(200.1, 210, 0.3, s, sample_rate,
+                                                             loop=False),
+        'table': lambda s: audio_engine.iter_binaural_blocks(200.1, 210, 0.3, s, sample_rate,
+                                                             mode=audio_engine.SYNTH_TABLE,
+                                                             loop=False),
+        'looped': lambda s: audio_engine.iter_binaural_blocks(200, 210, 0.3, s, sample_rate),
+        'session_ramp': lambda s: session.iter_session_blocks(ramp, sample_rate),
+        'voices_16_noise': lambda s: audio_engine.iter_voice_blocks(
+            audio_engine.VoiceBank(sum((audio_engine.binaural_voices(100 + 50 * i, 6, 0.05)
+                                        for i in range(8)), []),
+                                   [audio_engine.NoiseBed(audio_engine.NOISE_PINK, 0.05)],
+                                   sample_rate=sample_rate,
+                                   max_frames=audio_engine.EXPORT_BLOCK_FRAMES), s),
+    }
+    return {name: {'frames_per_second': throughput(make, seconds)} for name, make in paths.items()}
+
+
+def run_export(minutes, fmt, sample_rate, directory):
+    """Render one file in a child process; returns wall time and the child's peak RSS"""
+    output = os.path.join(directory, f'bench_{minutes:g}.{fmt}')
+    cmd = [sys.executable, os.path.join(ROOT, 'render_cli.py'), '--left', '200.1',
+           '--right', '210', '--duration', str(minutes), '--sample-rate', str(sample_rate),
+           '--format', fmt, '-o', output, '-q']
+    start = time.perf_counter()
+    process = subprocess.Popen(cmd)
+    if hasattr(os, 'wait4'):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status) if hasattr(
+            os, 'waitstatus_to_exitcode') else status >> 8
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        peak = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    else:
+        process.wait()
+        peak = None
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"render_cli exited with {process.returncode}: {' '.join(cmd)}")
+    size = os.path.getsize(output)
+    os.remove(output)
+    return {'seconds': elapsed, 'peak_rss_bytes': peak, 'file_bytes': size}
+
+
+def bench_exports(durations, sample_rate):
+    """WAV (and MP3 when ffmpeg is available) exports of each duration"""
+    formats = ['wav'] + (['mp3'] if shutil.which('ffmpeg') else [])
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for fmt in formats:
+            for minutes in durations:
+                results[f'{fmt}_{minutes:g}min'] = run_export(minutes, fmt, sample_rate, directory)
+    return results
+
+
+def latency_stats(times, blocksize, sample_rate):
+    """p50/p99/max callback time in microseconds and the share of the block budget"""
+    times = np.asarray(times)
+    budget = blocksize / sample_rate
+    return {
+        'calls': len(times),
+        'p50_us': float(np.percentile(times, 50) * 1e6),
+        'p99_us': float(np.percentile(times, 99) * 1e6),
+        'max_us': float(times.max() * 1e6),
+        'p99_budget_fraction': float(np.percentile(times, 99) / budget),
+    }
+
+
+def run_engine(sample_rate, blocksize, lookahead, glide, seconds):
+    """Play through PlaybackEngine on a paced NullOutputStream; returns its recorded callbacks"""
+    settings = playback.StreamSettings(sample_rate, blocksize, lookahead=lookahead)
+    blocks = int(seconds * sample_rate / blocksize)
+    streams = []
+
+    def factory(callback, **kwargs):
+        if glide:
+            # Retarget every block so each one is rendered on the glide path
+            inner, state = callback, [0]
+
+            def callback(outdata, frames, time_info, status):
+                state[0] += 1
+                engine.params.set_frequencies(856 + state[0] % 2, 866)
+                inner(outdata, frames, time_info, status)
+        stream = audio_engine.NullOutputStream(callback, max_blocks=blocks, **kwargs)
+        streams.append(stream)
+        return stream
+
+    engine = playback.PlaybackEngine(settings, stream_factory=factory)
+    engine.params.set_frequencies(856, 866)
+    engine.params.set_volume(0.3)
+    engine.instrumentation = instrumentation.Instrumentation(callback_capacity=blocks)
+    engine.start()
+    while not streams and engine.playing:
+        time.sleep(0.01)
+    if streams:
+        streams[0].wait()
+    engine.stop()
+    engine.join()
+
+    callbacks = engine.instrumentation.callbacks
+    return dict(latency_stats(callbacks.snapshot()['render'], blocksize, sample_rate),
+                xruns=callbacks.xruns, late=callbacks.late, underruns=engine.underruns())
+
+
+def bench_callback(sample_rate, blocksize, seconds):
+    """The app's playback callback, rendering in the callback and with the default lookahead"""
+    results = {}
+    for lookahead in (0, playback.StreamSettings().lookahead):
+        results[f'lookahead_{lookahead}'] = {
+            name: run_engine(sample_rate, blocksize, lookahead, glide, seconds)
+            for name, glide in (('constant', False), ('glide', True))
+        }
+    return results
+
+
+def flatten(results, prefix=''):
+    """{'a': {'b': 1}} -> {'a.b': 1} for comparisons"""
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current, baseline):
+    """Print every metric next to its baseline value and the relative change"""
+    before = flatten(baseline['results'])
+    after = flatten(current['results'])
+    print(f"\nCompared with {baseline['environment'].get('commit') or 'baseline'}:")
+    for name in sorted(after):
+        if name not in before or not before[name]:
+            continue
+        change = after[name] / before[name] - 1
+        print(f"  {name:50s} {before[name]:14.4g} -> {after[name]:14.4g}  {change:+7.1%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-o', '--output', default=None,
+                        help='write JSON results here (default: print them)')
+    parser.add_argument('--compare', default=None,
+                        help='earlier results file to compare against')
+    parser.add_argument('--sample-rate', type=int, default=44100)
+    parser.add_argument('--blocksize', type=int, default=256,
+                        help='playback callback block size (default: 256)')
+    parser.add_argument('--durations', type=float, nargs='+', default=[1, 10, 60],
+                        help='export lengths in minutes (default: 1 10 60)')
+    parser.add_argument('--synthesis-seconds', type=float, default=120,
+                        help='audio rendered per synthesis path (default: 120)')
+    parser.add_argument('--realtime-seconds', type=float, default=5,
+                        help='length of each paced playback run (default: 5)')
+    parser.add_argument('--quick', action='store_true',
+                        help='short run for smoke testing (1-minute export, shorter runs)')
+    parser.add_argument('--skip', nargs='+', default=[], choices=('synthesis', 'export', 'callback'),
+                        help='benchmark groups to leave out')
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.durations = [1]
+        args.synthesis_seconds = 20
+        args.realtime_seconds = 1
+
+    results = {}
+    if 'synthesis' not in args.skip:
+        print('synthesis...', file=sys.stderr)
+        results['synthesis'] = bench_synthesis(args.sample_rate, args.synthesis_seconds)
+    if 'export' not in args.skip:
+        print('export...', file=sys.stderr)
+        results['export'] = bench_exports(args.durations, args.sample_rate)
+    if 'callback' not in args.skip:
+        print('callback...', file=sys.stderr)
+        results['callback'] = bench_callback(args.sample_rate, args.blocksize,
+                                             args.realtime_seconds)
+
+    report = {
+        'version': RESULTS_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment(),
+        'settings': {'sample_rate': args.sample_rate, 'blocksize': args.blocksize,
+                     'durations': args.durations, 'synthesis_seconds': args.synthesis_seconds,
+                     'realtime_seconds': args.realtime_seconds},
+        'results': results,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+        print(f"results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Soak check for the playback time base.
+
+Simulates many hours of audio callbacks and compares the first and last
+block against a reference phase computed with exact integer arithmetic.
+The old float-seconds time base is measured alongside for comparison.
+
+    python benchmarks/soak_timebase.py --hours 24
+"""
+import argparse
+import os
+import sys
+from fractions import Fraction
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio_engine
+
+
+def reference_block(freq, start, frames, sample_rate):
+    """Exact sine for samples [start, start + frames) using integer phase"""
+    ratio = Fraction(freq) / sample_rate
+    n = np.arange(frames, dtype=object) + start
+    phase = [float((ratio * k) % 1) for k in n]
+    return np.sin(2 * np.pi * np.array(phase))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hours', type=float, default=24.0)
+    parser.add_argument('--sample-rate', type=int, default=44100)
+    parser.add_argument('--blocksize', type=int, default=2048)
+    parser.add_argument('--freqs', type=float, nargs=2, default=(856.0, 866.5))
+    args = parser.parse_args()
+
+    sr, frames = args.sample_rate, args.blocksize
+    blocks = int(args.hours * 3600 * sr / frames)
+    oscillator = audio_engine.SineOscillator(2, sr)
+    legacy_position = 0.0
+
+    def legacy_block():
+        t = np.arange(frames) / sr + legacy_position
+        return np.column_stack([np.sin(2 * np.pi * f * t) for f in args.freqs])
+
+    def error(block, start):
+        return max(np.abs(block[:, ch] - reference_block(f, start, frames, sr)).max()
+                   for ch, f in enumerate(args.freqs))
+
+    first = error(oscillator.render(frames, args.freqs), 0)
+    first_legacy = error(legacy_block(), 0)
+    legacy_position += frames / sr
+
+    for _ in range(blocks - 2):
+        oscillator.render(frames, args.freqs)
+        legacy_position += frames / sr
+
+    start = oscillator.sample_index
+    last = error(oscillator.render(frames, args.freqs), start)
+    last_legacy = error(legacy_block(), start)
+
+    print(f"{blocks} blocks of {frames} frames ({args.hours:g} h at {sr} Hz)")
+    print(f"phase accumulator: first block {first:.3e}, last block {last:.3e}")
+    print(f"float seconds:     first block {first_legacy:.3e}, last block {last_legacy:.3e}")
+
+    # A 16-bit LSB is 3.05e-5; stay orders of magnitude below it.
+    return 0 if last < 1e-9 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""Optional timing instrumentation for playback and export.
+
+Playback callbacks and export stages append to fixed-size ring buffers
+that are allocated up front, so recording never allocates on the audio
+thread and old entries are simply overwritten. Each buffer has a single
+writer (the audio thread or the export worker). Readers take a copy, so
+no locks are needed; a reader racing the writer may see at most the one
+entry being written as stale.
+
+Instrumentation is off unless an Instrumentation object is handed to the
+audio or export path. Disabled code paths only test `is not None`.
+"""
+import json
+import time
+
+import numpy as np
+
+# Callbacks kept for the stats panel and dumps (~45 s of 512-frame blocks at 44.1 kHz)
+CALLBACK_CAPACITY = 4096
+STAGE_CAPACITY = 4096
+
+# Export stages, in pipeline order
+STAGE_SYNTHESIS = 'synthesis'   # producing the next float block
+STAGE_QUANTIZE = 'quantize'     # float to PCM conversion
+STAGE_WRITE = 'write'           # writing or flushing the output file
+STAGE_ENCODE = 'encode'         # handing PCM to ffmpeg and waiting for it
+STAGES = (STAGE_SYNTHESIS, STAGE_QUANTIZE, STAGE_WRITE, STAGE_ENCODE)
+
+
+def _percentiles(values):
+    """p50/p99/max of `values` in microseconds (empty dict when there are none)"""
+    if not len(values):
+        return {}
+    return {
+        'p50_us': float(np.percentile(values, 50) * 1e6),
+        'p99_us': float(np.percentile(values, 99) * 1e6),
+        'max_us': float(values.max() * 1e6),
+    }
+
+
+class CallbackRecorder:
+    """Ring buffer of per-callback render time, deadline margin and xruns"""
+
+    def __init__(self, capacity=CALLBACK_CAPACITY):
+        self.capacity = capacity
+        self.started = np.zeros(capacity)     # perf_counter() at callback entry
+        self.render = np.zeros(capacity)      # seconds spent rendering
+        self.margin = np.zeros(capacity)      # block duration minus render time
+        self.frames = np.zeros(capacity, dtype=np.int32)
+        self.underflow = np.zeros(capacity, dtype=bool)
+        self.count = 0
+        self.xruns = 0
+        self.late = 0  # callbacks that used more than their block's duration
+
+    def record(self, started, finished, frames, sample_rate, underflow=False):
+        """Add one callback: perf_counter() at entry and exit, block size and status"""
+        i = self.count % self.capacity
+        render = finished - started
+        margin = frames / sample_rate - render
+        self.started[i] = started
+        self.render[i] = render
+        self.margin[i] = margin
+        self.frames[i] = frames
+        self.underflow[i] = underflow
+        if underflow:
+            self.xruns += 1
+        if margin < 0:
+            self.late += 1
+        self.count += 1
+
+    def snapshot(self):
+        """Copies of the buffered entries, oldest first"""
+        count = min(self.count, self.capacity)
+        order = np.arange(self.count - count, self.count) % self.capacity
+        return {
+            'started': self.started[order],
+            'render': self.render[order],
+            'margin': self.margin[order],
+            'frames': self.frames[order],
+            'underflow': self.underflow[order],
+        }
+
+    def summary(self):
+        """Totals plus render-time and margin statistics over the buffered callbacks"""
+        entries = self.snapshot()
+        margin = entries['margin']
+        summary = {'callbacks': self.count, 'xruns': self.xruns, 'late': self.late,
+                   'render': _percentiles(entries['render'])}
+        if len(margin):
+            summary['min_margin_us'] = float(margin.min() * 1e6)
+        return summary
+
+    def to_dict(self):
+        """Summary plus every buffered callback, for JSON dumps"""
+        entries = self.snapshot()
+        return dict(self.summary(), entries={key: value.tolist() for key, value in entries.items()})
+
+
+class StageRecorder:
+    """Ring buffer of export stage timings, plus running totals per stage"""
+
+    def __init__(self, capacity=STAGE_CAPACITY):
+        self.capacity = capacity
+        self.stage = np.zeros(capacity, dtype=np.int8)
+        self.seconds = np.zeros(capacity)
+        self.frames = np.zeros(capacity, dtype=np.int64)
+        self.count = 0
+        self.totals = dict.fromkeys(STAGES, 0.0)
+
+    def record(self, stage, seconds, frames=0):
+        """Add one timed stage of one block"""
+        i = self.count % self.capacity
+        self.stage[i] = STAGES.index(stage)
+        self.seconds[i] = seconds
+        self.frames[i] = frames
+        self.totals[stage] += seconds
+        self.count += 1
+
+    def timed_blocks(self, blocks):
+        """Wrap a block iterator, recording the time each block takes to synthesize"""
+        iterator = iter(blocks)
+        while True:
+            start = time.perf_counter()
+            try:
+                block = next(iterator)
+            except StopIteration:
+                return
+            self.record(STAGE_SYNTHESIS, time.perf_counter() - start, len(block))
+            yield block
+
+    def summary(self):
+        """Total seconds and per-block statistics for every stage that ran"""
+        count = min(self.count, self.capacity)
+        order = np.arange(self.count - count, self.count) % self.capacity
+        stages = self.stage[order]
+        seconds = self.seconds[order]
+        summary = {}
+        for index, stage in enumerate(STAGES):
+            if self.totals[stage]:
+                summary[stage] = dict(total_s=self.totals[stage],
+                                      **_percentiles(seconds[stages == index]))
+        return summary
+
+    def to_dict(self):
+        """Stage summary for JSON dumps"""
+        return {'blocks': self.count, 'stages': self.summary()}
+
+
+class Instrumentation:
+    """Playback and export recorders that can be shown live or dumped to JSON"""
+
+    def __init__(self, callback_capacity=CALLBACK_CAPACITY, stage_capacity=STAGE_CAPACITY):
+        self.callbacks = CallbackRecorder(callback_capacity)
+        self.export = StageRecorder(stage_capacity)
+        self.created = time.time()
+
+    def describe(self):
+        """One-line live summary for status displays"""
+        summary = self.callbacks.summary()
+        render = summary.get('render')
+        if not render:
+            return 'No callbacks recorded'
+        return (f"Render p50 {render['p50_us']:.0f} us / p99 {render['p99_us']:.0f} us / "
+                f"max {render['max_us']:.0f} us  •  min margin {summary['min_margin_us'] / 1000:.2f} ms  •  "
+                f"late {summary['late']}  •  xruns {summary['xruns']}")
+
+    def to_dict(self):
+        """Everything recorded, for JSON dumps"""
+        return {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.created)),
+            'playback': self.callbacks.to_dict(),
+            'export': self.export.to_dict(),
+        }
+
+    def dump_json(self, path):
+        """Write everything recorded so far to `path`"""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
@@ -0,0 +1,277 @@
+"""Synthesis kernels: the per-block inner loop of SineOscillator behind one interface.
+
+A kernel renders one block of sines from the wrapped phase of each channel
+at the start of the block, the start and end frequency of each channel and
+the start and end gain:
+
+    kernel.render(out, phase, start_freqs, end_freqs, start_gain, end_gain, mode)
+
+Frequencies glide linearly sample by sample (the phase is their exact
+integral) and the gain ramps linearly; with equal start and end values the
+block is steady. `out` is the interleaved (frames, channels) output buffer,
+float or integer. The caller owns the phase state and advances it after the
+block, so every kernel continues from exactly the same phase.
+
+Backends:
+  numpy  the reference: whole-block array passes in preallocated scratch
+         buffers (phase, sine, gain, then one interleaving copy)
+  numba  one compiled loop that fuses phase accumulation, sine evaluation,
+         gain, rounding and interleaving per sample; needs numba installed
+
+'auto' picks numba when it can be imported and numpy otherwise. Call
+kernel.prepare(dtype) off the audio thread before rendering a new output
+dtype in real time; the numba loop compiles per dtype on first use.
+benchmarks/check_kernels.py checks every available backend against the
+reference.
+"""
+import math
+
+import numpy as np
+
+from playback import SYNTH_TABLE
+
+KERNEL_AUTO = 'auto'
+KERNEL_NUMPY = 'numpy'
+KERNEL_NUMBA = 'numba'
+KERNELS = (KERNEL_NUMPY, KERNEL_NUMBA)
+
+
+def sine_into(phase, out, mode, table, upper, index):
+    """Write sin(2*pi*phase) into `out` for phases in cycles within [0, 1)
+
+    `phase` is overwritten. `upper` and `index` are flat float64 and intp
+    work buffers of at least phase.size elements, used only in table mode.
+    """
+    if mode != SYNTH_TABLE:
+        np.multiply(phase, 2 * np.pi, out=phase)
+        np.sin(phase, out=out)
+        return
+
+    index = index[:phase.size].reshape(phase.shape)
+    upper = upper[:phase.size].reshape(phase.shape)
+    np.multiply(phase, len(table) - 1, out=phase)
+    np.floor(phase, out=out)
+    np.copyto(index, out, casting='unsafe')
+    np.subtract(phase, out, out=phase)        # fractional position
+    np.take(table, index, out=out, mode='clip')   # lower entry
+    index += 1
+    np.take(table, index, out=upper, mode='clip')
+    np.subtract(upper, out, out=upper)
+    np.multiply(upper, phase, out=upper)
+    np.add(out, upper, out=out)
+
+
+def full_scale(dtype):
+    """Sample value of a full-scale sine for an output dtype"""
+    return np.iinfo(dtype).max if dtype.kind == 'i' else 1.0
+
+
+class NumpyKernel:
+    """Reference kernel: NumPy passes over (channels, frames) scratch buffers"""
+
+    name = KERNEL_NUMPY
+
+    def __init__(self, channels, sample_rate, table, max_frames=4096):
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.table = table
+        self.max_frames = 0
+        self.reserve(max_frames)
+
+    def prepare(self, dtype):
+        """Nothing to compile: NumPy handles every output dtype as it comes"""
+
+    def reserve(self, max_frames):
+        """Grow the per-block scratch buffers to hold `max_frames` frames"""
+        if max_frames <= self.max_frames:
+            return
+        # Flat storage, viewed per block as contiguous (channels, frames)
+        size = self.channels * max_frames
+        self.max_frames = max_frames
+        self._ramp = np.arange(max_frames, dtype=np.float64)
+        self._ramp_sq = self._ramp * (self._ramp - 1)  # n(n-1), for frequency glides
+        self._gain = np.empty(max_frames)
+        self._phase = np.empty(size)
+        self._scratch = np.empty(size)
+        self._upper = np.empty(size)
+        self._index = np.empty(size, dtype=np.intp)
+
+    def render(self, out, phase0, start_freqs, freqs, start_gain, gain, mode):
+        """Render len(out) frames into `out`; see the module docstring"""
+        frames = len(out)
+        self.reserve(frames)
+        shape = (self.channels, frames)
+        size = self.channels * frames
+        phase = self._phase[:size].reshape(shape)
+        scratch = self._scratch[:size].reshape(shape)
+        ramp = self._ramp[:frames]
+        if start_freqs != freqs:
+            # Phase of a frequency ramping linearly from f0 to f1 over the block:
+            # p0 + (f0*n + (f1 - f0)*n(n-1)/(2N)) / sr
+            ramp_sq = self._ramp_sq[:frames]
+            for ch, (f0, f1) in enumerate(zip(start_freqs, freqs)):
+                np.multiply(ramp, f0 / self.sample_rate, out=phase[ch])
+                np.multiply(ramp_sq, (f1 - f0) / (2 * frames * self.sample_rate), out=scratch[ch])
+                np.add(phase[ch], scratch[ch], out=phase[ch])
+                np.add(phase[ch], phase0[ch], out=phase[ch])
+        else:
+            for ch, freq in enumerate(freqs):
+                np.multiply(ramp, freq / self.sample_rate, out=phase[ch])
+                np.add(phase[ch], phase0[ch], out=phase[ch])
+        np.floor(phase, out=scratch)
+        np.subtract(phase, scratch, out=phase)
+
+        sine_into(phase, scratch, mode, self.table, self._upper, self._index)
+
+        scale = full_scale(out.dtype)
+        if start_gain != gain:
+            gains = self._gain[:frames]
+            np.multiply(ramp, (gain - start_gain) * scale / frames, out=gains)
+            np.add(gains, start_gain * scale, out=gains)
+            for ch in range(self.channels):
+                np.multiply(scratch[ch], gains, out=scratch[ch])
+        else:
+            np.multiply(scratch, gain * scale, out=scratch)
+
+        if out.dtype.kind == 'i':
+            # Integer stream formats: round the full-range samples
+            np.rint(scratch, out=scratch)
+            np.copyto(out, scratch.T, casting='unsafe')
+        else:
+            np.copyto(out, scratch.T, casting='same_kind')
+
+
+_numba_render = None
+_numba_warm = set()  # output dtypes the loop has been compiled for in this process
+
+
+def _compile_numba():
+    """JIT-compile the fused numba loop on first use (raises ImportError without numba)"""
+    global _numba_render
+    if _numba_render is not None:
+        return _numba_render
+    import numba
+
+    @numba.njit(cache=True, nogil=True)
+    def render(out, phase0, start_incr, glide_incr, start_gain, gain_step, glide, use_table,
+               table, integer):
+        # The same arithmetic as NumpyKernel, in the same order, one sample at a time;
+        # channel by channel so each inner loop walks one phase ramp
+        frames, channels = out.shape
+        size = table.shape[0] - 1
+        for ch in range(channels):
+            incr = start_incr[ch]
+            glide_ch = glide_incr[ch]
+            p0 = phase0[ch]
+            for n in range(frames):
+                ramp = float(n)
+                if glide:
+                    p = ramp * incr + ramp * (ramp - 1.0) * glide_ch + p0
+                else:
+                    p = ramp * incr + p0
+                p -= math.floor(p)
+                if use_table:
+                    pos = p * size
+                    lower = math.floor(pos)
+                    i = int(lower)
+                    s = table[i] + (table[i + 1] - table[i]) * (pos - lower)
+                else:
+                    s = math.sin(p * (2 * math.pi))
+                v = s * (ramp * gain_step + start_gain)
+                if integer:
+                    out[n, ch] = np.rint(v)
+                else:
+                    out[n, ch] = v
+
+    _numba_render = render
+    return render
+
+
+class NumbaKernel:
+    """Fused compiled kernel: one pass per sample, writing straight into `out`
+
+    numba compiles (or loads from its cache) one specialization per output
+    dtype on the first call with that dtype, which takes a few hundred
+    milliseconds. prepare() does that ahead of time for the dtype about to
+    be played, on the caller's thread, so it never happens in an audio
+    callback; constructing a kernel compiles nothing.
+    """
+
+    name = KERNEL_NUMBA
+
+    def __init__(self, channels, sample_rate, table, max_frames=4096):
+        self._render = _compile_numba()
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.table = table
+        self.max_frames = max_frames
+        self._start_incr = np.zeros(channels)
+        self._glide_incr = np.zeros(channels)
+
+    def prepare(self, dtype):
+        """Compile the loop for output `dtype` now, once per process, by rendering one frame"""
+        dtype = np.dtype(dtype)
+        if dtype in _numba_warm:
+            return
+        phase = np.zeros(self.channels)
+        freqs = (0.0,) * self.channels
+        out = np.zeros((1, self.channels), dtype=dtype)
+        self.render(out, phase, freqs, freqs, 0.0, 0.0, SYNTH_TABLE)
+        _numba_warm.add(dtype)
+
+    def reserve(self, max_frames):
+        """Nothing to grow: the fused loop needs no per-frame scratch"""
+        self.max_frames = max(self.max_frames, max_frames)
+
+    def render(self, out, phase0, start_freqs, freqs, start_gain, gain, mode):
+        """Render len(out) frames into `out`; see the module docstring"""
+        frames = len(out)
+        glide = start_freqs != freqs
+        for ch, (f0, f1) in enumerate(zip(start_freqs, freqs)):
+            self._start_incr[ch] = f0 / self.sample_rate
+            self._glide_incr[ch] = (f1 - f0) / (2 * frames * self.sample_rate) if glide else 0.0
+        scale = full_scale(out.dtype)
+        if start_gain != gain:
+            start, step = start_gain * scale, (gain - start_gain) * scale / frames
+        else:
+            start, step = gain * scale, 0.0
+        # Plain floats and bools, so the argument types (and the compiled loop) never change
+        self._render(out, phase0, self._start_incr, self._glide_incr, float(start), float(step),
+                     bool(glide), mode == SYNTH_TABLE, self.table, out.dtype.kind == 'i')
+
+
+def kernel_class(name=KERNEL_AUTO):
+    """Kernel class for a backend name; 'auto' prefers numba when it is installed"""
+    if name == KERNEL_AUTO:
+        try:
+            _compile_numba()
+            return NumbaKernel
+        except ImportError:
+            return NumpyKernel
+    if name == KERNEL_NUMPY:
+        return NumpyKernel
+    if name == KERNEL_NUMBA:
+        try:
+            _compile_numba()
+        except ImportError:
+            raise ValueError("The numba kernel needs numba (pip install numba)") from None
+        return NumbaKernel
+    raise ValueError(f"Unknown kernel '{name}' (expected auto or one of {', '.join(KERNELS)})")
+
+
+def available_kernels():
+    """Names of the backends that can run here"""
+    names = [KERNEL_NUMPY]
+    try:
+        _compile_numba()
+        names.append(KERNEL_NUMBA)
+    except ImportError:
+        pass
+    return names
+
+
+def make_kernel(name, channels, sample_rate, table, max_frames=4096):
+    """Kernel instance for `name` (a backend name, 'auto', or an existing kernel)"""
+    if not isinstance(name, str):
+        return name
+    return kernel_class(name)(channels, sample_rate, table, max_frames)
@@ -0,0 +1,364 @@
+"""Live playback engine, importable without a display or an audio device.
+
+PlaybackEngine owns everything the desktop app needs to play a tone or a
+session: the parameter snapshot, the oscillator and smoother, the audio
+callback and the thread that keeps the output stream open. It has no Tk
+code, so scripts and tests can drive it directly (optionally with a
+stream_factory such as audio_engine.NullOutputStream instead of a sound
+card).
+
+With a lookahead (the default) that thread is also the producer: it
+renders blocks ahead into an audio_engine.BlockRing and the callback only
+copies them out, so a stall on the Python side eats into the lookahead
+instead of becoming an underrun. Parameter changes rewind the ring to the
+block after the one playing next, so they are heard within one block.
+
+Importing this module is cheap: numpy, the synthesis engine and
+sounddevice are only loaded when playback first starts, so the window can
+appear before any of them have been imported.
+"""
+import functools
+import threading
+import time
+
+# Synthesis backends
+SYNTH_EXACT = 'exact'   # np.sin on the wrapped phase
+SYNTH_TABLE = 'table'   # linear interpolation in a precomputed sine table
+
+# Blocks the producer renders ahead of the callback never get smaller than
+# this, so tiny hardware block sizes do not mean tiny (overhead-bound) renders
+MIN_RENDER_FRAMES = 256
+RENDER_FRAMES_AUTO = 512  # used when PortAudio chooses the block size
+
+class StreamSettings:
+    """Output stream configuration, passed to sd.OutputStream as keyword arguments"""
+
+    SAMPLE_RATES = (22050, 44100, 48000, 88200, 96000)
+    BLOCK_SIZES = (0, 64, 128, 256, 512, 1024, 2048, 4096)  # 0 lets PortAudio choose
+    LATENCIES = ('low', 'high')
+    DTYPES = ('float32', 'int32', 'int16')
+    LOOKAHEADS = (0, 2, 4, 8, 16)  # blocks rendered ahead; 0 renders inside the callback
+
+    def __init__(self, sample_rate=44100, blocksize=2048, latency='high',
+                 dtype='float32', device=None, lookahead=4):
+        if dtype not in self.DTYPES:
+            raise ValueError(f"Unsupported sample format: {dtype}")
+        self.sample_rate = int(sample_rate)
+        self.blocksize = int(blocksize)
+        self.latency = self.parse_latency(latency)
+        self.dtype = dtype
+        self.device = device
+        self.lookahead = int(lookahead)
+        if self.lookahead < 0 or self.lookahead == 1:
+            raise ValueError(f"Lookahead must be 0 or at least 2 blocks, got {lookahead}")
+
+    @staticmethod
+    def parse_latency(value):
+        """Accept 'low', 'high' or a latency in seconds"""
+        if value in StreamSettings.LATENCIES:
+            return value
+        latency = float(value)
+        if latency <= 0:
+            raise ValueError(f"Latency must be positive: {value}")
+        return latency
+
+    def render_frames(self):
+        """Frames per block rendered ahead by the producer"""
+        if self.blocksize == 0:
+            return RENDER_FRAMES_AUTO
+        return max(self.blocksize, MIN_RENDER_FRAMES)
+
+    def stream_kwargs(self):
+        """Keyword arguments for sd.OutputStream"""
+        return {
+            'channels': 2,
+            'samplerate': self.sample_rate,
+            'blocksize': self.blocksize,
+            'latency': self.latency,
+            'dtype': self.dtype,
+            'device': self.device,
+        }
+
+    def describe(self):
+        """Short human-readable summary"""
+        block = 'auto' if self.blocksize == 0 else f'{self.blocksize}'
+        block_ms = '' if self.blocksize == 0 else f' ({self.blocksize / self.sample_rate * 1000:.1f} ms)'
+        ahead = f', {self.lookahead} ahead' if self.lookahead else ''
+        return f'{self.sample_rate} Hz, block {block}{block_ms}, {self.dtype}{ahead}'
+
+
+class ParameterStore:
+    """Latest playback parameters, published as one immutable snapshot
+
+    The GUI thread replaces the whole tuple on every change and the audio
+    callback reads it with a single attribute load, so neither side takes
+    a lock and the callback never sees a half-applied update. `changed` is
+    set on every update to wake a producer thread.
+    """
+
+    def __init__(self, left_freq=0.0, right_freq=0.0, volume=0.0):
+        self._snapshot = (float(left_freq), float(right_freq), float(volume))
+        self.changed = threading.Event()
+
+    def set_frequencies(self, left_freq, right_freq):
+        """Publish new left/right frequencies in Hz"""
+        self._snapshot = (float(left_freq), float(right_freq), self._snapshot[2])
+        self.changed.set()
+
+    def set_volume(self, volume):
+        """Publish a new linear volume (0.0 - 1.0)"""
+        self._snapshot = (self._snapshot[0], self._snapshot[1], float(volume))
+        self.changed.set()
+
+    def snapshot(self):
+        """Return (left_freq, right_freq, volume)"""
+        return self._snapshot
+
+
+def load_sounddevice():
+    """Import sounddevice on first use (raises if PortAudio is missing)"""
+    import sounddevice
+    return sounddevice
+
+
+def list_output_devices():
+    """Names of devices that can play stereo output (empty if none can be queried)"""
+    try:
+        return [device['name'] for device in load_sounddevice().query_devices()
+                if device['max_output_channels'] >= 2]
+    except Exception:
+        return []
+
+
+class StreamState:
+    """Synthesis state owned by one stream thread
+
+    Every stream thread builds its own and never reads the engine's
+    attributes for it, so a thread that is still closing never renders
+    with (or into) the state of the stream that replaced it.
+    """
+
+    def __init__(self, oscillator, smoother, session_player=None, ring=None):
+        self.oscillator = oscillator
+        self.smoother = smoother
+        self.session_player = session_player
+        self.ring = ring
+        self.rendered_params = None  # parameters the newest queued block was rendered with
+
+
+class PlaybackEngine:
+    """Plays the current parameters (or a session) on a background stream thread
+
+    Parameters are published through `params` and read without locks.
+    With settings.lookahead blocks of lookahead the stream thread renders
+    into `ring` and the callback copies out of it; with 0 the callback
+    renders directly. Errors raised while opening or running the stream
+    are passed to `on_error` from the stream thread. A visualizer.ScopeTap
+    set as `tap` gets a decimated copy of every block the callback plays.
+    """
+
+    def __init__(self, settings=None, mode=SYNTH_EXACT, stream_factory=None, on_error=None):
+        self.settings = settings or StreamSettings()
+        self.mode = mode
+        self.stream_factory = stream_factory
+        self.on_error = on_error
+        self.params = ParameterStore()
+        self.session = None          # session.Session to play instead of params
+        self.instrumentation = None  # instrumentation.Instrumentation, or None when off
+        self.tap = None              # visualizer.ScopeTap fed with every played block, or None
+        self.oscillator = None
+        self.smoother = None
+        self.session_player = None
+        self.ring = None
+        self.stream = None
+        self.thread = None
+        self.xrun_count = 0
+        self.output_latency = 0.0
+        self._stop = threading.Event()
+
+    @property
+    def playing(self):
+        """True while the stream thread is running"""
+        return self.thread is not None and self.thread.is_alive() and not self._stop.is_set()
+
+    def start(self):
+        """Open the output stream on a new thread, which builds the synthesis state first
+
+        Raises RuntimeError if the previous stream thread has not finished
+        closing its stream within a second.
+        """
+        if self.playing:
+            return
+        # The previous stream must be closed before any of its state is replaced
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            if self.thread.is_alive():
+                raise RuntimeError("The previous output stream is still closing; try again")
+        self.oscillator = self.smoother = self.session_player = self.ring = None
+        self.xrun_count = 0
+        self.output_latency = 0.0
+
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(self._stop,), daemon=True)
+        self.thread.start()
+
+    def _build_state(self):
+        """Fresh oscillator, smoother, session player and ring for one stream
+
+        Runs on the stream thread: importing numpy and preparing the kernel
+        for the stream's sample format can take a second the first time,
+        which would otherwise freeze the window that pressed Play.
+        """
+        import numpy as np
+        import audio_engine
+        from session import SessionPlayer
+
+        settings = self.settings
+        dtype = np.dtype(settings.dtype)
+        oscillator = audio_engine.SineOscillator(2, settings.sample_rate, self.mode,
+                                                 max_frames=max(settings.blocksize, 4096))
+        oscillator.prepare(dtype)
+        # Start silent so playback fades in instead of clicking on
+        left_freq, right_freq, volume = self.params.snapshot()
+        smoother = audio_engine.ParameterSmoother(settings.sample_rate,
+                                                  freqs=(left_freq, right_freq), gain=0.0)
+        player = SessionPlayer(self.session, oscillator) if self.session is not None else None
+        ring = (audio_engine.BlockRing(settings.lookahead, settings.render_frames(), dtype=dtype)
+                if settings.lookahead else None)
+
+        # Published for set_mode(), underruns() and scripts; the thread itself uses `state`
+        self.oscillator, self.smoother, self.session_player, self.ring = (
+            oscillator, smoother, player, ring)
+        oscillator.mode = self.mode  # in case set_mode() ran while this was being built
+        return StreamState(oscillator, smoother, player, ring)
+
+    def stop(self):
+        """Ask the stream thread to close the stream; returns without waiting"""
+        self._stop.set()
+        self.params.changed.set()  # wake the producer
+
+    def join(self, timeout=None):
+        """Wait for the stream thread to finish closing the stream"""
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def set_mode(self, mode):
+        """Switch between exact and table synthesis, also while playing"""
+        self.mode = mode
+        if self.oscillator is not None:
+            self.oscillator.mode = mode
+
+    def cpu_load(self):
+        """Fraction of the callback budget used, as reported by the stream (0 if unknown)"""
+        try:
+            return self.stream.cpu_load
+        except Exception:
+            return 0.0
+
+    def underruns(self):
+        """Callbacks that found the lookahead ring empty since playback started"""
+        return self.ring.underruns if self.ring is not None else 0
+
+    def _run(self, stop):
+        """Build the state, then keep the output stream open until `stop` is set"""
+        try:
+            state = self._build_state()
+            factory = self.stream_factory or load_sounddevice().OutputStream
+            callback = functools.partial(
+                self._callback if state.ring is None else self._ring_callback, state)
+            if state.ring is not None:
+                self._produce(state)  # pre-fill before the first callback
+            with factory(callback=callback, **self.settings.stream_kwargs()) as stream:
+                self.stream = stream
+                if state.ring is None:
+                    stop.wait()
+                else:
+                    self._producer_loop(stop, state)
+            self.stream = None
+        except Exception as e:
+            self.stream = None
+            stop.set()
+            if self.on_error is not None:
+                self.on_error(e)
+
+    def _producer_loop(self, stop, state):
+        """Top up the ring every half block, and at once when the parameters change"""
+        changed = self.params.changed
+        # The callback never signals (Event.set() takes a lock on the audio
+        # thread), so poll often enough that a freed slot waits at most half a block
+        timeout = state.ring.frames / self.settings.sample_rate / 2
+        while not stop.is_set():
+            changed.wait(timeout)
+            changed.clear()
+            self._produce(state)
+
+    def _produce(self, state):
+        """Re-render stale queued blocks, then fill every free slot"""
+        ring = state.ring
+        player = state.session_player
+        oscillator = state.oscillator
+        smoother = state.smoother
+        if player is None:
+            params = self.params.snapshot()
+            if state.rendered_params is not None and params != state.rendered_params:
+                saved = ring.rewind(keep=1)
+                if saved is not None:
+                    oscillator.restore_state(saved[0])
+                    smoother.restore_state(saved[1])
+            state.rendered_params = params
+
+        while ring.space():
+            block = ring.writable()
+            if player is not None:
+                player.render_into(block)
+                ring.commit(player.save_state())
+                continue
+            left_freq, right_freq, volume = state.rendered_params
+            start_freqs, freqs, start_gain, gain = smoother.advance(
+                len(block), (left_freq, right_freq), volume)
+            oscillator.render_into(block, freqs, gain, start_freqs, start_gain)
+            ring.commit((oscillator.save_state(), smoother.save_state()))
+
+    def _ring_callback(self, state, outdata, frames, time_info, status):
+        """Audio callback with lookahead: copy the next frames out of the ring"""
+        recorder = self.instrumentation
+        if recorder is not None:
+            started = time.perf_counter()
+        if status.output_underflow:
+            self.xrun_count += 1
+        self.output_latency = time_info.outputBufferDacTime - time_info.currentTime
+
+        state.ring.read_into(outdata)
+        tap = self.tap
+        if tap is not None:
+            tap.write(outdata)
+
+        if recorder is not None:
+            recorder.callbacks.record(started, time.perf_counter(), frames,
+                                      self.settings.sample_rate, status.output_underflow)
+
+    def _callback(self, state, outdata, frames, time_info, status):
+        """Audio callback without lookahead: render the next block straight into the output buffer"""
+        recorder = self.instrumentation
+        if recorder is not None:
+            started = time.perf_counter()
+        if status.output_underflow:
+            self.xrun_count += 1
+        self.output_latency = time_info.outputBufferDacTime - time_info.currentTime
+
+        if state.session_player is not None:
+            state.session_player.render_into(outdata)
+        else:
+            left_freq, right_freq, volume = self.params.snapshot()
+
+            # Glide towards parameter changes over the block instead of jumping
+            start_freqs, freqs, start_gain, gain = state.smoother.advance(
+                frames, (left_freq, right_freq), volume)
+            state.oscillator.render_into(outdata, freqs, gain, start_freqs, start_gain)
+        tap = self.tap
+        if tap is not None:
+            tap.write(outdata)
+
+        if recorder is not None:
+            recorder.callbacks.record(started, time.perf_counter(), frames,
+                                      self.settings.sample_rate, status.output_underflow)
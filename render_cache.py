@@ -0,0 +1,172 @@
+"""On-disk cache of finished renders.
+
+Entries are keyed by a hash of every parameter that affects the output
+bytes, so a repeated export is served by copying (or hardlinking) the
+cached file instead of synthesizing it again. The total size is bounded
+and the least recently used entries are evicted first; use is tracked by
+access time, so serving an entry never changes its modification time.
+
+Hardlinked outputs share storage with the cache entry, so they must not be
+modified in place; that is why linking is opt-in, and why the export
+writers in audio_engine unlink an existing output before writing.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+# Bump whenever synthesis or encoding changes the bytes produced for the same parameters
+CACHE_VERSION = 3
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def default_cache_dir():
+    """Per-user cache directory (BINAURAL_CACHE_DIR overrides it)"""
+    override = os.environ.get('BINAURAL_CACHE_DIR')
+    if override:
+        return override
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'binaural_wave_generator', 'renders')
+
+
+def render_key(left_freq, right_freq, volume, sample_rate, frames, fmt,
+               bits=16, synthesis='exact', bitrate=None, session=None, layers=None,
+               floating=False, dither='none'):
+    """Content address for a render with these parameters
+
+    `session` is a session digest; session renders ignore the constant
+    frequencies and volume. `layers` is any JSON-serializable description
+    of extra layers such as noise beds.
+    """
+    params = {
+        'version': CACHE_VERSION,
+        'left': float(left_freq),
+        'right': float(right_freq),
+        'volume': float(volume),
+        'sample_rate': int(sample_rate),
+        'frames': int(frames),
+        'format': fmt,
+        'bits': int(bits) if fmt == 'wav' else None,
+        'synthesis': synthesis,
+        'bitrate': bitrate if fmt != 'wav' else None,
+        'floating': bool(floating) if fmt == 'wav' else False,
+        'dither': None if floating else dither,
+    }
+    if session is not None:
+        params['session'] = session
+    if layers is not None:
+        params['layers'] = layers
+    encoded = json.dumps(params, sort_keys=True).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class RenderCache:
+    """Size-bounded LRU cache of rendered files"""
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, link=False):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.link = link
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key, fmt):
+        return os.path.join(self.directory, f'{key}.{fmt}')
+
+    def fetch(self, key, fmt, destination):
+        """Materialize a cached render at `destination`; returns False on a miss"""
+        path = self._path(key, fmt)
+        if not os.path.exists(path):
+            self.misses += 1
+            return False
+
+        try:
+            _materialize(path, destination, self.link)
+            # Mark as recently used by access time only: with --link the entry
+            # and the user's file are one inode, whose mtime should stay put
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except OSError:
+            self.misses += 1
+            return False
+
+        self.hits += 1
+        return True
+
+    def store(self, key, fmt, source):
+        """Add a finished render to the cache, then evict down to max_bytes"""
+        size = os.path.getsize(source)
+        if size > self.max_bytes:
+            return
+
+        path = self._path(key, fmt)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(source, temp_path)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+
+        self.evict()
+
+    def entries(self):
+        """(last use, size, path) for every cached file, least recently used first"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def size(self):
+        """Total bytes currently cached"""
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits max_bytes"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        """Remove every cached render"""
+        for _, _, path in self.entries():
+            os.remove(path)
+
+    def describe(self):
+        """Short hit/miss summary for status displays"""
+        hits = 'hit' if self.hits == 1 else 'hits'
+        misses = 'miss' if self.misses == 1 else 'misses'
+        return f'Cache {self.hits} {hits} / {self.misses} {misses}'
+
+
+def _materialize(source, destination, link):
+    """Hardlink (when asked and on the same filesystem) or copy a cache entry"""
+    if os.path.exists(destination):
+        os.remove(destination)
+    if link:
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            pass
+    shutil.copyfile(source, destination)
@@ -0,0 +1,504 @@
+"""Headless renderer for the Binaural Wave Generator.
+
+Renders binaural beats straight to WAV/MP3 without a display or an audio
+device. Only numpy and the standard library are imported, so it starts
+quickly and runs in containers.
+
+    python render_cli.py --left 200 --right 210 --duration 30 -o alpha.wav
+    python render_cli.py --jobs renders.json
+    python render_cli.py --jobs renders.csv --output-dir out/ --workers 8
+    python render_cli.py --session theta_descent.json -o theta.flac
+
+A job file is either a JSON list of objects or a CSV file with a header
+row. Each job may set left, right, volume (0-100), duration (minutes),
+format (wav/mp3/ogg/opus/m4a/flac), bits (16/24/32, WAV only), floating
+(32-bit float WAV), dither (none/tpdf/shaped), noise
+(white/pink/brown bed under the tone), noise_volume (0-100) and output;
+anything missing falls back to the command line values. A job with a
+session (path to a session file, see session.py) renders that schedule
+instead of a constant tone, and its duration comes from the session.
+
+With --workers > 1 jobs are rendered in a process pool, and WAV renders
+longer than --segment-seconds are split into block-aligned segments that
+workers write straight into a memory map of their slice of the output
+file. WAV files over 4 GB get an RF64 header. The result is
+byte-identical to a serial render. Encoded formats are piped through
+ffmpeg one job per worker.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import audio_engine
+import instrumentation
+import render_cache
+import session as session_module
+
+FORMATS = ('wav',) + tuple(audio_engine.ENCODERS)
+
+BIT_DEPTHS = tuple(8 * width for width in audio_engine.PCM_FULL_SCALE)
+
+# Long renders are split into segments of about this many seconds for the process pool
+SEGMENT_SECONDS = 300
+
+
+class RenderJob:
+    """One render: frequencies, volume, duration and output file"""
+
+    def __init__(self, left=856.0, right=856.0, volume=30.0, duration=10.0,
+                 format='wav', output=None, sample_rate=44100,
+                 synthesis=audio_engine.SYNTH_EXACT, bitrate='192k', bits=16, session=None,
+                 noise=None, noise_volume=10.0, floating=False, dither=audio_engine.DITHER_NONE):
+        self.session_path = session
+        self.session = session_module.load_session(session) if session else None
+        if self.session is not None:
+            duration = self.session.duration()
+        self.left = float(left)
+        self.right = float(right)
+        self.volume = float(volume)
+        self.duration = float(duration)
+        self.format = str(format).lower()
+        self.sample_rate = int(sample_rate)
+        self.synthesis = synthesis
+        self.bitrate = bitrate
+        self.bits = int(bits)
+        if isinstance(floating, str):  # from CSV job files
+            floating = floating.strip().lower() in ('1', 'true', 'yes')
+        self.floating = bool(floating)
+        self.dither = str(dither or audio_engine.DITHER_NONE).lower()
+        self.noise = str(noise).lower() if noise else None
+        self.noise_volume = float(noise_volume)
+        self.output = output or self.default_filename()
+        self.validate()
+
+    def validate(self):
+        """Raise ValueError for out-of-range parameters"""
+        if self.format not in FORMATS:
+            raise ValueError(f"Unsupported format '{self.format}' (expected one of {', '.join(FORMATS)})")
+        if not 0 <= self.volume <= 100:
+            raise ValueError(f"Volume must be between 0 and 100, got {self.volume:g}")
+        if self.duration <= 0:
+            raise ValueError(f"Duration must be positive, got {self.duration:g} minutes")
+        if self.left < 0 or self.right < 0:
+            raise ValueError("Frequencies must not be negative")
+        if self.synthesis not in (audio_engine.SYNTH_EXACT, audio_engine.SYNTH_TABLE):
+            raise ValueError(f"Unknown synthesis mode: {self.synthesis}")
+        if self.noise is not None:
+            if self.noise not in audio_engine.NOISE_COLORS:
+                raise ValueError(f"Unknown noise color '{self.noise}' "
+                                 f"(expected one of {', '.join(audio_engine.NOISE_COLORS)})")
+            if not 0 <= self.noise_volume <= 100:
+                raise ValueError(f"Noise volume must be between 0 and 100, got {self.noise_volume:g}")
+            if self.session is not None:
+                raise ValueError("Noise beds are not supported for session renders")
+        if self.bits not in BIT_DEPTHS:
+            raise ValueError(f"Bit depth must be one of {', '.join(map(str, BIT_DEPTHS))}, got {self.bits}")
+        if self.floating and (self.bits != 32 or self.format != 'wav'):
+            raise ValueError("Float samples need a 32-bit WAV (bits 32, format wav)")
+        if self.dither not in audio_engine.DITHERS:
+            raise ValueError(f"Unknown dither '{self.dither}' "
+                             f"(expected one of {', '.join(audio_engine.DITHERS)})")
+
+    def default_filename(self):
+        """Same naming scheme as the desktop app's save dialog"""
+        if self.session is not None:
+            name = os.path.splitext(os.path.basename(self.session_path))[0]
+            return f"{name}.{self.format}"
+        return f"binaural_{int(self.left)}-{int(self.right)}.{self.format}"
+
+    def total_frames(self):
+        """Number of frames in the finished render"""
+        if self.session is not None:
+            return self.session.total_frames(self.sample_rate)
+        return int(self.sample_rate * (self.duration * 60))
+
+    def sampwidth(self):
+        """Bytes per WAV sample"""
+        return self.bits // 8
+
+    def blocks(self, start_frame=0, stop_frame=None):
+        """Stream the rendered audio (or a block-aligned segment of it) as float32 blocks"""
+        if self.session is not None:
+            if start_frame or stop_frame is not None:
+                raise ValueError("Session renders cannot be split into segments")
+            return session_module.iter_session_blocks(self.session, self.sample_rate,
+                                                      mode=self.synthesis)
+        if self.noise is not None:
+            if start_frame or stop_frame is not None:
+                raise ValueError("Renders with a noise bed cannot be split into segments")
+            gain = self.volume / 100.0
+            voices = [audio_engine.Voice(self.left, (gain, 0.0)),
+                      audio_engine.Voice(self.right, (0.0, gain))]
+            bed = audio_engine.NoiseBed(self.noise, self.noise_volume / 100.0)
+            bank = audio_engine.VoiceBank(voices, [bed], sample_rate=self.sample_rate,
+                                          mode=self.synthesis,
+                                          max_frames=audio_engine.EXPORT_BLOCK_FRAMES)
+            return audio_engine.iter_voice_blocks(bank, self.duration * 60)
+        return audio_engine.iter_binaural_blocks(self.left, self.right,
+                                                 self.volume / 100.0,
+                                                 self.duration * 60,
+                                                 sample_rate=self.sample_rate,
+                                                 mode=self.synthesis,
+                                                 start_frame=start_frame,
+                                                 stop_frame=stop_frame)
+
+    def cache_key(self):
+        """Render cache address for this job's output bytes"""
+        return render_cache.render_key(self.left, self.right, self.volume / 100.0,
+                                       self.sample_rate, self.total_frames(), self.format,
+                                       bits=self.bits, synthesis=self.synthesis,
+                                       bitrate=self.bitrate, floating=self.floating,
+                                       dither=self.dither,
+                                       session=self.session.digest() if self.session else None,
+                                       layers=self.layers())
+
+    def layers(self):
+        """Extra layers for the cache key (None for a plain binaural render)"""
+        if self.noise is None:
+            return None
+        return {'noise': self.noise, 'noise_volume': self.noise_volume}
+
+    def segmentable(self):
+        """True when the render can be split into segments for the process pool"""
+        return self.format == 'wav' and self.session is None and self.noise is None
+
+    def describe(self):
+        """One-line summary of what is rendered"""
+        if self.session is not None:
+            return self.session.describe()
+        noise = f" + {self.noise} noise" if self.noise else ''
+        return f"{self.left:g}/{self.right:g} Hz{noise}, {self.duration:g} min"
+
+    def render(self, stats=None):
+        """Render to disk; returns the path written
+
+        `stats` is an optional instrumentation.StageRecorder for stage timings.
+        """
+        directory = os.path.dirname(self.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if self.format != 'wav':
+            return audio_engine.export_encoded(self.output, self.blocks(), self.format,
+                                               sample_rate=self.sample_rate,
+                                               bitrate=self.bitrate, stats=stats,
+                                               dither=self.dither)
+
+        audio_engine.write_wav_blocks(self.output, self.blocks(),
+                                      sample_rate=self.sample_rate,
+                                      sampwidth=self.sampwidth(),
+                                      frames=self.total_frames(),
+                                      stats=stats,
+                                      floating=self.floating,
+                                      dither=self.dither)
+        return self.output
+
+
+def _render_job(job):
+    """Worker: render a whole job"""
+    return job.render()
+
+
+def _render_segment(job, start_frame, stop_frame):
+    """Worker: write frames [start_frame, stop_frame) into the job's preallocated WAV"""
+    view = audio_engine.wav_memmap(job.output, job.total_frames(), sampwidth=job.sampwidth(),
+                                   start_frame=start_frame, stop_frame=stop_frame,
+                                   floating=job.floating)
+    audio_engine.fill_pcm(view, job.blocks(start_frame, stop_frame), job.sampwidth(),
+                          floating=job.floating, dither=job.dither, start_frame=start_frame)
+    view.flush()
+    return stop_frame - start_frame
+
+
+def plan_segments(job, segment_seconds=SEGMENT_SECONDS):
+    """Split a job into (start, stop) frame ranges aligned to export blocks"""
+    block = audio_engine.EXPORT_BLOCK_FRAMES
+    blocks_per_segment = max(1, round(segment_seconds * job.sample_rate / block))
+    step = blocks_per_segment * block
+    total = job.total_frames()
+    return [(start, min(start + step, total)) for start in range(0, total, step)]
+
+
+def preallocate_wav(job):
+    """Create the job's WAV with its final header and size so workers can fill it"""
+    directory = os.path.dirname(job.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    audio_engine.preallocate_wav(job.output, job.total_frames(), job.sample_rate,
+                                 sampwidth=job.sampwidth(), floating=job.floating)
+
+
+def render_batch(jobs, workers=None, segment_seconds=SEGMENT_SECONDS, on_done=None,
+                 cache=None):
+    """Render jobs across a process pool
+
+    Returns a list of (job, path or exception) in job order. `on_done` is
+    called with each job and its result as soon as the job completes.
+    Cache hits are served before anything is sent to the pool.
+    """
+    results = [None] * len(jobs)
+    pending = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for index, job in enumerate(jobs):
+            if fetch_cached(job, cache):
+                results[index] = (job, job.output)
+                if on_done:
+                    on_done(job, job.output)
+                continue
+
+            if not job.segmentable():
+                pending[index] = 1
+                futures[pool.submit(_render_job, job)] = index
+                continue
+
+            try:
+                preallocate_wav(job)
+            except OSError as e:
+                results[index] = (job, e)
+                if on_done:
+                    on_done(job, e)
+                continue
+
+            segments = plan_segments(job, segment_seconds)
+            pending[index] = len(segments)
+            for start, stop in segments:
+                futures[pool.submit(_render_segment, job, start, stop)] = index
+
+        for future in as_completed(futures):
+            index = futures[future]
+            if index not in pending:
+                continue  # job already failed
+            job = jobs[index]
+
+            error = future.exception()
+            if error is not None:
+                del pending[index]
+                results[index] = (job, error)
+                if job.format == 'wav' and os.path.exists(job.output):
+                    os.remove(job.output)
+            else:
+                pending[index] -= 1
+                if pending[index]:
+                    continue
+                del pending[index]
+                output = job.output if job.format == 'wav' else future.result()
+                results[index] = (job, output)
+                store_cached(job, cache, output)
+
+            if on_done:
+                on_done(job, results[index][1])
+
+    return results
+
+
+def fetch_cached(job, cache):
+    """Serve a job from the render cache; returns True on a hit"""
+    if cache is None:
+        return False
+    directory = os.path.dirname(job.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return cache.fetch(job.cache_key(), job.format, job.output)
+
+
+def store_cached(job, cache, output):
+    """Add a finished render to the cache (not WAV fallbacks of encoded jobs)"""
+    if cache is not None and output == job.output:
+        cache.store(job.cache_key(), job.format, output)
+
+
+def render_cached(job, cache=None, stats=None):
+    """Render a job, reusing an identical earlier render when cached"""
+    if fetch_cached(job, cache):
+        return job.output
+    output = job.render(stats)
+    store_cached(job, cache, output)
+    return output
+
+
+def load_jobs(path, defaults):
+    """Read a JSON or CSV job file into a list of RenderJob"""
+    with open(path, newline='') as f:
+        if path.lower().endswith('.csv'):
+            rows = [{key: value for key, value in row.items() if value not in (None, '')}
+                    for row in csv.DictReader(f)]
+        else:
+            rows = json.load(f)
+            if isinstance(rows, dict):
+                rows = rows.get('jobs', [])
+
+    jobs = []
+    for number, row in enumerate(rows, 1):
+        params = dict(defaults)
+        params.update(row)
+        try:
+            jobs.append(RenderJob(**params))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"{path}: job {number}: {e}") from None
+    return jobs
+
+
+def parse_args(argv=None):
+    """Parse command line options for the headless renderer"""
+    parser = argparse.ArgumentParser(description='Render binaural beats without a GUI')
+    parser.add_argument('--left', type=float, default=856.0,
+                        help='left ear frequency in Hz (default: 856)')
+    parser.add_argument('--right', type=float, default=856.0,
+                        help='right ear frequency in Hz (default: 856)')
+    parser.add_argument('--volume', type=float, default=30.0,
+                        help='volume 0-100 (default: 30)')
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='duration in minutes (default: 10)')
+    parser.add_argument('--format', choices=FORMATS, default=None,
+                        help='output format (default: from the output extension, else wav)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='output file (default: binaural_<left>-<right>.<format>)')
+    parser.add_argument('--session', default=None,
+                        help='render a session file (JSON schedule of segments) '
+                             'instead of a constant tone')
+    parser.add_argument('--noise', choices=audio_engine.NOISE_COLORS, default=None,
+                        help='layer a noise bed under the tone')
+    parser.add_argument('--noise-volume', type=float, default=10.0,
+                        help='noise bed volume 0-100 (default: 10)')
+    parser.add_argument('--jobs', default=None,
+                        help='JSON or CSV file listing renders; overrides the single-render options')
+    parser.add_argument('--output-dir', default=None,
+                        help='directory for job outputs with relative paths')
+    parser.add_argument('--sample-rate', type=int, default=44100,
+                        help='sample rate in Hz (default: 44100)')
+    parser.add_argument('--synthesis', choices=(audio_engine.SYNTH_EXACT, audio_engine.SYNTH_TABLE),
+                        default=audio_engine.SYNTH_EXACT,
+                        help='synthesis backend (default: exact)')
+    parser.add_argument('--bits', type=int, choices=BIT_DEPTHS, default=16,
+                        help='WAV bit depth (default: 16)')
+    parser.add_argument('--float', dest='floating', action='store_true',
+                        help='write 32-bit float WAV samples (with --bits 32)')
+    parser.add_argument('--dither', choices=audio_engine.DITHERS, default=audio_engine.DITHER_NONE,
+                        help='dither before rounding to integer samples: triangular (tpdf) or '
+                             'high-passed triangular (shaped) noise (default: none)')
+    parser.add_argument('--bitrate', default='192k',
+                        help='MP3 bitrate passed to ffmpeg (default: 192k)')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='worker processes; 0 uses every core (default: 1)')
+    parser.add_argument('--segment-seconds', type=float, default=SEGMENT_SECONDS,
+                        help=f'split renders into segments of this length across workers '
+                             f'(default: {SEGMENT_SECONDS})')
+    parser.add_argument('--cache', action='store_true',
+                        help='reuse identical earlier renders from the render cache')
+    parser.add_argument('--cache-dir', default=None,
+                        help='render cache directory (implies --cache; '
+                             'default: the per-user cache directory)')
+    parser.add_argument('--cache-size', type=float, default=render_cache.DEFAULT_MAX_BYTES / 1024 ** 2,
+                        help='render cache size limit in MB (default: %(default).0f)')
+    parser.add_argument('--link', action='store_true',
+                        help='hardlink cache hits instead of copying them')
+    parser.add_argument('--stats', default=None,
+                        help='write export stage timings (synthesis/quantize/write/encode) '
+                             'to this JSON file; serial renders only')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='only print errors')
+    return parser.parse_args(argv)
+
+
+def build_jobs(args):
+    """Turn parsed arguments into the list of jobs to render"""
+    defaults = {
+        'left': args.left,
+        'right': args.right,
+        'volume': args.volume,
+        'duration': args.duration,
+        'sample_rate': args.sample_rate,
+        'synthesis': args.synthesis,
+        'bitrate': args.bitrate,
+        'bits': args.bits,
+        'floating': args.floating,
+        'dither': args.dither,
+        'noise': args.noise,
+        'noise_volume': args.noise_volume,
+    }
+
+    if args.jobs:
+        if args.format:
+            defaults['format'] = args.format
+        jobs = load_jobs(args.jobs, defaults)
+    else:
+        fmt = args.format
+        if fmt is None and args.output:
+            fmt = os.path.splitext(args.output)[1].lstrip('.').lower() or None
+        jobs = [RenderJob(format=fmt or 'wav', output=args.output, session=args.session,
+                          **defaults)]
+
+    if args.output_dir:
+        for job in jobs:
+            if not os.path.isabs(job.output):
+                job.output = os.path.join(args.output_dir, job.output)
+    return jobs
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        jobs = build_jobs(args)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    cache = None
+    if args.cache or args.cache_dir:
+        try:
+            cache = render_cache.RenderCache(args.cache_dir,
+                                             max_bytes=int(args.cache_size * 1024 ** 2),
+                                             link=args.link)
+        except OSError as e:
+            print(f"warning: render cache disabled: {e}", file=sys.stderr)
+
+    recorder = instrumentation.Instrumentation() if args.stats else None
+    if recorder is not None and args.workers != 1:
+        print("warning: --stats only records serial renders (-j 1)", file=sys.stderr)
+
+    start = time.perf_counter()
+    done = []
+
+    def report(job, result):
+        done.append(result)
+        number = f"[{len(done)}/{len(jobs)}]"
+        if isinstance(result, Exception):
+            print(f"{number} failed: {job.output}: {result}", file=sys.stderr)
+        elif not args.quiet:
+            note = '' if result == job.output else ' (ffmpeg not found, saved as WAV)'
+            print(f"{number} {result}: {job.describe()} "
+                  f"at {time.perf_counter() - start:.1f} s{note}")
+
+    if args.workers == 1:
+        for job in jobs:
+            try:
+                report(job, render_cached(job, cache,
+                                          recorder.export if recorder is not None else None))
+            except Exception as e:
+                report(job, e)
+    else:
+        render_batch(jobs, workers=args.workers or os.cpu_count(),
+                     segment_seconds=args.segment_seconds, on_done=report, cache=cache)
+
+    if cache is not None and not args.quiet:
+        print(f"{cache.describe()}, {cache.size() / 1024 ** 2:.0f} MB in {cache.directory}")
+
+    if recorder is not None:
+        try:
+            recorder.dump_json(args.stats)
+        except OSError as e:
+            print(f"warning: could not write stats: {e}", file=sys.stderr)
+
+    failures = sum(isinstance(result, Exception) for result in done)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
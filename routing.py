@@ -0,0 +1,487 @@
+"""Multi-room output: independent binaural rooms on channel pairs of one or more devices.
+
+A room is a tone (or a session schedule) played on two output channels of
+one device, e.g. rooms A-D on outputs 1-2, 3-4, 5-6 and 7-8 of an 8-channel
+interface. Every room of a device is rendered together in one vectorized
+pass per block, and a single producer thread feeds one output stream per
+device, so adding rooms adds columns to the same NumPy operations rather
+than threads and streams:
+
+    python routing.py rooms.json                  # play on the configured devices
+    python routing.py rooms.json --sink null      # run headless, no audio device
+    python routing.py rooms.json --sink file -o out/ --seconds 60
+
+A rooms file looks like:
+
+    {"sample_rate": 48000, "blocksize": 512,
+     "devices": {"Studio 1824": 8},
+     "rooms": [
+        {"name": "A", "device": "Studio 1824", "channels": [1, 2], "left": 200, "right": 210},
+        {"name": "B", "device": "Studio 1824", "channels": [3, 4], "session": "theta.json"},
+        {"name": "C", "channels": [1, 2], "left": 150, "right": 156, "volume": 20}
+     ]}
+
+Channels are numbered from 1, as on the interface. Rooms without a device
+play on the default one. `devices` optionally gives a device's channel
+count; otherwise streams open with as many channels as the rooms use. Rooms
+sharing channels are mixed. Volumes are 0-100, as in render_cli job files.
+
+The devices run on their own clocks, so rooms on different devices drift
+apart slowly. Each device's rooms are rendered as its own ring drains, so
+a device with a fast clock never waits for a slow one to make room.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+import audio_engine
+import playback
+import session as session_module
+
+
+class Room:
+    """One listening room: a tone or a session on a channel pair of one device
+
+    Live parameter changes go through `params`, exactly as for the
+    desktop app's PlaybackEngine. A room with a session follows the
+    schedule instead.
+    """
+
+    def __init__(self, name, channels=(0, 1), device=None, left=200.0, right=210.0,
+                 volume=0.3, session=None):
+        channels = tuple(int(ch) for ch in channels)
+        if len(channels) != 2 or min(channels) < 0 or channels[0] == channels[1]:
+            raise ValueError(f"Room '{name}' needs two different output channels, got {channels}")
+        if left < 0 or right < 0:
+            raise ValueError(f"Room '{name}': frequencies must not be negative")
+        if not 0 <= volume <= 1:
+            raise ValueError(f"Room '{name}': volume must be between 0.0 and 1.0, got {volume:g}")
+        self.name = name
+        self.channels = channels
+        self.device = device
+        self.params = playback.ParameterStore(left, right, volume)
+        self.session = session
+
+    @classmethod
+    def from_dict(cls, data, base_dir='.'):
+        """Build a room from a rooms-file entry (1-based channels, volume 0-100)"""
+        data = dict(data)
+        name = str(data.pop('name', 'Room'))
+        channels = [int(ch) - 1 for ch in data.pop('channels', (1, 2))]
+        spec = data.pop('session', None)
+        if isinstance(spec, str):
+            spec = session_module.load_session(os.path.join(base_dir, spec))
+        elif spec is not None:
+            spec = session_module.Session.from_dict(spec)
+        device = data.pop('device', None)
+        left = float(data.pop('left', 200.0))
+        right = float(data.pop('right', 210.0))
+        volume = float(data.pop('volume', 30.0))
+        if not 0 <= volume <= 100:
+            raise ValueError(f"Room '{name}': volume must be between 0 and 100, got {volume:g}")
+        volume /= 100
+        if data:
+            raise ValueError(f"Room '{name}': unknown fields {', '.join(sorted(data))}")
+        return cls(name, channels, device, left, right, volume, spec)
+
+    def describe(self):
+        """Short summary for status output"""
+        where = f"{self.device or 'default'} {self.channels[0] + 1}-{self.channels[1] + 1}"
+        if self.session is not None:
+            return f"{self.name} ({where}): {self.session.describe()}"
+        left, right, volume = self.params.snapshot()
+        return f"{self.name} ({where}): {left:g}/{right:g} Hz at {volume * 100:g}%"
+
+
+def device_layout(rooms, device_channels=None):
+    """Ordered [(device, channel count)] for every device the rooms use"""
+    device_channels = device_channels or {}
+    layout = {}
+    for room in rooms:
+        used = max(room.channels) + 1
+        layout[room.device] = max(layout.get(room.device, 0), used)
+    for device, count in layout.items():
+        configured = device_channels.get(device)
+        if configured is not None:
+            if configured < count:
+                raise ValueError(f"Device {device or 'default'} has {configured} channels "
+                                 f"but rooms use {count}")
+            layout[device] = configured
+    return list(layout.items())
+
+
+class RoomBank:
+    """Renders every room's two channels in one vectorized pass per block
+
+    Each room contributes two rows to a (rows, frames) phase array built
+    with the SineOscillator glide formula, broadcast over column vectors:
+    phase = p0 + f0*n/sr + (f1 - f0)*n(n-1)/(2*N*sr). One sine pass makes
+    the waveforms and one matrix multiply routes (and mixes) the rows onto
+    the device channels, with the room gains folded into the routing
+    matrix while they hold steady. Frequencies and gains glide with the
+    same exponential smoothing as ParameterSmoother, vectorized across
+    rooms; session rooms follow their schedule at block granularity.
+    """
+
+    def __init__(self, rooms, layout, sample_rate=44100, mode=audio_engine.SYNTH_EXACT,
+                 max_frames=4096, glide_seconds=audio_engine.GLIDE_SECONDS, tolerance=1e-4):
+        if mode not in (audio_engine.SYNTH_EXACT, audio_engine.SYNTH_TABLE):
+            raise ValueError(f"Unknown synthesis mode: {mode}")
+        self.rooms = list(rooms)
+        self.layout = list(layout)
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.glide_seconds = glide_seconds
+        self.tolerance = tolerance
+        self.table = audio_engine.sine_table()
+        count = len(self.rooms)
+        rows = 2 * count
+
+        self.players = [session_module.SessionPlayer(room.session, None, sample_rate)
+                        if room.session is not None else None for room in self.rooms]
+        self._smoothed = np.array([player is None for player in self.players])
+        self._smoothed_rows = np.repeat(self._smoothed, 2)
+
+        # Output channel of every device, stacked: device i owns rows offsets[i]:offsets[i+1]
+        offsets = [0]
+        for _, channels in self.layout:
+            offsets.append(offsets[-1] + channels)
+        self.offsets = offsets
+        index = {device: i for i, (device, _) in enumerate(self.layout)}
+        self._route = np.zeros((offsets[-1], rows))
+        for number, room in enumerate(self.rooms):
+            base = offsets[index[room.device]]
+            self._route[base + room.channels[0], 2 * number] = 1.0
+            self._route[base + room.channels[1], 2 * number + 1] = 1.0
+        self._scaled_route = np.empty_like(self._route)
+
+        # Start silent so every room fades in, as PlaybackEngine does
+        self.phase = np.zeros((rows, 1))
+        self.freqs = np.array([f for target in self._targets(0) for f in target[0]])
+        self.gains = np.zeros(count)
+        self.max_frames = 0
+        self._allocate(max_frames)
+
+    def _allocate(self, max_frames):
+        """(Re)allocate the per-block scratch buffers"""
+        rows = max(2 * len(self.rooms), 1)
+        self.max_frames = max_frames
+        self._ramp = np.arange(max_frames, dtype=np.float64).reshape(1, max_frames)
+        self._ramp_sq = self._ramp * (self._ramp - 1)
+        self._phase = np.empty(rows * max_frames)
+        self._wave = np.empty(rows * max_frames)
+        self._scratch = np.empty(rows * max_frames)
+        self._upper = np.empty(rows * max_frames)
+        self._index = np.empty(rows * max_frames, dtype=np.intp)
+        self._mixed = np.empty(max(self.offsets[-1], 1) * max_frames)
+        self._wrap = np.empty((rows, 1))
+
+    def _targets(self, frames):
+        """((left, right), gain) every room is heading for at the end of the next block"""
+        targets = []
+        for room, player in zip(self.rooms, self.players):
+            if player is None:
+                left, right, volume = room.params.snapshot()
+                targets.append(((left, right), volume))
+            else:
+                targets.append(player.values_at(player.position + frames))
+        return targets
+
+    def _advance(self, frames):
+        """Start and end frequencies per row and gains per room for the next block"""
+        targets = self._targets(frames)
+        target_freqs = np.array([f for target in targets for f in target[0]])
+        target_gains = np.array([target[1] for target in targets])
+        start_freqs, start_gains = self.freqs, self.gains
+
+        glide_frames = self.glide_seconds * self.sample_rate
+        keep = np.exp(-frames / glide_frames) if glide_frames > 0 else 0.0
+        end_freqs = target_freqs + (start_freqs - target_freqs) * keep
+        end_gains = target_gains + (start_gains - target_gains) * keep
+        end_freqs = np.where(np.abs(end_freqs - target_freqs) <= self.tolerance, target_freqs, end_freqs)
+        end_gains = np.where(np.abs(end_gains - target_gains) <= self.tolerance, target_gains, end_gains)
+        # Session rooms glide along their schedule, block by block, without extra smoothing
+        end_freqs = np.where(self._smoothed_rows, end_freqs, target_freqs)
+        end_gains = np.where(self._smoothed, end_gains, target_gains)
+        for player in self.players:
+            if player is not None:
+                player.position += frames
+
+        self.freqs, self.gains = end_freqs, end_gains
+        return start_freqs, end_freqs, start_gains, end_gains
+
+    def render(self, frames):
+        """Render the next `frames` of every device; returns (total channels, frames) scratch
+
+        Device i occupies rows offsets[i]:offsets[i + 1]. The array is
+        reused by the next call.
+        """
+        if frames > self.max_frames:
+            self._allocate(frames)
+        rows = 2 * len(self.rooms)
+        mixed = self._mixed[:self.offsets[-1] * frames].reshape(self.offsets[-1], frames)
+        if not rows:
+            mixed.fill(0.0)
+            return mixed
+        f0, f1, g0, g1 = self._advance(frames)
+
+        shape = (rows, frames)
+        phase = self._phase[:rows * frames].reshape(shape)
+        wave = self._wave[:rows * frames].reshape(shape)
+        ramp = self._ramp[:, :frames]
+        np.multiply(ramp, (f0 / self.sample_rate).reshape(rows, 1), out=phase)
+        glide = f1 != f0
+        if glide.any():
+            scratch = self._scratch[:rows * frames].reshape(shape)
+            np.multiply(self._ramp_sq[:, :frames],
+                        ((f1 - f0) / (2 * frames * self.sample_rate)).reshape(rows, 1), out=scratch)
+            np.add(phase, scratch, out=phase)
+        np.add(phase, self.phase, out=phase)
+        np.floor(phase, out=wave)
+        np.subtract(phase, wave, out=phase)
+        audio_engine.sine_into(phase, wave, self.mode, self.table, self._upper, self._index)
+
+        if np.array_equal(g0, g1):
+            # Steady gains: fold them into the routing matrix
+            np.multiply(self._route, np.repeat(g1, 2), out=self._scaled_route)
+            np.matmul(self._scaled_route, wave, out=mixed)
+        else:
+            gains = self._scratch[:rows * frames].reshape(shape)
+            np.multiply(ramp, np.repeat((g1 - g0) / frames, 2).reshape(rows, 1), out=gains)
+            np.add(gains, np.repeat(g0, 2).reshape(rows, 1), out=gains)
+            np.multiply(wave, gains, out=wave)
+            np.matmul(self._route, wave, out=mixed)
+
+        # Carry the wrapped phases into the next block
+        self.phase += ((f0 * frames + (f1 - f0) * (frames - 1) / 2) / self.sample_rate).reshape(rows, 1)
+        np.floor(self.phase, out=self._wrap[:rows])
+        self.phase -= self._wrap[:rows]
+        return mixed
+
+    def render_into(self, outs):
+        """Render the next block into one (frames, channels) array per device, in layout order"""
+        mixed = self.render(len(outs[0]))
+        for out, start, stop in zip(outs, self.offsets, self.offsets[1:]):
+            np.copyto(out, mixed[start:stop].T, casting='same_kind')
+
+
+class RoomRouter:
+    """Plays one RoomBank per device on its own output stream, fed by a single producer thread
+
+    The producer renders each device's rooms into that device's BlockRing
+    whenever it has a free slot, independently of the other devices, so
+    clock drift between devices never starves the faster one. Each
+    device's callback only copies frames out of its ring, as
+    PlaybackEngine's does. Parameter
+    changes are heard after the blocks already queued, i.e. within
+    settings.lookahead blocks. Errors raised while opening or running the
+    streams are passed to `on_error` from the producer thread.
+    """
+
+    def __init__(self, rooms, settings=None, mode=audio_engine.SYNTH_EXACT, device_channels=None,
+                 stream_factory=None, on_error=None):
+        self.rooms = list(rooms)
+        self.settings = settings or playback.StreamSettings(blocksize=512)
+        if self.settings.lookahead < 2:
+            raise ValueError("Routing needs a lookahead of at least 2 blocks")
+        if self.settings.dtype != 'float32':
+            raise ValueError("Routing plays float32 streams only")
+        self.mode = mode
+        self.layout = device_layout(self.rooms, device_channels)
+        self.stream_factory = stream_factory
+        self.on_error = on_error
+        self.banks = []
+        self.rings = []
+        self.streams = []
+        self.xruns = []
+        self.thread = None
+        self.changed = threading.Event()
+        self._stop = threading.Event()
+
+    @property
+    def playing(self):
+        """True while the producer thread is running"""
+        return self.thread is not None and self.thread.is_alive() and not self._stop.is_set()
+
+    def start(self):
+        """Build the banks and rings and open every device's stream on a new thread"""
+        if self.playing:
+            return
+        settings = self.settings
+        frames = settings.render_frames()
+        self.banks = [RoomBank([room for room in self.rooms if room.device == device],
+                               [(device, channels)], settings.sample_rate, self.mode,
+                               max_frames=frames)
+                      for device, channels in self.layout]
+        self.rings = [audio_engine.BlockRing(settings.lookahead, frames, channels)
+                      for _, channels in self.layout]
+        self.xruns = [0] * len(self.layout)
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(self._stop,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Ask the producer to close the streams; returns without waiting"""
+        self._stop.set()
+        self.changed.set()
+
+    def join(self, timeout=None):
+        """Wait for the streams to close"""
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def underruns(self):
+        """Callbacks per device that found the ring empty"""
+        return [ring.underruns for ring in self.rings]
+
+    def describe(self):
+        """One line per device with its rooms"""
+        lines = []
+        for device, channels in self.layout:
+            names = ', '.join(room.name for room in self.rooms if room.device == device)
+            lines.append(f"{device or 'default'} ({channels} ch): {names}")
+        return lines
+
+    def _run(self, stop):
+        """Open every stream, then keep all rings topped up until `stop` is set"""
+        try:
+            factory = self.stream_factory or playback.load_sounddevice().OutputStream
+            self._produce()  # pre-fill before the first callbacks
+            with contextlib.ExitStack() as streams:
+                self.streams = []
+                for index, (device, channels) in enumerate(self.layout):
+                    kwargs = dict(self.settings.stream_kwargs(), channels=channels, device=device)
+                    stream = streams.enter_context(factory(callback=self._make_callback(index),
+                                                           **kwargs))
+                    self.streams.append(stream)
+                # Callbacks never signal (Event.set() takes a lock on the audio
+                # thread), so poll every half block; stop() still wakes this at once
+                timeout = self.rings[0].frames / self.settings.sample_rate / 2
+                while not stop.is_set():
+                    self.changed.wait(timeout)
+                    self.changed.clear()
+                    self._produce()
+            self.streams = []
+        except Exception as e:
+            self.streams = []
+            stop.set()
+            if self.on_error is not None:
+                self.on_error(e)
+
+    def _produce(self):
+        """Fill every free slot of every device's ring"""
+        for bank, ring in zip(self.banks, self.rings):
+            while ring.space():
+                bank.render_into([ring.writable()])
+                ring.commit()
+
+    def _make_callback(self, index):
+        """Audio callback for device `index`: copy the next frames out of its ring"""
+        ring = self.rings[index]
+        xruns = self.xruns
+
+        def callback(outdata, frames, time_info, status):
+            if status.output_underflow:
+                xruns[index] += 1
+            ring.read_into(outdata)
+        return callback
+
+
+def load_rooms(path):
+    """Read a rooms file; returns (rooms, settings dict, device channel counts)"""
+    with open(path) as f:
+        data = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    rooms = []
+    for number, entry in enumerate(data.get('rooms', []), 1):
+        try:
+            rooms.append(Room.from_dict(entry, base_dir))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"{path}: room {number}: {e}") from None
+    if not rooms:
+        raise ValueError(f"{path}: no rooms")
+    settings = {key: data[key] for key in ('sample_rate', 'blocksize', 'latency', 'lookahead')
+                if key in data}
+    return rooms, settings, data.get('devices', {})
+
+
+def parse_args(argv=None):
+    """Parse command line options for multi-room playback"""
+    parser = argparse.ArgumentParser(description='Play independent binaural rooms on output channel pairs')
+    parser.add_argument('rooms', help='rooms file (JSON)')
+    parser.add_argument('--sink', choices=('device', 'null', 'file'), default='device',
+                        help='play on the devices, discard the audio, or write one WAV per device '
+                             '(default: device)')
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help='directory for --sink file output (default: current directory)')
+    parser.add_argument('--seconds', type=float, default=None,
+                        help='stop after this long (default: run until interrupted)')
+    parser.add_argument('--sample-rate', type=int, default=None, help='override the rooms file')
+    parser.add_argument('--blocksize', type=int, default=None, help='override the rooms file')
+    parser.add_argument('--lookahead', type=int, default=None,
+                        help='blocks rendered ahead per device (default: 4)')
+    parser.add_argument('--synthesis', choices=(audio_engine.SYNTH_EXACT, audio_engine.SYNTH_TABLE),
+                        default=audio_engine.SYNTH_EXACT, help='synthesis backend (default: exact)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        rooms, config, device_channels = load_rooms(args.rooms)
+        for key in ('sample_rate', 'blocksize', 'lookahead'):
+            if getattr(args, key) is not None:
+                config[key] = getattr(args, key)
+        config.setdefault('blocksize', 512)
+        settings = playback.StreamSettings(**config)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    factory = None
+    if args.sink == 'null':
+        factory = audio_engine.NullOutputStream
+    elif args.sink == 'file':
+        os.makedirs(args.output_dir, exist_ok=True)
+
+        def factory(device=None, **kwargs):
+            name = str(device or 'default').replace(os.sep, '_')
+            return audio_engine.FileOutputStream(os.path.join(args.output_dir, f'{name}.wav'),
+                                                 device=device, **kwargs)
+
+    errors = []
+    try:
+        router = RoomRouter(rooms, settings, args.synthesis, device_channels, factory, errors.append)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    for line in router.describe():
+        print(line)
+    for room in rooms:
+        print(f"  {room.describe()}")
+
+    router.start()
+    deadline = None if args.seconds is None else time.monotonic() + args.seconds
+    try:
+        while router.playing and (deadline is None or time.monotonic() < deadline):
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        pass
+    router.stop()
+    router.join()
+    if errors:
+        print(f"error: {errors[0]}", file=sys.stderr)
+        return 1
+    for (device, _), underruns, xruns in zip(router.layout, router.underruns(), router.xruns):
+        print(f"{device or 'default'}: {underruns} underruns, {xruns} xruns")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
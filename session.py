@@ -0,0 +1,259 @@
+"""Session schedules: sequences of held and ramped binaural beats.
+
+A session is a list of segments played back to back, e.g. 10 minutes at a
+10 Hz beat, a 5 minute ramp down to 4 Hz, then 30 minutes holding 4 Hz:
+
+    {"name": "Theta descent",
+     "segments": [
+        {"duration": 10, "carrier": 200, "beat": 10},
+        {"duration": 5, "carrier": 200, "beat": 10, "end_beat": 4, "curve": "exponential"},
+        {"duration": 30, "carrier": 200, "beat": 4}
+     ]}
+
+Durations are in minutes and volumes 0-100, as in render_cli job files.
+A segment gives either left/right frequencies or a carrier (left ear) and
+a beat (right = carrier + beat); the end_* values default to the start
+values, so a segment without them holds steady. The curve shapes the
+ramp: linear, exponential (equal frequency ratios per unit time) or
+smooth (eased in and out).
+
+SessionPlayer renders a session block by block through a SineOscillator,
+integrating the instantaneous frequency into phase, so memory does not
+depend on the session length and held segments cost the same as a
+constant tone.
+"""
+import bisect
+import hashlib
+import json
+
+import numpy as np
+
+import audio_engine
+
+CURVE_LINEAR = 'linear'
+CURVE_EXPONENTIAL = 'exponential'
+CURVE_SMOOTH = 'smooth'
+CURVES = (CURVE_LINEAR, CURVE_EXPONENTIAL, CURVE_SMOOTH)
+
+# Curved ramps are rendered as linear pieces: CURVE_PIECES per segment, but
+# never longer than CURVE_STEP_FRAMES unless that would exceed CURVE_PIECES.
+# Either way each piece deviates from the curve by far less than 0.01%.
+CURVE_PIECES = 1024
+CURVE_STEP_FRAMES = 1024
+
+
+class Segment:
+    """One stretch of a session: start and end frequencies, volume and curve"""
+
+    def __init__(self, duration, left=None, right=None, end_left=None, end_right=None,
+                 volume=30.0, end_volume=None, curve=CURVE_LINEAR,
+                 carrier=None, beat=None, end_carrier=None, end_beat=None):
+        if carrier is not None or beat is not None:
+            carrier = float(carrier if carrier is not None else left)
+            beat = float(beat or 0.0)
+            end_carrier = float(end_carrier if end_carrier is not None else carrier)
+            end_beat = float(end_beat if end_beat is not None else beat)
+            left, right = carrier, carrier + beat
+            end_left, end_right = end_carrier, end_carrier + end_beat
+        if left is None or right is None:
+            raise ValueError("Segment needs left/right frequencies or a carrier and beat")
+
+        self.duration = float(duration)
+        self.left = float(left)
+        self.right = float(right)
+        self.end_left = float(end_left if end_left is not None else left)
+        self.end_right = float(end_right if end_right is not None else right)
+        self.volume = float(volume)
+        self.end_volume = float(end_volume if end_volume is not None else volume)
+        self.curve = str(curve).lower()
+        self.validate()
+
+    def validate(self):
+        """Raise ValueError for out-of-range parameters"""
+        if self.duration <= 0:
+            raise ValueError(f"Duration must be positive, got {self.duration:g} minutes")
+        if min(self.left, self.right, self.end_left, self.end_right) < 0:
+            raise ValueError("Frequencies must not be negative")
+        if not (0 <= self.volume <= 100 and 0 <= self.end_volume <= 100):
+            raise ValueError("Volume must be between 0 and 100")
+        if self.curve not in CURVES:
+            raise ValueError(f"Unknown curve '{self.curve}' (expected one of {', '.join(CURVES)})")
+
+    def is_constant(self):
+        """True when the segment holds one frequency pair and volume"""
+        return (self.left == self.end_left and self.right == self.end_right and
+                self.volume == self.end_volume)
+
+    def values_at(self, fraction):
+        """((left, right), gain) at `fraction` (0-1) of the way through the segment"""
+        if self.curve == CURVE_SMOOTH:
+            fraction = fraction * fraction * (3 - 2 * fraction)
+
+        freqs = []
+        for start, end in ((self.left, self.end_left), (self.right, self.end_right)):
+            if self.curve == CURVE_EXPONENTIAL and start > 0 and end > 0 and start != end:
+                freqs.append(start * (end / start) ** fraction)
+            else:
+                freqs.append(start + (end - start) * fraction)
+        gain = (self.volume + (self.end_volume - self.volume) * fraction) / 100.0
+        return tuple(freqs), gain
+
+    def to_dict(self):
+        """Plain dict in left/right form, as stored in session files"""
+        return {'duration': self.duration, 'left': self.left, 'right': self.right,
+                'end_left': self.end_left, 'end_right': self.end_right,
+                'volume': self.volume, 'end_volume': self.end_volume, 'curve': self.curve}
+
+
+class Session:
+    """Named list of segments played back to back"""
+
+    def __init__(self, segments, name='Session'):
+        if not segments:
+            raise ValueError("A session needs at least one segment")
+        self.segments = list(segments)
+        self.name = name
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a session from a parsed session file (a dict or a bare segment list)"""
+        if isinstance(data, list):
+            data = {'segments': data}
+        segments = []
+        for number, row in enumerate(data.get('segments', []), 1):
+            try:
+                segments.append(Segment(**row))
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"segment {number}: {e}") from None
+        return cls(segments, name=data.get('name', 'Session'))
+
+    def to_dict(self):
+        """Plain dict as stored in session files"""
+        return {'name': self.name, 'segments': [segment.to_dict() for segment in self.segments]}
+
+    def duration(self):
+        """Total length in minutes"""
+        return sum(segment.duration for segment in self.segments)
+
+    def segment_frames(self, sample_rate):
+        """Frame count of every segment, rounded so the total matches total_frames()"""
+        bounds = [0]
+        elapsed = 0.0
+        for segment in self.segments:
+            elapsed += segment.duration
+            bounds.append(int(sample_rate * (elapsed * 60)))
+        return [stop - start for start, stop in zip(bounds, bounds[1:])]
+
+    def total_frames(self, sample_rate):
+        """Number of frames in a full render"""
+        return sum(self.segment_frames(sample_rate))
+
+    def digest(self):
+        """Stable hash of the schedule, for render cache keys"""
+        encoded = json.dumps(self.to_dict()['segments'], sort_keys=True).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def describe(self):
+        """Short summary for status displays"""
+        minutes = self.duration()
+        count = len(self.segments)
+        return f"{self.name}: {count} segment{'s' if count != 1 else ''}, {minutes:g} min"
+
+
+def load_session(path):
+    """Read a JSON session file"""
+    with open(path) as f:
+        data = json.load(f)
+    try:
+        return Session.from_dict(data)
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}") from None
+
+
+class SessionPlayer:
+    """Renders a session through a SineOscillator, one block at a time
+
+    The same player drives live playback (small callback blocks) and
+    exports (large blocks). Past the end of the session the final values
+    are held, so a live stream never runs dry.
+    """
+
+    def __init__(self, session, oscillator, sample_rate=None):
+        self.session = session
+        self.oscillator = oscillator  # None when only values_at() is needed
+        self.sample_rate = sample_rate or oscillator.sample_rate
+        self.position = 0
+        frames = session.segment_frames(self.sample_rate)
+        self._frames = frames
+        self._starts = [0]
+        for count in frames:
+            self._starts.append(self._starts[-1] + count)
+
+    @property
+    def total_frames(self):
+        """Length of the session in frames"""
+        return self._starts[-1]
+
+    def finished(self):
+        """True once the whole session has been rendered"""
+        return self.position >= self.total_frames
+
+    def save_state(self):
+        """Position and oscillator state, for restore_state()"""
+        return self.position, self.oscillator.save_state()
+
+    def restore_state(self, state):
+        """Rewind to a save_state() snapshot"""
+        self.position, oscillator_state = state
+        self.oscillator.restore_state(oscillator_state)
+
+    def values_at(self, frame):
+        """((left, right), gain) at an absolute frame of the session"""
+        index = min(bisect.bisect_right(self._starts, frame) - 1, len(self._frames) - 1)
+        count = self._frames[index]
+        fraction = (frame - self._starts[index]) / count if count else 1.0
+        return self.session.segments[index].values_at(min(fraction, 1.0))
+
+    def render_into(self, out):
+        """Render the next len(out) frames into `out` in place and advance"""
+        frames = len(out)
+        done = 0
+        while done < frames:
+            position = self.position
+            index = bisect.bisect_right(self._starts, position) - 1
+            if index >= len(self._frames):
+                # After the end: hold the final values
+                freqs, gain = self.session.segments[-1].values_at(1.0)
+                self.oscillator.render_into(out[done:], freqs, gain)
+                self.position += frames - done
+                return
+
+            segment = self.session.segments[index]
+            span = min(frames - done, self._starts[index + 1] - position)
+            if segment.is_constant():
+                freqs, gain = segment.values_at(0.0)
+                self.oscillator.render_into(out[done:done + span], freqs, gain)
+            else:
+                count = self._frames[index]
+                if segment.curve != CURVE_LINEAR:
+                    span = min(span, max(CURVE_STEP_FRAMES, count // CURVE_PIECES))
+                # Per-sample linear glide between the values at both ends of the span
+                offset = position - self._starts[index]
+                start_freqs, start_gain = segment.values_at(offset / count)
+                freqs, gain = segment.values_at((offset + span) / count)
+                self.oscillator.render_into(out[done:done + span], freqs, gain,
+                                            start_freqs, start_gain)
+            done += span
+            self.position += span
+
+
+def iter_session_blocks(session, sample_rate=44100, block_frames=audio_engine.EXPORT_BLOCK_FRAMES,
+                        mode=audio_engine.SYNTH_EXACT):
+    """Yield float32 stereo blocks of a whole session"""
+    oscillator = audio_engine.SineOscillator(2, sample_rate, mode, max_frames=block_frames)
+    player = SessionPlayer(session, oscillator)
+    total_frames = player.total_frames
+    for start in range(0, total_frames, block_frames):
+        block = np.empty((min(block_frames, total_frames - start), 2), dtype=np.float32)
+        player.render_into(block)
+        yield block
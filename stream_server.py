@@ -0,0 +1,516 @@
+"""Headless streaming server: binaural beats over HTTP and WebSocket.
+
+Serves live 16-bit PCM to any number of listeners on the local network,
+without a display or an audio device:
+
+    python stream_server.py --port 8765
+    ffplay "http://localhost:8765/stream?left=200&right=210&volume=30"
+
+Endpoints:
+  /stream?left=&right=&volume=   endless WAV over HTTP (volume 0-100)
+  /ws?left=&right=&volume=       WebSocket: binary frames of raw s16le
+                                 stereo PCM; send a JSON text message such
+                                 as {"left": 200, "right": 206} to retune
+  /status                        JSON summary of streams and listeners
+
+Every distinct (left, right, volume) is rendered once per block by a
+SineOscillator, like an export, and fanned out to all of its listeners as
+the same bytes object. A single clock task renders every stream in turn,
+so the cost is per distinct parameter set rather than per connection.
+
+Each listener has a bounded queue of blocks in front of its socket. When a
+slow client lets the queue fill, the oldest block is dropped, so it skips
+ahead instead of falling further behind; after --max-drops drops in a row
+it is disconnected.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import socket
+import struct
+import sys
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+import audio_engine
+
+BLOCK_FRAMES = 2048      # frames per rendered block (~46 ms at 44.1 kHz)
+QUEUE_BLOCKS = 8         # blocks buffered per listener before dropping
+MAX_DROPS = 32           # consecutive dropped blocks before a listener is disconnected
+MAX_LISTENERS = 4096
+MAX_REQUEST_BYTES = 16384
+REQUEST_TIMEOUT = 10.0   # seconds a new connection gets to send its request headers
+SEND_BUFFER_BYTES = 65536  # kernel send buffer per listener, so a slow client backs up into its queue
+
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WS_TEXT, WS_BINARY, WS_CLOSE, WS_PING, WS_PONG = 0x1, 0x2, 0x8, 0x9, 0xA
+
+
+def parse_params(values, current=None, sample_rate=None):
+    """(left, right, volume 0-1) from query or JSON values, falling back to `current`
+
+    Frequencies must be finite, non-negative and, given a `sample_rate`,
+    no higher than its Nyquist frequency.
+    """
+    left, right, volume = current or (856.0, 856.0, 0.3)
+
+    def value(name, default):
+        raw = values.get(name, default)
+        if isinstance(raw, list):  # parse_qs values
+            raw = raw[-1]
+        return float(raw)
+
+    left = value('left', left)
+    right = value('right', right)
+    volume = value('volume', volume * 100) / 100
+    if not all(math.isfinite(v) for v in (left, right, volume)):
+        raise ValueError("Frequencies and volume must be finite numbers")
+    if left < 0 or right < 0:
+        raise ValueError("Frequencies must not be negative")
+    if sample_rate is not None and max(left, right) > sample_rate / 2:
+        raise ValueError(f"Frequencies must not exceed {sample_rate / 2:g} Hz (half the sample rate)")
+    if not 0 <= volume <= 1:
+        raise ValueError("Volume must be between 0 and 100")
+    return left, right, volume
+
+
+def ws_frame(payload, opcode=WS_BINARY):
+    """One unmasked server-to-client WebSocket frame"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def ws_read(reader):
+    """Read one client frame; returns (opcode, payload)"""
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack('!H', await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack('!Q', await reader.readexactly(8))
+    if length > MAX_REQUEST_BYTES:
+        raise ValueError("WebSocket message too large")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+
+class Listener:
+    """One connected client: a bounded block queue drained into its socket"""
+
+    def __init__(self, writer, websocket=False, queue_blocks=QUEUE_BLOCKS, max_drops=MAX_DROPS):
+        self.writer = writer
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=queue_blocks)
+        self.max_drops = max_drops
+        self.stream = None
+        self.sent = 0      # blocks written to the socket
+        self.dropped = 0   # blocks skipped because the client was too slow
+        self._drops_in_row = 0
+        self.closed = False
+        self.too_slow = False  # disconnected for falling behind
+
+    def offer(self, data):
+        """Queue a block without waiting; drops the oldest queued block if the queue is full"""
+        if self.closed:
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            self._drops_in_row += 1
+            if self._drops_in_row > self.max_drops:
+                # Unblocks a writer stuck in drain() on a client that stopped reading
+                self.writer.transport.abort()
+                self.too_slow = True
+                self.close()
+                return
+        else:
+            self._drops_in_row = 0
+        self.queue.put_nowait(data)
+
+    def close(self):
+        """Stop sending; the writer task ends once it sees the marker"""
+        if self.closed:
+            return
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def run(self):
+        """Write queued blocks until closed or the client goes away"""
+        while True:
+            data = await self.queue.get()
+            if data is None:
+                return
+            self.writer.write(ws_frame(data) if self.websocket else data)
+            await self.writer.drain()  # back-pressure: wait while the socket buffer is full
+            self.sent += 1
+
+
+class SharedStream:
+    """One parameter set, rendered once per block for all of its listeners"""
+
+    def __init__(self, params, sample_rate, block_frames, mode=audio_engine.SYNTH_EXACT):
+        self.params = params
+        self.oscillator = audio_engine.SineOscillator(2, sample_rate, mode, max_frames=block_frames)
+        self.quantizer = audio_engine.Quantizer(channels=2, max_frames=block_frames)
+        self.block = np.empty((block_frames, 2), dtype=np.float32)
+        self.listeners = set()
+        self.frames = 0
+
+    def render(self):
+        """Next block as little-endian 16-bit PCM bytes"""
+        left, right, volume = self.params
+        self.oscillator.render_into(self.block, (left, right), volume)
+        data = bytes(self.quantizer.pcm(self.block, self.frames))
+        self.frames += len(self.block)
+        return data
+
+
+class StreamHub:
+    """Shared streams keyed by parameters, and the clock that renders them"""
+
+    def __init__(self, sample_rate=44100, block_frames=BLOCK_FRAMES, mode=audio_engine.SYNTH_EXACT,
+                 log=None):
+        self.sample_rate = sample_rate
+        self.block_frames = block_frames
+        self.mode = mode
+        self.log = log
+        self.streams = {}
+        self.ticks = 0
+        self.late_ticks = 0   # ticks that started after their deadline
+        self.render_seconds = 0.0
+        self.dropped_blocks = 0  # by listeners that have since left
+        self.too_slow = 0        # listeners disconnected for falling behind
+        self.failed_streams = 0  # streams whose render raised; their listeners were closed
+
+    def listeners(self):
+        """Every connected listener"""
+        return [listener for stream in self.streams.values() for listener in stream.listeners]
+
+    def subscribe(self, listener, params):
+        """Attach `listener` to the stream for `params`, creating it if needed"""
+        self.unsubscribe(listener)
+        stream = self.streams.get(params)
+        if stream is None:
+            stream = SharedStream(params, self.sample_rate, self.block_frames, self.mode)
+            self.streams[params] = stream
+        stream.listeners.add(listener)
+        listener.stream = stream
+
+    def unsubscribe(self, listener):
+        """Detach `listener`; streams without listeners stop rendering"""
+        stream = listener.stream
+        if stream is None:
+            return
+        stream.listeners.discard(listener)
+        listener.stream = None
+        # A failed stream is already gone, and may have been replaced since
+        if not stream.listeners and self.streams.get(stream.params) is stream:
+            del self.streams[stream.params]
+
+    async def run(self):
+        """Render one block per stream every block period, paced against the loop clock"""
+        loop = asyncio.get_running_loop()
+        period = self.block_frames / self.sample_rate
+        start = loop.time()
+        tick = 0
+        while True:
+            started = time.perf_counter()
+            for stream in list(self.streams.values()):
+                try:
+                    data = stream.render()
+                except Exception as e:
+                    self.fail(stream, e)
+                    continue
+                for listener in list(stream.listeners):
+                    listener.offer(data)
+            self.render_seconds += time.perf_counter() - started
+            self.ticks += 1
+
+            tick += 1
+            delay = start + tick * period - loop.time()
+            if delay < 0:
+                self.late_ticks += 1
+                if delay < -QUEUE_BLOCKS * period:
+                    # Too far behind to catch up: skip ahead rather than burst
+                    start, tick = loop.time(), 0
+                    delay = 0
+            await asyncio.sleep(max(delay, 0))
+
+    def fail(self, stream, error):
+        """Drop a stream whose render raised and close its listeners; the others keep playing"""
+        del self.streams[stream.params]
+        self.failed_streams += 1
+        if self.log:
+            left, right, volume = stream.params
+            self.log(f"! {left:g}/{right:g} Hz stream failed and was closed: {error!r}")
+        for listener in list(stream.listeners):
+            listener.close()
+
+    def close(self):
+        """Disconnect every listener, for shutdown"""
+        for listener in self.listeners():
+            listener.writer.transport.abort()
+            listener.close()
+
+    def status(self):
+        """Summary for /status"""
+        listeners = self.listeners()
+        return {
+            'sample_rate': self.sample_rate,
+            'block_frames': self.block_frames,
+            'streams': len(self.streams),
+            'listeners': len(listeners),
+            'ticks': self.ticks,
+            'late_ticks': self.late_ticks,
+            'render_seconds': self.render_seconds,
+            'dropped_blocks': self.dropped_blocks + sum(listener.dropped for listener in listeners),
+            'too_slow': self.too_slow,
+            'failed_streams': self.failed_streams,
+            'by_stream': [{'left': s.params[0], 'right': s.params[1], 'volume': s.params[2] * 100,
+                           'listeners': len(s.listeners)} for s in self.streams.values()],
+        }
+
+
+class StreamServer:
+    """asyncio HTTP/WebSocket front end for a StreamHub"""
+
+    def __init__(self, hub, queue_blocks=QUEUE_BLOCKS, max_drops=MAX_DROPS,
+                 max_listeners=MAX_LISTENERS, log=None, request_timeout=REQUEST_TIMEOUT):
+        self.hub = hub
+        self.queue_blocks = queue_blocks
+        self.max_drops = max_drops
+        self.max_listeners = max_listeners
+        self.log = log
+        self.request_timeout = request_timeout
+        self.connections = 0
+        self.pending = 0   # connections still sending their request headers
+
+    async def handle(self, reader, writer):
+        """Serve one connection"""
+        # Connections that have not sent a request yet are not listeners, so
+        # bound them separately and give each only request_timeout to finish
+        if self.pending >= self.max_listeners:
+            writer.close()
+            return
+        self.pending += 1
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.request_timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError):
+            writer.close()
+            return
+        finally:
+            self.pending -= 1
+
+        lines = request.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            await self.respond(writer, 400, 'Bad Request')
+            return
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            if name:
+                headers[name.strip().lower()] = value.strip()
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+
+        if method != 'GET':
+            await self.respond(writer, 405, 'Method Not Allowed')
+        elif url.path == '/status':
+            await self.respond(writer, 200, json.dumps(self.hub.status(), indent=2),
+                               'application/json')
+        elif url.path in ('/stream', '/ws'):
+            try:
+                params = parse_params(query, sample_rate=self.hub.sample_rate)
+            except ValueError as e:
+                await self.respond(writer, 400, str(e))
+                return
+            if len(self.hub.listeners()) >= self.max_listeners:
+                await self.respond(writer, 503, 'Too many listeners')
+            elif url.path == '/ws':
+                await self.serve_websocket(reader, writer, headers, params)
+            else:
+                await self.serve_http(writer, params)
+        else:
+            await self.respond(writer, 404, 'Not Found')
+
+    async def respond(self, writer, code, body, content_type='text/plain'):
+        """Send a complete response and close"""
+        data = body.encode()
+        writer.write(f'HTTP/1.1 {code} {body if code >= 400 else "OK"}\r\n'
+                     f'Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\n'
+                     f'Connection: close\r\n\r\n'.encode() + data)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def serve_http(self, writer, params):
+        """Endless WAV: a header with unknown length, then PCM blocks as they are rendered"""
+        hub = self.hub
+        header = audio_engine.wav_header(0, hub.sample_rate)
+        # Streaming convention: maximal RIFF and data sizes for a stream of unknown length
+        header = header[:4] + b'\xff\xff\xff\xff' + header[8:-4] + b'\xff\xff\xff\xff'
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: audio/wav\r\n'
+                     b'Cache-Control: no-cache\r\nConnection: close\r\n\r\n' + header)
+        listener = Listener(writer, queue_blocks=self.queue_blocks, max_drops=self.max_drops)
+        await self.serve_listener(listener, params)
+
+    async def serve_websocket(self, reader, writer, headers, params):
+        """WebSocket upgrade, then PCM frames out and retune messages in"""
+        key = headers.get('sec-websocket-key')
+        if headers.get('upgrade', '').lower() != 'websocket' or not key:
+            await self.respond(writer, 400, 'Expected a WebSocket upgrade')
+            return
+        accept = base64.b64encode(hashlib.sha1(key.encode() + WEBSOCKET_GUID).digest()).decode()
+        writer.write(f'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n'
+                     f'Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n'.encode())
+        listener = Listener(writer, websocket=True, queue_blocks=self.queue_blocks,
+                            max_drops=self.max_drops)
+        messages = asyncio.ensure_future(self.read_messages(reader, writer, listener))
+        try:
+            await self.serve_listener(listener, params)
+        finally:
+            messages.cancel()
+
+    async def read_messages(self, reader, writer, listener):
+        """Handle retune, ping and close frames from a WebSocket client"""
+        try:
+            while not listener.closed:
+                opcode, payload = await ws_read(reader)
+                if opcode == WS_CLOSE:
+                    break
+                if opcode == WS_PING:
+                    writer.write(ws_frame(payload, WS_PONG))
+                elif opcode == WS_TEXT:
+                    try:
+                        params = parse_params(json.loads(payload), listener.stream.params,
+                                              self.hub.sample_rate)
+                    except (ValueError, TypeError, AttributeError) as e:
+                        writer.write(ws_frame(json.dumps({'error': str(e)}).encode(), WS_TEXT))
+                        continue
+                    self.hub.subscribe(listener, params)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        listener.close()
+
+    async def serve_listener(self, listener, params):
+        """Subscribe, stream until the client leaves, then clean up"""
+        sock = listener.writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER_BYTES)
+        self.hub.subscribe(listener, params)
+        self.connections += 1
+        if self.log:
+            self.log(f"+ {params[0]:g}/{params[1]:g} Hz ({len(self.hub.listeners())} listening)")
+        try:
+            await listener.run()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            listener.close()
+            self.hub.unsubscribe(listener)
+            self.hub.dropped_blocks += listener.dropped
+            self.hub.too_slow += listener.too_slow
+            listener.writer.close()
+            if self.log:
+                self.log(f"- {params[0]:g}/{params[1]:g} Hz ({len(self.hub.listeners())} listening, "
+                         f"{listener.dropped} blocks dropped)")
+
+
+async def serve(host='127.0.0.1', port=8765, sample_rate=44100, block_frames=BLOCK_FRAMES,
+                queue_blocks=QUEUE_BLOCKS, max_drops=MAX_DROPS, max_listeners=MAX_LISTENERS,
+                mode=audio_engine.SYNTH_EXACT, log=None, ready=None, request_timeout=REQUEST_TIMEOUT):
+    """Run the server until cancelled; `ready` (a callable) gets the bound port"""
+    hub = StreamHub(sample_rate, block_frames, mode, log)
+    server = StreamServer(hub, queue_blocks, max_drops, max_listeners, log, request_timeout)
+    listening = await asyncio.start_server(server.handle, host, port, backlog=1024,
+                                           limit=MAX_REQUEST_BYTES)
+    clock = asyncio.ensure_future(hub.run())
+
+    def clock_done(task):
+        # Nothing awaits the clock, so an error that stops it would otherwise go unseen
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Stream clock stopped: {task.exception()!r}", file=sys.stderr, flush=True)
+    clock.add_done_callback(clock_done)
+    bound = listening.sockets[0].getsockname()[1]
+    if ready:
+        ready(bound)
+    try:
+        async with listening:
+            await listening.serve_forever()
+    finally:
+        clock.cancel()
+        hub.close()
+        await asyncio.sleep(0.1)  # let the connection handlers finish
+
+
+def parse_args(argv=None):
+    """Parse command line options for the streaming server"""
+    parser = argparse.ArgumentParser(description='Stream binaural beats over HTTP and WebSocket')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='address to listen on; 0.0.0.0 for the whole LAN (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='port (default: 8765, 0 for any)')
+    parser.add_argument('--sample-rate', type=int, default=44100,
+                        help='sample rate in Hz (default: 44100)')
+    parser.add_argument('--block-frames', type=int, default=BLOCK_FRAMES,
+                        help=f'frames per rendered block (default: {BLOCK_FRAMES})')
+    parser.add_argument('--queue-blocks', type=int, default=QUEUE_BLOCKS,
+                        help=f'blocks buffered per listener before dropping (default: {QUEUE_BLOCKS})')
+    parser.add_argument('--max-drops', type=int, default=MAX_DROPS,
+                        help=f'consecutive drops before a slow listener is disconnected '
+                             f'(default: {MAX_DROPS})')
+    parser.add_argument('--max-listeners', type=int, default=MAX_LISTENERS,
+                        help=f'connections to accept at once (default: {MAX_LISTENERS})')
+    parser.add_argument('--request-timeout', type=float, default=REQUEST_TIMEOUT,
+                        help=f'seconds a client gets to send its request before it is disconnected '
+                             f'(default: {REQUEST_TIMEOUT:g})')
+    parser.add_argument('--synthesis', choices=(audio_engine.SYNTH_EXACT, audio_engine.SYNTH_TABLE),
+                        default=audio_engine.SYNTH_EXACT,
+                        help='synthesis backend (default: exact)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not log connections')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    def log(message):
+        print(f"{time.strftime('%H:%M:%S')} {message}", flush=True)
+
+    def ready(port):
+        print(f"Streaming on http://{args.host}:{port}/stream?left=200&right=210&volume=30",
+              flush=True)
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.sample_rate, args.block_frames,
+                          args.queue_blocks, args.max_drops, args.max_listeners,
+                          args.synthesis, log=None if args.quiet else log, ready=ready,
+                          request_timeout=args.request_timeout))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,29 +1,81 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import numpy as np
-import sounddevice as sd
-import wave
 import threading
-import subprocess
-import os
+import time
+import argparse
+
+# numpy, sounddevice and the export modules are imported on first use, so
+# the window appears without waiting for them
+import playback
+
+# Live scope canvas under the beat display: envelope on top, spectrum below
+SCOPE_WIDTH = 280
+SCOPE_HEIGHT = 120
+SCOPE_ENVELOPE_HEIGHT = 72
+
+# Size limits offered for the export cache (More Options > Export Audio)
+CACHE_SIZES = {'256 MB': 256 * 1024 ** 2, '1 GB': 1024 ** 3, '2 GB': 2 * 1024 ** 3}
 
 class ModernBinauralGenerator:
-    def __init__(self, root):
+    def __init__(self, root, stream_settings=None, instrument=False):
         self.root = root
         self.root.title("Binaural Wave Generator")
         self.root.geometry("1200x800")
         self.root.minsize(1000, 700)
         
         # Audio parameters
-        self.sample_rate = 44100
+        self.stream_settings = stream_settings or playback.StreamSettings()
+        self.sample_rate = self.stream_settings.sample_rate
         self.is_playing = False
-        self.audio_position = 0
+        self.engine = playback.PlaybackEngine(self.stream_settings, on_error=self.on_playback_error)
+        
+        # Background export state
+        self.export_thread = None
+        self.export_cancel = None
+        self.export_result = None
+        
+        # Cache of finished exports, so repeating an export is a file copy
+        # (off unless ticked; opened on the first cached export, False if it could not be opened)
+        self.render_cache = None
+        self.cache_exports_var = tk.BooleanVar(value=False)
+        self.cache_size_var = tk.StringVar(value='1 GB')
         
         # Frequency variables - Default to ADHD preset (856 Hz)
         self.left_freq_var = tk.DoubleVar(value=856)
         self.right_freq_var = tk.DoubleVar(value=856)
         self.volume_var = tk.DoubleVar(value=30)  # 0-100 scale
         self.export_duration_var = tk.IntVar(value=10)
+        self.export_bits_var = tk.StringVar(value='16')
+        self.export_dither_var = tk.StringVar(value='none')
+        self.synthesis_mode_var = tk.StringVar(value=playback.SYNTH_EXACT)
+        
+        # Loaded session schedule; while set it replaces the slider frequencies
+        self.session = None
+        
+        # Snapshot read by the audio callback instead of the Tk variables
+        self.engine.params.set_frequencies(self.left_freq_var.get(), self.right_freq_var.get())
+        self.engine.params.set_volume(self.volume_var.get() / 100.0)
+        
+        # Optional callback/export timing (engine.instrumentation is None when disabled)
+        if instrument:
+            self.enable_instrumentation()
+        self.stats_window = None
+        
+        # Pending root.after() ids of the polling loops, so a restart replaces them
+        self.stream_stats_after = None
+        self.stats_panel_after = None
+        
+        # Live scope under the beat display, fed from engine.tap while playing
+        self.scope_var = tk.BooleanVar(value=True)
+        self.scope_analyzer = None
+        
+        # Stream settings variables (More Options > Audio Output)
+        self.sample_rate_var = tk.IntVar(value=self.stream_settings.sample_rate)
+        self.blocksize_var = tk.IntVar(value=self.stream_settings.blocksize)
+        self.latency_var = tk.StringVar(value=str(self.stream_settings.latency))
+        self.dtype_var = tk.StringVar(value=self.stream_settings.dtype)
+        self.lookahead_var = tk.IntVar(value=self.stream_settings.lookahead)
+        self.device_var = tk.StringVar(value=str(self.stream_settings.device or 'Default'))
         
         # Configure dark theme colors
         self.colors = {
@@ -234,6 +286,36 @@ Made with ❤️ for better focus and concentration"""
                                 fg=self.colors['text_secondary'])
         beat_hz_label.pack(side='left', padx=(8, 0), anchor='s', pady=(0, 10))
         
+        # Beat envelope and spectrum (items are created once and moved each frame)
+        self.scope_canvas = tk.Canvas(container, width=SCOPE_WIDTH, height=SCOPE_HEIGHT,
+                                      bg=self.colors['bg_tertiary'],
+                                      highlightthickness=0)
+        self.scope_canvas.pack(pady=(0, 4))
+        scope_mid = SCOPE_ENVELOPE_HEIGHT // 2
+        self.scope_canvas.create_line(0, SCOPE_ENVELOPE_HEIGHT, SCOPE_WIDTH, SCOPE_ENVELOPE_HEIGHT,
+                                      fill=self.colors['border_color'])
+        self.scope_upper = self.scope_canvas.create_line(0, scope_mid, SCOPE_WIDTH, scope_mid,
+                                                         fill=self.colors['accent_primary'])
+        self.scope_lower = self.scope_canvas.create_line(0, scope_mid, SCOPE_WIDTH, scope_mid,
+                                                         fill=self.colors['accent_primary'])
+        self.scope_spectrum = self.scope_canvas.create_line(0, SCOPE_HEIGHT - 1,
+                                                            SCOPE_WIDTH, SCOPE_HEIGHT - 1,
+                                                            fill=self.colors['accent_secondary'])
+        self.scope_peak = self.scope_canvas.create_text(SCOPE_WIDTH - 6, SCOPE_ENVELOPE_HEIGHT + 4,
+                                                        text='', anchor='ne',
+                                                        font=('Segoe UI', 8),
+                                                        fill=self.colors['text_secondary'])
+        
+        scope_toggle = tk.Checkbutton(container, text='Live scope',
+                                      variable=self.scope_var,
+                                      font=('Segoe UI', 9),
+                                      bg=self.colors['bg_secondary'],
+                                      fg=self.colors['text_secondary'],
+                                      selectcolor=self.colors['bg_tertiary'],
+                                      activebackground=self.colors['bg_secondary'],
+                                      command=self.toggle_scope)
+        scope_toggle.pack(pady=(0, 15))
+        
         increase_btn = tk.Button(adjust_frame, text='+0.1',
                                 font=('Segoe UI', 12, 'bold'),
                                 bg=self.colors['bg_tertiary'],
@@ -367,6 +449,106 @@ Made with ❤️ for better focus and concentration"""
             btn.grid(row=row, column=col, padx=5, pady=5, sticky='ew')
             presets_grid.columnconfigure(col, weight=1)
         
+        # Synthesis backend
+        synthesis_label = tk.Label(inner_options, text='SYNTHESIS',
+                                  font=('Segoe UI', 9, 'bold'),
+                                  bg=self.colors['bg_secondary'],
+                                  fg=self.colors['text_secondary'])
+        synthesis_label.pack(anchor='w', pady=(0, 10))
+        
+        synthesis_frame = tk.Frame(inner_options, bg=self.colors['bg_secondary'])
+        synthesis_frame.pack(fill='x', pady=(0, 20))
+        
+        for text, mode in (('Exact (np.sin)', playback.SYNTH_EXACT),
+                           ('Fast (sine table)', playback.SYNTH_TABLE)):
+            radio = tk.Radiobutton(synthesis_frame, text=text,
+                                   variable=self.synthesis_mode_var,
+                                   value=mode,
+                                   font=('Segoe UI', 10),
+                                   bg=self.colors['bg_secondary'],
+                                   fg=self.colors['text_primary'],
+                                   selectcolor=self.colors['bg_tertiary'],
+                                   activebackground=self.colors['bg_secondary'],
+                                   activeforeground=self.colors['accent_primary'],
+                                   command=self.update_synthesis_mode)
+            radio.pack(side='left', padx=(0, 15))
+        
+        # Session schedule
+        session_label = tk.Label(inner_options, text='SESSION',
+                               font=('Segoe UI', 9, 'bold'),
+                               bg=self.colors['bg_secondary'],
+                               fg=self.colors['text_secondary'])
+        session_label.pack(anchor='w', pady=(0, 10))
+        
+        session_frame = tk.Frame(inner_options, bg=self.colors['bg_secondary'])
+        session_frame.pack(fill='x', pady=(0, 20))
+        
+        for text, command in (('Load Session...', self.load_session),
+                              ('Clear', self.clear_session)):
+            btn = tk.Button(session_frame, text=text,
+                          font=('Segoe UI', 10),
+                          bg=self.colors['bg_tertiary'],
+                          fg=self.colors['text_primary'],
+                          activebackground=self.colors['accent_primary'],
+                          activeforeground=self.colors['bg_primary'],
+                          relief='flat', bd=0,
+                          padx=15, pady=6,
+                          cursor='hand2',
+                          command=command)
+            btn.pack(side='left', padx=(0, 10))
+        
+        self.session_label = tk.Label(session_frame, text='No session loaded',
+                                    font=('Segoe UI', 10),
+                                    bg=self.colors['bg_secondary'],
+                                    fg=self.colors['text_secondary'])
+        self.session_label.pack(side='left', padx=(5, 0))
+        
+        # Audio Output settings
+        output_label = tk.Label(inner_options, text='AUDIO OUTPUT',
+                              font=('Segoe UI', 9, 'bold'),
+                              bg=self.colors['bg_secondary'],
+                              fg=self.colors['text_secondary'])
+        output_label.pack(anchor='w', pady=(0, 10))
+        
+        output_frame = tk.Frame(inner_options, bg=self.colors['bg_secondary'])
+        output_frame.pack(fill='x', pady=(0, 20))
+        
+        latencies = list(playback.StreamSettings.LATENCIES)
+        if self.latency_var.get() not in latencies:
+            latencies.append(self.latency_var.get())
+        
+        output_options = [
+            ('Sample rate', self.sample_rate_var, playback.StreamSettings.SAMPLE_RATES),
+            ('Block size', self.blocksize_var, playback.StreamSettings.BLOCK_SIZES),
+            ('Latency', self.latency_var, latencies),
+            ('Format', self.dtype_var, playback.StreamSettings.DTYPES),
+            ('Lookahead', self.lookahead_var, playback.StreamSettings.LOOKAHEADS),
+            ('Device', self.device_var, [self.device_var.get()]),
+        ]
+        
+        for col, (text, var, values) in enumerate(output_options):
+            option_label = tk.Label(output_frame, text=text,
+                                  font=('Segoe UI', 9),
+                                  bg=self.colors['bg_secondary'],
+                                  fg=self.colors['text_secondary'])
+            option_label.grid(row=0, column=col, sticky='w', padx=(0, 10))
+            
+            option_menu = tk.OptionMenu(output_frame, var, *values,
+                                        command=lambda v: self.apply_stream_settings())
+            option_menu.config(font=('Segoe UI', 9),
+                               bg=self.colors['bg_tertiary'],
+                               fg=self.colors['text_primary'],
+                               activebackground=self.colors['accent_primary'],
+                               activeforeground=self.colors['bg_primary'],
+                               highlightthickness=0,
+                               relief='flat', bd=0)
+            option_menu.grid(row=1, column=col, sticky='ew', padx=(0, 10))
+            output_frame.columnconfigure(col, weight=1)
+        
+        # Querying devices loads PortAudio, so the list is filled on first open
+        self.device_menu = option_menu
+        self.devices_listed = False
+        
         # Export Audio
         export_label = tk.Label(inner_options, text='EXPORT AUDIO',
                               font=('Segoe UI', 9, 'bold'),
@@ -393,6 +575,38 @@ Made with ❤️ for better focus and concentration"""
                                 fg=self.colors['text_secondary'])
         duration_label.pack(side='left', padx=(0, 15))
         
+        bits_menu = tk.OptionMenu(export_frame, self.export_bits_var, '16', '24', '32', '32 float')
+        bits_menu.config(font=('Segoe UI', 9),
+                         bg=self.colors['bg_tertiary'],
+                         fg=self.colors['text_primary'],
+                         activebackground=self.colors['accent_primary'],
+                         activeforeground=self.colors['bg_primary'],
+                         highlightthickness=0,
+                         relief='flat', bd=0)
+        bits_menu.pack(side='left', padx=(0, 5))
+        
+        bits_label = tk.Label(export_frame, text='bit WAV',
+                            font=('Segoe UI', 10),
+                            bg=self.colors['bg_secondary'],
+                            fg=self.colors['text_secondary'])
+        bits_label.pack(side='left', padx=(0, 15))
+        
+        dither_menu = tk.OptionMenu(export_frame, self.export_dither_var, 'none', 'tpdf', 'shaped')
+        dither_menu.config(font=('Segoe UI', 9),
+                           bg=self.colors['bg_tertiary'],
+                           fg=self.colors['text_primary'],
+                           activebackground=self.colors['accent_primary'],
+                           activeforeground=self.colors['bg_primary'],
+                           highlightthickness=0,
+                           relief='flat', bd=0)
+        dither_menu.pack(side='left', padx=(0, 5))
+        
+        dither_label = tk.Label(export_frame, text='dither',
+                              font=('Segoe UI', 10),
+                              bg=self.colors['bg_secondary'],
+                              fg=self.colors['text_secondary'])
+        dither_label.pack(side='left', padx=(0, 15))
+        
         export_wav_btn = tk.Button(export_frame, text='Export WAV',
                                   font=('Segoe UI', 10, 'bold'),
                                   bg=self.colors['accent_primary'],
@@ -415,6 +629,34 @@ Made with ❤️ for better focus and concentration"""
                                   command=self.export_mp3)
         export_mp3_btn.pack(side='left', padx=5)
         
+        cache_frame = tk.Frame(inner_options, bg=self.colors['bg_secondary'])
+        cache_frame.pack(fill='x', pady=(10, 0))
+        
+        cache_check = tk.Checkbutton(cache_frame, text='Cache exports so repeating one is a file copy',
+                                     variable=self.cache_exports_var,
+                                     font=('Segoe UI', 10),
+                                     bg=self.colors['bg_secondary'],
+                                     fg=self.colors['text_primary'],
+                                     selectcolor=self.colors['bg_tertiary'],
+                                     activebackground=self.colors['bg_secondary'])
+        cache_check.pack(side='left', padx=(0, 15))
+        
+        cache_size_menu = tk.OptionMenu(cache_frame, self.cache_size_var, *CACHE_SIZES)
+        cache_size_menu.config(font=('Segoe UI', 9),
+                               bg=self.colors['bg_tertiary'],
+                               fg=self.colors['text_primary'],
+                               activebackground=self.colors['accent_primary'],
+                               activeforeground=self.colors['bg_primary'],
+                               highlightthickness=0,
+                               relief='flat', bd=0)
+        cache_size_menu.pack(side='left', padx=(0, 5))
+        
+        cache_size_label = tk.Label(cache_frame, text='at most',
+                                    font=('Segoe UI', 10),
+                                    bg=self.colors['bg_secondary'],
+                                    fg=self.colors['text_secondary'])
+        cache_size_label.pack(side='left')
+        
     def create_status_bar(self, parent):
         """Create status bar at bottom"""
         status_frame = tk.Frame(parent, bg=self.colors['bg_secondary'],
@@ -438,14 +680,61 @@ Made with ❤️ for better focus and concentration"""
                                    fg=self.colors['text_secondary'])
         self.status_text.pack(side='left')
         
+        # Live stream statistics (latency, callback CPU load, xruns)
+        self.stream_stats_label = tk.Label(status_inner, text='',
+                                           font=('Segoe UI', 9),
+                                           bg=self.colors['bg_secondary'],
+                                           fg=self.colors['text_secondary'])
+        self.stream_stats_label.pack(side='left', padx=(20, 0))
+        
+        # Render cache hit/miss statistics
+        self.cache_label = tk.Label(status_inner, text='',
+                                    font=('Segoe UI', 9),
+                                    bg=self.colors['bg_secondary'],
+                                    fg=self.colors['text_secondary'])
+        self.cache_label.pack(side='left', padx=(20, 0))
+        
+        stats_btn = tk.Button(status_inner, text='Stats',
+                              font=('Segoe UI', 9),
+                              bg=self.colors['bg_tertiary'],
+                              fg=self.colors['text_primary'],
+                              activebackground=self.colors['accent_primary'],
+                              relief='flat', bd=0,
+                              padx=10, pady=2,
+                              cursor='hand2',
+                              command=self.show_stats)
+        stats_btn.pack(side='left', padx=(20, 0))
+        
+        # Export progress (shown only while an export is running)
+        self.export_frame = tk.Frame(status_inner, bg=self.colors['bg_secondary'])
+        
+        self.export_label = tk.Label(self.export_frame, text='',
+                                     font=('Segoe UI', 9),
+                                     bg=self.colors['bg_secondary'],
+                                     fg='#fdcb6e')
+        self.export_label.pack(side='left', padx=(0, 10))
+        
+        self.export_progress = ttk.Progressbar(self.export_frame, orient='horizontal',
+                                               length=200, mode='determinate', maximum=100)
+        self.export_progress.pack(side='left', padx=(0, 10))
+        
+        cancel_btn = tk.Button(self.export_frame, text='Cancel',
+                               font=('Segoe UI', 9),
+                               bg=self.colors['bg_tertiary'],
+                               fg=self.colors['text_primary'],
+                               activebackground='#d63031',
+                               relief='flat', bd=0,
+                               padx=10, pady=2,
+                               cursor='hand2',
+                               command=self.cancel_export)
+        cancel_btn.pack(side='left')
+        
     def update_freq_display(self):
         """Update frequency displays and beat"""
         self.left_freq_label.config(text=str(int(self.left_freq_var.get())))
         self.right_freq_label.config(text=str(int(self.right_freq_var.get())))
         self.update_beat_display()
-        
-        if self.is_playing:
-            self.update_audio_frequencies()
+        self.update_audio_frequencies()
         
     def update_beat_display(self):
         """Update binaural beat display"""
@@ -463,8 +752,180 @@ Made with ❤️ for better focus and concentration"""
         """Update volume label"""
         vol = int(self.volume_var.get())
         self.volume_value_label.config(text=f'{vol}%')
+        self.update_audio_volume()
+        
+    def update_synthesis_mode(self):
+        """Switch the oscillator between exact and table synthesis"""
+        self.engine.set_mode(self.synthesis_mode_var.get())
+        
+    def populate_device_menu(self):
+        """Fill the Device menu with the stereo output devices (once)"""
+        if self.devices_listed:
+            return
+        self.devices_listed = True
+        
+        menu = self.device_menu['menu']
+        menu.delete(0, 'end')
+        names = ['Default'] + playback.list_output_devices()
+        if self.device_var.get() not in names:
+            names.append(self.device_var.get())
+        for name in names:
+            menu.add_command(label=name,
+                             command=lambda v=name: (self.device_var.set(v),
+                                                     self.apply_stream_settings()))
+        
+    def apply_stream_settings(self):
+        """Rebuild stream settings from the Audio Output panel, restarting playback if needed"""
+        device = self.device_var.get()
+        if device == 'Default':
+            device = None
+        elif device.isdigit():
+            device = int(device)
+        
+        try:
+            settings = playback.StreamSettings(sample_rate=self.sample_rate_var.get(),
+                                               blocksize=self.blocksize_var.get(),
+                                               latency=self.latency_var.get(),
+                                               dtype=self.dtype_var.get(),
+                                               device=device,
+                                               lookahead=self.lookahead_var.get())
+        except ValueError as e:
+            messagebox.showerror("Audio Output", str(e))
+            return
+        
+        self.stream_settings = settings
+        self.sample_rate = settings.sample_rate
+        self.engine.settings = settings
+        
         if self.is_playing:
-            self.update_audio_volume()
+            self.stop_audio()
+            self.root.after(200, self.play_audio)
+        
+    def update_stream_stats(self):
+        """Refresh latency / CPU load / xrun readout while playing"""
+        self.stream_stats_after = None
+        if not self.is_playing:
+            self.stream_stats_label.config(text='')
+            return
+        
+        engine = self.engine
+        if engine.stream is not None:
+            self.stream_stats_label.config(
+                text=f'{self.stream_settings.describe()}  •  '
+                     f'Latency {engine.output_latency * 1000:.1f} ms  •  '
+                     f'CPU {engine.cpu_load() * 100:.1f}%  •  '
+                     f'Xruns {engine.xrun_count}  •  '
+                     f'Underruns {engine.underruns()}')
+        
+        self.stream_stats_after = self.root.after(500, self.update_stream_stats)
+        
+    def cancel_stream_stats(self):
+        """Drop the pending stream stats refresh, if any"""
+        if self.stream_stats_after is not None:
+            self.root.after_cancel(self.stream_stats_after)
+            self.stream_stats_after = None
+        
+    def show_stats(self):
+        """Open (or raise) the live performance stats panel"""
+        if self.stats_window is not None and self.stats_window.winfo_exists():
+            self.stats_window.lift()
+            return
+        
+        window = tk.Toplevel(self.root)
+        window.title("Performance Stats")
+        window.configure(bg=self.colors['bg_secondary'])
+        self.stats_window = window
+        
+        self.stats_enabled_var = tk.BooleanVar(value=self.engine.instrumentation is not None)
+        enabled = tk.Checkbutton(window, text='Record callback and export timings',
+                                 variable=self.stats_enabled_var,
+                                 font=('Segoe UI', 10),
+                                 bg=self.colors['bg_secondary'],
+                                 fg=self.colors['text_primary'],
+                                 selectcolor=self.colors['bg_tertiary'],
+                                 activebackground=self.colors['bg_secondary'],
+                                 command=self.toggle_instrumentation)
+        enabled.pack(anchor='w', padx=20, pady=(15, 10))
+        
+        self.stats_text = tk.Label(window, text='', justify='left',
+                                   font=('Consolas', 9),
+                                   bg=self.colors['bg_secondary'],
+                                   fg=self.colors['text_primary'])
+        self.stats_text.pack(anchor='w', padx=20)
+        
+        buttons = tk.Frame(window, bg=self.colors['bg_secondary'])
+        buttons.pack(fill='x', padx=20, pady=15)
+        for text, command in (('Dump JSON...', self.dump_stats),
+                              ('Reset', self.reset_stats)):
+            btn = tk.Button(buttons, text=text,
+                            font=('Segoe UI', 9),
+                            bg=self.colors['bg_tertiary'],
+                            fg=self.colors['text_primary'],
+                            activebackground=self.colors['accent_primary'],
+                            relief='flat', bd=0,
+                            padx=10, pady=4,
+                            cursor='hand2',
+                            command=command)
+            btn.pack(side='left', padx=(0, 10))
+        
+        # A panel closed and reopened within one refresh still has its loop pending
+        if self.stats_panel_after is not None:
+            self.root.after_cancel(self.stats_panel_after)
+        self.update_stats_panel()
+        
+    def enable_instrumentation(self):
+        """Start recording into fresh buffers (the audio callback picks this up on its next block)"""
+        import instrumentation
+        self.engine.instrumentation = instrumentation.Instrumentation()
+        
+    def toggle_instrumentation(self):
+        """Start or stop recording timings"""
+        if self.stats_enabled_var.get():
+            if self.engine.instrumentation is None:
+                self.enable_instrumentation()
+        else:
+            self.engine.instrumentation = None
+        
+    def reset_stats(self):
+        """Discard everything recorded so far"""
+        if self.engine.instrumentation is not None:
+            self.enable_instrumentation()
+        
+    def dump_stats(self):
+        """Save the recorded timings as JSON"""
+        if self.engine.instrumentation is None:
+            messagebox.showinfo("Stats", "Recording is off, so there is nothing to save.")
+            return
+        filename = filedialog.asksaveasfilename(
+            defaultextension='.json',
+            filetypes=[("JSON files", "*.json"), ("All files", "*.*")],
+            initialfile=f"binaural_stats_{time.strftime('%Y%m%d_%H%M%S')}.json")
+        if not filename:
+            return
+        try:
+            self.engine.instrumentation.dump_json(filename)
+        except OSError as e:
+            messagebox.showerror("Stats", f"Could not save stats:\n{e}")
+        
+    def update_stats_panel(self):
+        """Refresh the stats panel twice a second while it is open"""
+        self.stats_panel_after = None
+        if self.stats_window is None or not self.stats_window.winfo_exists():
+            self.stats_window = None
+            return
+        
+        recorder = self.engine.instrumentation
+        if recorder is None:
+            text = 'Recording is off.'
+        else:
+            lines = [f'Playback  {recorder.describe()}']
+            for stage, values in recorder.export.summary().items():
+                lines.append(f'Export    {stage:<10} total {values["total_s"]:7.2f} s  '
+                             f'p50 {values["p50_us"] / 1000:7.2f} ms  '
+                             f'max {values["max_us"] / 1000:7.2f} ms')
+            text = '\n'.join(lines)
+        self.stats_text.config(text=text)
+        self.stats_panel_after = self.root.after(500, self.update_stats_panel)
         
     def toggle_more_options(self):
         """Toggle More Options section"""
@@ -474,6 +935,7 @@ Made with ❤️ for better focus and concentration"""
         else:
             self.options_content.pack(fill='x', before=self.more_options_frame, pady=(0, 20))
             self.more_options_btn.config(text='More Options ▲')
+            self.populate_device_menu()
         
     def apply_preset(self, left_freq, right_freq):
         """Apply frequency preset"""
@@ -481,6 +943,40 @@ Made with ❤️ for better focus and concentration"""
         self.right_freq_var.set(right_freq)
         self.update_freq_display()
         
+    def load_session(self):
+        """Load a session schedule to play and export instead of the sliders"""
+        filename = filedialog.askopenfilename(
+            filetypes=[("Session files", "*.json"), ("All files", "*.*")])
+        if not filename:
+            return
+        
+        import session
+        try:
+            loaded = session.load_session(filename)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Session Error", f"Could not load session:\n{e}")
+            return
+        
+        was_playing = self.is_playing
+        if was_playing:
+            self.stop_audio()
+        self.session = loaded
+        self.engine.session = loaded
+        self.session_label.config(text=loaded.describe(), fg=self.colors['accent_primary'])
+        if was_playing:
+            self.play_audio()
+        
+    def clear_session(self):
+        """Return to playing and exporting the slider frequencies"""
+        was_playing = self.is_playing
+        if was_playing:
+            self.stop_audio()
+        self.session = None
+        self.engine.session = None
+        self.session_label.config(text='No session loaded', fg=self.colors['text_secondary'])
+        if was_playing:
+            self.play_audio()
+        
     def toggle_playback(self):
         """Toggle play/stop"""
         if self.is_playing:
@@ -497,188 +993,371 @@ Made with ❤️ for better focus and concentration"""
         self.play_button.config(text='⏸', bg=self.colors['accent_primary'],
                                fg=self.colors['bg_primary'])
         self.status_indicator.config(fg=self.colors['accent_primary'])
-        self.status_text.config(text='Playing', fg=self.colors['accent_primary'])
-        
-        # Start audio thread
-        self.audio_thread = threading.Thread(target=self._playback_loop, daemon=True)
-        self.audio_thread.start()
+        self.status_text.config(text='Playing session' if self.session else 'Playing',
+                                fg=self.colors['accent_primary'])
         
-    def _playback_loop(self):
-        """Continuous audio playback loop"""
+        self.engine.set_mode(self.synthesis_mode_var.get())
+        if self.scope_var.get():
+            self.start_scope()
         try:
-            def audio_callback(outdata, frames, time_info, status):
-                if status:
-                    print(f'Status: {status}')
-                
-                left_freq = self.left_freq_var.get()
-                right_freq = self.right_freq_var.get()
-                volume = self.volume_var.get() / 100.0
-                
-                t = np.arange(frames) / self.sample_rate + self.audio_position
-                left_channel = volume * np.sin(2 * np.pi * left_freq * t)
-                right_channel = volume * np.sin(2 * np.pi * right_freq * t)
-                
-                self.audio_position += frames / self.sample_rate
-                
-                outdata[:, 0] = left_channel
-                outdata[:, 1] = right_channel
-            
-            self.audio_position = 0
-            
-            with sd.OutputStream(channels=2, 
-                                callback=audio_callback,
-                                samplerate=self.sample_rate,
-                                blocksize=2048):
-                while self.is_playing:
-                    sd.sleep(100)
-                
-        except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Playback Error", str(e)))
-            self.root.after(0, self.stop_audio)
+            self.engine.start()
+        except RuntimeError as e:
+            self.stop_audio()
+            messagebox.showerror("Playback Error", str(e))
+            return
+        self.cancel_stream_stats()
+        self.stream_stats_after = self.root.after(500, self.update_stream_stats)
+        
+    def start_scope(self):
+        """Attach a fresh tap to the engine and start redrawing the scope"""
+        import visualizer
+        tap = visualizer.ScopeTap(self.stream_settings.sample_rate)
+        self.scope_analyzer = visualizer.ScopeAnalyzer(tap, SCOPE_WIDTH, SCOPE_HEIGHT,
+                                                       scope_height=SCOPE_ENVELOPE_HEIGHT)
+        self.engine.tap = tap
+        self.root.after(1000 // visualizer.FRAME_RATE, self.update_scope, self.scope_analyzer)
+        
+    def stop_scope(self):
+        """Detach the tap and flatten the scope lines"""
+        self.engine.tap = None
+        self.scope_analyzer = None
+        scope_mid = SCOPE_ENVELOPE_HEIGHT // 2
+        for item in (self.scope_upper, self.scope_lower):
+            self.scope_canvas.coords(item, 0, scope_mid, SCOPE_WIDTH, scope_mid)
+        self.scope_canvas.coords(self.scope_spectrum, 0, SCOPE_HEIGHT - 1,
+                                 SCOPE_WIDTH, SCOPE_HEIGHT - 1)
+        self.scope_canvas.itemconfig(self.scope_peak, text='')
+        
+    def toggle_scope(self):
+        """Show or hide the live scope, also while playing"""
+        if not self.is_playing:
+            return
+        if self.scope_var.get():
+            if self.scope_analyzer is None:
+                self.start_scope()
+        else:
+            self.stop_scope()
+        
+    def update_scope(self, analyzer):
+        """Redraw the scope from the newest tapped samples at a fixed frame rate"""
+        # A restarted scope has a new analyzer, so this loop ends instead of doubling up
+        if analyzer is not self.scope_analyzer or not self.is_playing:
+            return
+        
+        import visualizer
+        started = time.perf_counter()
+        if analyzer.update():
+            self.scope_canvas.coords(self.scope_upper, analyzer.upper)
+            self.scope_canvas.coords(self.scope_lower, analyzer.lower)
+            self.scope_canvas.coords(self.scope_spectrum, analyzer.spectrum)
+            self.scope_canvas.itemconfig(self.scope_peak, text=f'peak {analyzer.peak_freq:.0f} Hz')
+        
+        # Keep to the frame rate by subtracting the time this frame took
+        elapsed_ms = int((time.perf_counter() - started) * 1000)
+        self.root.after(max(1, 1000 // visualizer.FRAME_RATE - elapsed_ms), self.update_scope,
+                        analyzer)
+        
+    def on_playback_error(self, error):
+        """Called from the stream thread when the output stream fails"""
+        self.root.after(0, lambda: messagebox.showerror("Playback Error", str(error)))
+        self.root.after(0, self.stop_audio)
             
     def stop_audio(self):
         """Stop audio playback"""
+        was_playing = self.is_playing
         self.is_playing = False
-        sd.stop()
+        self.engine.stop()
+        self.stop_scope()
+        self.cancel_stream_stats()
+        self.stream_stats_label.config(text='')
         
         self.play_button.config(text='▶', bg=self.colors['bg_tertiary'],
                                fg=self.colors['accent_primary'])
         self.status_indicator.config(fg=self.colors['text_secondary'])
-        self.status_text.config(text='Ready', fg=self.colors['text_secondary'])
+        # Keep the xrun count of the playback that just ended in view
+        xruns = self.engine.xrun_count
+        status = f'Ready (last playback: {xruns} xruns)' if was_playing and xruns else 'Ready'
+        self.status_text.config(text=status, fg=self.colors['text_secondary'])
         
     def update_audio_frequencies(self):
-        """Update frequencies during playback (audio regenerates automatically)"""
-        pass  # The callback handles this automatically
+        """Publish the slider frequencies to the audio callback"""
+        self.engine.params.set_frequencies(self.left_freq_var.get(), self.right_freq_var.get())
         
     def update_audio_volume(self):
-        """Update volume during playback (audio regenerates automatically)"""
-        pass  # The callback handles this automatically
+        """Publish the slider volume to the audio callback"""
+        self.engine.params.set_volume(self.volume_var.get() / 100.0)
         
     def generate_binaural_beat(self, duration_seconds):
         """Generate binaural beat audio for export"""
-        left_freq = self.left_freq_var.get()
-        right_freq = self.right_freq_var.get()
-        volume = self.volume_var.get() / 100.0
+        import numpy as np
+        return np.concatenate(list(self.iter_export_blocks(duration_seconds)))
+        
+    def iter_export_blocks(self, duration_seconds):
+        """Stream the current binaural beat (or loaded session) as fixed-size float32 blocks"""
+        import audio_engine
+        if self.session is not None:
+            import session
+            return session.iter_session_blocks(self.session, self.sample_rate,
+                                               mode=self.synthesis_mode_var.get())
+        return audio_engine.iter_binaural_blocks(self.left_freq_var.get(),
+                                                 self.right_freq_var.get(),
+                                                 self.volume_var.get() / 100.0,
+                                                 duration_seconds,
+                                                 sample_rate=self.sample_rate,
+                                                 mode=self.synthesis_mode_var.get())
         
-        t = np.linspace(0, duration_seconds, int(self.sample_rate * duration_seconds), False)
+    def export_wav(self):
+        """Export to WAV file"""
+        self.start_export('wav')
+            
+    def export_mp3(self):
+        """Export to MP3 file"""
+        self.start_export('mp3')
         
-        left_channel = volume * np.sin(2 * np.pi * left_freq * t)
-        right_channel = volume * np.sin(2 * np.pi * right_freq * t)
+    def start_export(self, fmt):
+        """Ask for a filename and render the export on a background thread"""
+        if self.export_thread is not None and self.export_thread.is_alive():
+            messagebox.showinfo("Export in progress",
+                                "Please wait for the current export to finish or cancel it.")
+            return
         
-        stereo_audio = np.column_stack((left_channel, right_channel))
+        filename = filedialog.asksaveasfilename(
+            defaultextension=f".{fmt}",
+            filetypes=[(f"{fmt.upper()} files", f"*.{fmt}"), ("All files", "*.*")],
+            initialfile=f"binaural_{int(self.left_freq_var.get())}-{int(self.right_freq_var.get())}.{fmt}"
+        )
         
-        return stereo_audio.astype(np.float32)
+        if not filename:
+            return
         
-    def export_wav(self):
-        """Export to WAV file"""
         try:
-            filename = filedialog.asksaveasfilename(
-                defaultextension=".wav",
-                filetypes=[("WAV files", "*.wav"), ("All files", "*.*")],
-                initialfile=f"binaural_{int(self.left_freq_var.get())}-{int(self.right_freq_var.get())}.wav"
-            )
-            
-            if not filename:
-                return
-                
-            self.status_text.config(text='Generating audio...', fg='#fdcb6e')
-            self.root.update()
-            
             duration_minutes = self.export_duration_var.get()
-            duration_seconds = duration_minutes * 60
-            
-            audio_data = self.generate_binaural_beat(duration_seconds)
-            audio_data_int = np.int16(audio_data * 32767)
-            
-            with wave.open(filename, 'w') as wav_file:
-                wav_file.setnchannels(2)
-                wav_file.setsampwidth(2)
-                wav_file.setframerate(self.sample_rate)
-                wav_file.writeframes(audio_data_int.tobytes())
-                
-            self.status_text.config(text='Export successful!', fg='#00b894')
-            messagebox.showinfo("Success", 
-                               f"WAV file saved successfully!\n\n"
-                               f"Duration: {duration_minutes} minutes\n"
-                               f"Left: {int(self.left_freq_var.get())} Hz\n"
-                               f"Right: {int(self.right_freq_var.get())} Hz\n"
-                               f"File: {filename}")
-            
-            self.root.after(3000, lambda: self.status_text.config(text='Ready',
-                                                                  fg=self.colors['text_secondary']))
-            
-        except Exception as e:
-            self.status_text.config(text='Export failed', fg='#d63031')
-            messagebox.showerror("Export Error", f"Failed to export WAV:\n{str(e)}")
-            
-    def export_mp3(self):
-        """Export to MP3 file"""
+        except tk.TclError:
+            messagebox.showerror("Export Error", "Please enter a valid duration in minutes.")
+            return
+        if self.session is not None:
+            duration_minutes = self.session.duration()
+        duration_seconds = duration_minutes * 60
+        total_frames = int(self.sample_rate * duration_seconds)
+        if self.session is not None:
+            total_frames = self.session.total_frames(self.sample_rate)
+        bits, _, sample_type = self.export_bits_var.get().partition(' ')
+        bits = int(bits)
+        floating = fmt == 'wav' and sample_type == 'float'
+        dither = self.export_dither_var.get()
+        
+        # Export dependencies load on the first export rather than at startup
+        import render_cache
+        cache = None
+        if self.cache_exports_var.get():
+            if self.render_cache is None:
+                try:
+                    self.render_cache = render_cache.RenderCache()
+                except OSError:
+                    self.render_cache = False
+            if self.render_cache:
+                cache = self.render_cache
+                cache.max_bytes = CACHE_SIZES[self.cache_size_var.get()]
+        
+        # Everything the worker needs is read from Tk here, on the main thread
+        self.export_info = {
+            'format': fmt,
+            'filename': filename,
+            'duration_minutes': duration_minutes,
+            'left': int(self.left_freq_var.get()),
+            'right': int(self.right_freq_var.get()),
+            'frames': total_frames,
+            'sampwidth': bits // 8,
+            'floating': floating,
+            'dither': dither,
+            'session': self.session.describe() if self.session else None,
+            'cache': cache,
+            'cache_key': render_cache.render_key(self.left_freq_var.get(),
+                                                 self.right_freq_var.get(),
+                                                 self.volume_var.get() / 100.0,
+                                                 self.sample_rate,
+                                                 total_frames,
+                                                 fmt,
+                                                 bits=bits,
+                                                 synthesis=self.synthesis_mode_var.get(),
+                                                 bitrate='192k',
+                                                 session=self.session.digest() if self.session else None,
+                                                 floating=floating,
+                                                 dither=dither),
+        }
+        blocks = self.iter_export_blocks(duration_seconds)
+        self.export_total_frames = max(1, total_frames)
+        self.export_frames_done = 0
+        self.export_result = None
+        self.export_cancel = threading.Event()
+        self.export_started = time.perf_counter()
+        
+        self.export_progress['value'] = 0
+        self.export_label.config(text='Exporting 0%')
+        self.export_frame.pack(side='left', padx=(20, 0))
+        
+        self.export_thread = threading.Thread(target=self._export_worker,
+                                              args=(fmt, filename, blocks, self.sample_rate),
+                                              daemon=True)
+        self.export_thread.start()
+        self.root.after(100, self.poll_export)
+        
+    def _export_worker(self, fmt, filename, blocks, sample_rate):
+        """Render and write an export off the Tk thread"""
+        def progress(frames_done):
+            self.export_frames_done = frames_done
+        
+        import audio_engine
+        cache = self.export_info['cache']
+        cache_key = self.export_info['cache_key']
+        recorder = self.engine.instrumentation
+        stats = recorder.export if recorder is not None else None
+        
         try:
-            filename = filedialog.asksaveasfilename(
-                defaultextension=".mp3",
-                filetypes=[("MP3 files", "*.mp3"), ("All files", "*.*")],
-                initialfile=f"binaural_{int(self.left_freq_var.get())}-{int(self.right_freq_var.get())}.mp3"
-            )
-            
-            if not filename:
+            if cache is not None and cache.fetch(cache_key, fmt, filename):
+                self.export_frames_done = self.export_total_frames
+                self.export_result = ('done', filename)
                 return
-                
-            self.status_text.config(text='Generating audio...', fg='#fdcb6e')
-            self.root.update()
-            
-            duration_minutes = self.export_duration_var.get()
-            duration_seconds = duration_minutes * 60
             
-            audio_data = self.generate_binaural_beat(duration_seconds)
-            audio_data_int = np.int16(audio_data * 32767)
-            
-            temp_wav = filename.replace('.mp3', '_temp.wav')
-            
-            with wave.open(temp_wav, 'w') as wav_file:
-                wav_file.setnchannels(2)
-                wav_file.setsampwidth(2)
-                wav_file.setframerate(self.sample_rate)
-                wav_file.writeframes(audio_data_int.tobytes())
-            
-            try:
-                cmd = ['ffmpeg', '-i', temp_wav, '-acodec', 'mp3', 
-                       '-ab', '192k', '-y', filename]
-                subprocess.run(cmd, check=True, capture_output=True)
-                os.remove(temp_wav)
-                
-                self.status_text.config(text='Export successful!', fg='#00b894')
-                messagebox.showinfo("Success", 
-                                   f"MP3 file saved successfully!\n\n"
-                                   f"Duration: {duration_minutes} minutes\n"
-                                   f"Left: {int(self.left_freq_var.get())} Hz\n"
-                                   f"Right: {int(self.right_freq_var.get())} Hz\n"
-                                   f"Bitrate: 192 kbps\n"
-                                   f"File: {filename}")
-                
-            except (subprocess.CalledProcessError, FileNotFoundError):
-                os.rename(temp_wav, filename.replace('.mp3', '.wav'))
-                self.status_text.config(text='Saved as WAV (ffmpeg not found)', fg='#fdcb6e')
-                messagebox.showinfo("Note", 
-                                   f"Audio saved as WAV format.\n\n"
-                                   f"(MP3 conversion requires ffmpeg)\n\n"
-                                   f"File: {filename.replace('.mp3', '.wav')}")
+            if fmt == 'mp3':
+                output = audio_engine.export_mp3(filename, blocks, sample_rate=sample_rate,
+                                                 progress=progress, cancel=self.export_cancel,
+                                                 stats=stats, dither=self.export_info['dither'])
+            else:
+                audio_engine.write_wav_blocks(filename, blocks, sample_rate=sample_rate,
+                                              progress=progress, cancel=self.export_cancel,
+                                              sampwidth=self.export_info['sampwidth'],
+                                              frames=self.export_info['frames'],
+                                              stats=stats,
+                                              floating=self.export_info['floating'],
+                                              dither=self.export_info['dither'])
+                output = filename
+        except audio_engine.ExportCancelled:
+            self.export_result = ('cancelled', None)
+            return
+        except Exception as e:
+            self.export_result = ('error', e)
+            return
+        
+        # Report success first: copying a large file into the cache can take a while
+        self.export_result = ('done', output)
+        if cache is not None and output == filename:
+            cache.store(cache_key, fmt, output)
+        
+    def cancel_export(self):
+        """Stop the running export; the worker removes partial files"""
+        if self.export_cancel is not None:
+            self.export_cancel.set()
+            self.export_label.config(text='Cancelling...')
+        
+    def poll_export(self):
+        """Update the progress bar and ETA until the export worker finishes"""
+        if self.export_result is None:
+            done = self.export_frames_done
+            fraction = done / self.export_total_frames
+            elapsed = time.perf_counter() - self.export_started
             
-            self.root.after(3000, lambda: self.status_text.config(text='Ready',
-                                                                  fg=self.colors['text_secondary']))
+            if self.export_cancel.is_set():
+                text = 'Cancelling...'
+            elif done >= self.export_total_frames:
+                text = 'Finishing...'
+            elif done and elapsed > 0.5:
+                remaining = (self.export_total_frames - done) / (done / elapsed)
+                text = f'Exporting {fraction:.0%}  •  ETA {int(remaining) // 60}:{int(remaining) % 60:02d}'
+            else:
+                text = f'Exporting {fraction:.0%}'
             
-        except Exception as e:
+            self.export_progress['value'] = fraction * 100
+            self.export_label.config(text=text)
+            self.root.after(100, self.poll_export)
+            return
+        
+        self.export_frame.pack_forget()
+        if self.render_cache:
+            self.cache_label.config(text=self.render_cache.describe())
+        self.finish_export(*self.export_result)
+        
+    def finish_export(self, outcome, result):
+        """Report the outcome of a background export"""
+        info = self.export_info
+        
+        if outcome == 'cancelled':
+            self.status_text.config(text='Export cancelled', fg='#fdcb6e')
+        elif outcome == 'error':
             self.status_text.config(text='Export failed', fg='#d63031')
-            messagebox.showerror("Export Error", f"Failed to export audio:\n{str(e)}")
+            messagebox.showerror("Export Error",
+                                 f"Failed to export {info['format'].upper()}:\n{str(result)}")
+        elif info['format'] == 'mp3' and result != info['filename']:
+            self.status_text.config(text='Saved as WAV (ffmpeg not found)', fg='#fdcb6e')
+            messagebox.showinfo("Note", 
+                               f"Audio saved as WAV format.\n\n"
+                               f"(MP3 conversion requires ffmpeg)\n\n"
+                               f"File: {result}")
+        else:
+            bitrate = "Bitrate: 192 kbps\n" if info['format'] == 'mp3' else ""
+            if info['session']:
+                detail = f"Session: {info['session']}\n"
+            else:
+                detail = (f"Duration: {info['duration_minutes']} minutes\n"
+                          f"Left: {info['left']} Hz\n"
+                          f"Right: {info['right']} Hz\n")
+            self.status_text.config(text='Export successful!', fg='#00b894')
+            messagebox.showinfo("Success", 
+                               f"{info['format'].upper()} file saved successfully!\n\n"
+                               f"{detail}"
+                               f"{bitrate}"
+                               f"File: {result}")
+        
+        self.root.after(3000, self.reset_status_text)
+        
+    def reset_status_text(self):
+        """Return the status text to Playing/Ready"""
+        if self.is_playing:
+            self.status_text.config(text='Playing', fg=self.colors['accent_primary'])
+        else:
+            self.status_text.config(text='Ready', fg=self.colors['text_secondary'])
             
     def on_closing(self):
         """Handle window closing"""
+        if self.export_thread is not None and self.export_thread.is_alive():
+            self.export_cancel.set()
+            self.export_thread.join(timeout=5.0)
         self.stop_audio()
         self.root.destroy()
 
-def main():
+def parse_args(argv=None):
+    """Parse command line options for the desktop app"""
+    parser = argparse.ArgumentParser(description='Binaural Wave Generator')
+    parser.add_argument('--sample-rate', type=int, default=44100,
+                        help='output sample rate in Hz (default: 44100)')
+    parser.add_argument('--blocksize', type=int, default=2048,
+                        help='frames per audio callback, 0 for automatic (default: 2048)')
+    parser.add_argument('--latency', default='high',
+                        help="'low', 'high' or a latency in seconds (default: high)")
+    parser.add_argument('--dtype', default='float32', choices=playback.StreamSettings.DTYPES,
+                        help='stream sample format (default: float32)')
+    parser.add_argument('--device', default=None,
+                        help='output device name or index (default: system default)')
+    parser.add_argument('--lookahead', type=int, default=4,
+                        help='blocks rendered ahead of the audio callback, 0 to render '
+                             'inside the callback (default: 4)')
+    parser.add_argument('--instrument', action='store_true',
+                        help='record callback and export timings from startup (see the Stats panel)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    device = int(args.device) if args.device and args.device.isdigit() else args.device
+    settings = playback.StreamSettings(sample_rate=args.sample_rate,
+                                       blocksize=args.blocksize,
+                                       latency=args.latency,
+                                       dtype=args.dtype,
+                                       device=device,
+                                       lookahead=args.lookahead)
+    
     print("Starting Binaural Wave Generator...")
     root = tk.Tk()
-    app = ModernBinauralGenerator(root)
+    app = ModernBinauralGenerator(root, settings, instrument=args.instrument)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
     
     # Ensure window is visible
@@ -0,0 +1,167 @@
+"""Oscilloscope and spectrum data for the desktop app, fed from a lock-free tap.
+
+The audio callback hands every block it plays to ScopeTap.write(), which
+keeps every `decimation`-th frame (as float, whatever the stream format)
+in a ring allocated up front. That is a strided copy of a few dozen
+frames per callback, with no allocation and no lock. The tap has a single
+writer (the audio callback) and a single reader (the GUI): the writer
+publishes a frame counter after each copy, and the reader copies the
+newest frames and then checks that the writer has not wrapped round onto
+them in the meantime, retrying if it has.
+
+ScopeAnalyzer runs on the GUI thread at the view's frame rate. It turns
+the newest samples into canvas coordinates: the envelope of the left and
+right channels summed, where the binaural beat shows up as a slow swell,
+and a Hann-windowed FFT magnitude on a log frequency axis. All of its
+buffers, the window and the column-to-bin mapping are built once.
+
+The samples are decimated without a low-pass filter, so content above the
+tap's Nyquist frequency folds back; at the default rate that is well above
+the 1000 Hz the sliders reach. benchmarks/bench_visualizer.py measures the
+tap and a 30 fps analyzer against playback without them at 256 frames.
+"""
+import numpy as np
+
+TAP_RATE = 8000         # rate the tap decimates to (nearest integer factor)
+TAP_SECONDS = 2.0       # history kept in the tap
+FRAME_RATE = 30         # GUI redraws per second
+SCOPE_SECONDS = 0.5     # time span of the envelope view
+FFT_SIZE = 4096         # spectrum window, in decimated frames
+MIN_FREQ = 20.0         # left edge of the spectrum
+MIN_DB = -90.0          # bottom of the spectrum
+
+
+def decimation_for(sample_rate, rate=TAP_RATE):
+    """Integer decimation factor taking `sample_rate` to about `rate`"""
+    return max(1, round(sample_rate / rate))
+
+
+class ScopeTap:
+    """Ring buffer of decimated output frames; one writer, one reader, no locks"""
+
+    def __init__(self, sample_rate, channels=2, decimation=None, seconds=TAP_SECONDS):
+        self.decimation = decimation or decimation_for(sample_rate)
+        self.rate = sample_rate / self.decimation
+        self.channels = channels
+        self.capacity = int(seconds * self.rate)
+        self.buffer = np.zeros((self.capacity, channels), dtype=np.float32)
+        self.written = 0    # decimated frames written since creation
+        self.max_write = 0  # most frames one write() has added
+        self.retries = 0    # reads repeated because the writer lapped them
+        self._offset = 0    # index of the next kept frame in the next block
+        self._dtype = None
+        self._scale = 1.0
+
+    def write(self, block):
+        """Keep every decimation-th frame of `block` (called from the audio callback)"""
+        frames = len(block)
+        start = self._offset
+        if start >= frames:
+            self._offset -= frames
+            return
+        if block.dtype != self._dtype:
+            self._dtype = block.dtype
+            self._scale = 1.0 / np.iinfo(block.dtype).max if block.dtype.kind == 'i' else 1.0
+        picked = block[start::self.decimation]
+        count = len(picked)
+        self._offset = start + count * self.decimation - frames
+
+        pos = self.written % self.capacity
+        first = min(count, self.capacity - pos)
+        np.multiply(picked[:first], self._scale, out=self.buffer[pos:pos + first])
+        if first < count:
+            np.multiply(picked[first:], self._scale, out=self.buffer[:count - first])
+        self.max_write = max(self.max_write, count)
+        self.written += count  # publish only after the frames are in place
+
+    def read_latest(self, out, attempts=3):
+        """Copy the newest len(out) frames into `out`, oldest first
+
+        Returns False when fewer frames have been written yet, or when the
+        writer kept overwriting them during every attempt.
+        """
+        frames = len(out)
+        for _ in range(attempts):
+            end = self.written
+            if end < frames:
+                return False
+            start = end - frames
+            pos = start % self.capacity
+            first = min(frames, self.capacity - pos)
+            out[:first] = self.buffer[pos:pos + first]
+            out[first:] = self.buffer[:frames - first]
+            # The next write may already be overwriting the slot after `written`
+            if self.written + self.max_write - start <= self.capacity:
+                return True
+            self.retries += 1
+        return False
+
+
+class ScopeAnalyzer:
+    """Envelope and spectrum coordinates for a scope canvas, from a ScopeTap
+
+    The envelope fills the top `scope_height` pixels and the spectrum the
+    rest of a `width` x `height` canvas. Call update() once per frame, then
+    read `upper`, `lower` and `spectrum` (flat x, y lists for canvas.coords)
+    and `peak_freq`.
+    """
+
+    def __init__(self, tap, width, height, scope_height=None, scope_seconds=SCOPE_SECONDS,
+                 fft_size=FFT_SIZE):
+        self.tap = tap
+        self.width = width
+        self.height = height
+        self.scope_height = scope_height or height // 2
+        self.fft_size = fft_size
+
+        # One read serves both views: the envelope uses the whole span, the FFT its end
+        self.scope_frames = int(scope_seconds * tap.rate) // width * width
+        self.samples = np.zeros((max(self.scope_frames, fft_size), tap.channels),
+                                dtype=np.float32)
+        self.mono = np.zeros(len(self.samples), dtype=np.float32)
+        self.window = np.hanning(fft_size).astype(np.float32)
+        self.windowed = np.zeros(fft_size, dtype=np.float32)
+        # Sine amplitude 1 peaks at fft_size/4 after the Hann window
+        self.spectrum_scale = 4.0 / fft_size
+
+        # Pixel columns of the spectrum on a log frequency axis, as FFT bin ranges
+        nyquist = tap.rate / 2
+        edges = np.geomspace(MIN_FREQ, nyquist, width + 1)[:-1]
+        bins = np.fft.rfftfreq(fft_size, 1.0 / tap.rate)
+        self.column_bins = np.minimum(np.searchsorted(bins, edges), len(bins) - 1)
+        self.bin_freqs = bins
+
+        self.x = np.arange(width, dtype=np.float64)
+        self.upper = self.lower = self.spectrum = None
+        self.peak_freq = 0.0
+
+    def update(self):
+        """Recompute every view from the newest samples; False if the tap has too few yet"""
+        if not self.tap.read_latest(self.samples):
+            return False
+        np.sum(self.samples, axis=1, out=self.mono)
+        self.mono *= 0.5
+
+        # Envelope: min and max of each column's span of samples
+        columns = self.mono[-self.scope_frames:].reshape(self.width, -1)
+        mid = self.scope_height / 2
+        self.upper = self._coords(mid - columns.max(axis=1) * mid)
+        self.lower = self._coords(mid - columns.min(axis=1) * mid)
+
+        # Spectrum: strongest bin in each column, in dB below full scale
+        np.multiply(self.mono[-self.fft_size:], self.window, out=self.windowed)
+        magnitude = np.abs(np.fft.rfft(self.windowed)) * self.spectrum_scale
+        self.peak_freq = float(self.bin_freqs[magnitude[1:].argmax() + 1])
+        db = 20 * np.log10(np.maximum(magnitude, 1e-9))
+        column_db = np.maximum.reduceat(db, self.column_bins)
+        level = np.clip(column_db / MIN_DB, 0.0, 1.0)
+        self.spectrum = self._coords(self.scope_height
+                                     + level * (self.height - self.scope_height - 1))
+        return True
+
+    def _coords(self, y):
+        """Flat [x0, y0, x1, y1, ...] list for canvas.coords"""
+        points = np.empty(2 * self.width)
+        points[0::2] = self.x
+        points[1::2] = y
+        return points.tolist()